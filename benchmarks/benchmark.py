@@ -0,0 +1,203 @@
+"""
+Benchmarks for ingestion, search and options lookup on a synthetic corpus.
+
+Results are printed (or written with --output) as JSON, so runs from different
+releases can be compared. Every query records the number of documents it
+matches as `total`; a query matching nothing only measures the lookup of a
+missing term, so the run then warns on stderr and exits with status 1.
+
+The text fields of both profiles go through `analyzer`, which indexes the gaps
+between words rather than the words, so the queries search the `keywords` and
+`tags` fields, that the lean profile indexes as keywords, and numeric ranges.
+They match nothing with the default profile.
+
+Usage:
+    python benchmarks/benchmark.py --scale 20000 --output benchmark.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+def timings(function, repeat: int) -> dict:
+    """Call `function` `repeat` times and summarize the latencies in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max_ms": samples[-1],
+    }
+
+
+def throughput(count: int, seconds: float) -> dict:
+    return {
+        "documents": count,
+        "seconds": seconds,
+        "docs_per_second": count / seconds if seconds else None,
+    }
+
+
+def run(scale: int, single: int, repeat: int, seed: int, profile: str) -> dict:
+    # yose keeps its indexes in ./db, so everything runs in a scratch directory.
+    from whoosh import index
+
+    from yose.config.db.Model import SCHEMA_PROFILES
+    from yose.corpus import Vocabulary, generate_documents
+    from yose.index_manager import index_manager
+    from yose.utils import (
+        add_document,
+        add_documents,
+        coerce_document,
+        get_options,
+        make_document_index,
+        search_documents,
+        search_page,
+        set_default_config,
+    )
+
+    schema = SCHEMA_PROFILES[profile]
+    fields = make_document_index(schema=schema).schema
+    documents = (
+        coerce_document(document, fields)
+        for document in generate_documents(scale + single, seed=seed)
+    )
+    results = {}
+
+    start = time.perf_counter()
+    for document in islice(documents, single):
+        add_document(document, schema=schema)
+    results["ingest_single"] = throughput(single, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    count = add_documents(documents, schema=schema)
+    results["ingest_bulk"] = throughput(count, time.perf_counter() - start)
+
+    def total(query: str) -> int:
+        return search_page(query, pagelen=1, schema=schema)["total"]
+
+    words = Vocabulary(random.Random(seed)).words
+    common, frequent, rare = words[0], words[1], words[50]
+    queries = {
+        "query_plain": f"keywords:{common}",
+        "query_two_terms": f"keywords:{common} tags:{frequent}",
+        "query_fuzzy": f"keywords:{rare[:-1]}~1",
+        "query_multifield": f"keywords:{common} OR tags:{rare}",
+        "query_range": "year:[2015 TO 2017]",
+    }
+    for name, query in queries.items():
+        results[name] = timings(
+            lambda query=query: search_documents(query, schema=schema), repeat
+        )
+        results[name].update(query=query, total=total(query))
+
+    results["pagination"] = {
+        f"page_{page}": timings(
+            lambda page=page: search_page(
+                queries["query_plain"], page=page, pagelen=20, schema=schema
+            ),
+            repeat,
+        )
+        for page in (1, 5, 25)
+    }
+    results["pagination"]["total"] = total(queries["query_plain"])
+
+    set_default_config()
+    results["options_lookup"] = timings(get_options, repeat * 10)
+
+    def open_cold():
+        ix = index.open_dir("db", indexname="documents")
+        ix.searcher().close()
+
+    def open_managed():
+        with index_manager.searcher("documents", schema):
+            pass
+
+    results["index_open_cold"] = timings(open_cold, repeat)
+    results["index_open_managed"] = timings(open_managed, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=10000, help="documents to index")
+    parser.add_argument(
+        "--single", type=int, default=100, help="documents added one by one"
+    )
+    parser.add_argument("--repeat", type=int, default=50, help="repetitions per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--profile",
+        default="lean",
+        choices=["default", "lean"],
+        help="schema profile, the queries only match documents with lean",
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    import whoosh
+
+    import yose
+
+    workdir = tempfile.mkdtemp(prefix="yose-benchmark-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        results = run(args.scale, args.single, args.repeat, args.seed, args.profile)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "yose": yose.__version__,
+            "whoosh": whoosh.versionstring(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "scale": args.scale,
+            "seed": args.seed,
+            "profile": args.profile,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+    empty = [
+        name
+        for name, result in results.items()
+        if isinstance(result, dict) and result.get("total") == 0
+    ]
+    if empty:
+        print(
+            f"WARNING: {', '.join(empty)} matched no documents with the "
+            f"{args.profile!r} profile, their timings are meaningless.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
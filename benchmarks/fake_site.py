@@ -0,0 +1,135 @@
+"""
+Local web site of synthetic linked HTML pages to crawl.
+
+Every page links to `--fanout` other pages, so a crawl from `/` reaches the whole
+site. robots.txt disallows `/private/`, which every page also links to.
+
+Usage:
+    python benchmarks/fake_site.py --pages 100000 --latency 0.05 &
+    python -m yose.crawler http://127.0.0.1:8100/ --depth 10 --delay 0 --per-host 64
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from yose.corpus import Vocabulary  # noqa: E402
+
+ROBOTS = b"User-agent: *\nDisallow: /private/\n"
+
+
+class FakeSite(ThreadingHTTPServer):
+    """A threaded HTTP server generating the same pages for the same seed."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        pages: int = 10000,
+        fanout: int = 10,
+        latency: float = 0.0,
+        seed: int = 42,
+    ) -> None:
+        super().__init__(address, FakeSiteHandler)
+        self.pages = pages
+        self.fanout = fanout
+        self.latency = latency
+        self.seed = seed
+        self.vocabulary = Vocabulary(random.Random(seed))
+        self.requests = 0
+
+    def page(self, number: int) -> bytes:
+        rng = random.Random(self.seed * 1000003 + number)
+        title = " ".join(self.vocabulary.sample(rng, rng.randint(3, 8))).capitalize()
+        description = " ".join(self.vocabulary.sample(rng, 20))
+        keywords = ", ".join(self.vocabulary.sample(rng, 5))
+        paragraphs = "".join(
+            f"<p>{' '.join(self.vocabulary.sample(rng, 60))}</p>" for _ in range(5)
+        )
+        links = "".join(
+            f'<a href="/page/{rng.randrange(self.pages)}">link</a> '
+            for _ in range(self.fanout)
+        )
+        return (
+            f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+            f"<title>{title}</title>"
+            f'<meta name="description" content="{description}">'
+            f'<meta name="keywords" content="{keywords}">'
+            f'<link rel="icon" href="/favicon.ico">'
+            f"<script>var ignored = 'not content';</script></head>"
+            f'<body><h1>{title}</h1><img src="/images/{number}.jpg">{paragraphs}'
+            f'<nav>{links}<a href="/private/{number}">private</a></nav></body></html>'
+        ).encode("utf-8")
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    server: FakeSite
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        path = urlparse(self.path).path
+        if server.latency:
+            time.sleep(server.latency)
+
+        if path == "/robots.txt":
+            self.respond(ROBOTS, "text/plain")
+        elif path == "/":
+            self.respond(server.page(0), "text/html; charset=utf-8")
+        elif path.startswith("/page/") and path[6:].isdigit():
+            number = int(path[6:])
+            if number >= server.pages:
+                self.send_error(404)
+                return
+            self.respond(server.page(number), "text/html; charset=utf-8")
+        else:
+            self.send_error(404)
+
+    def respond(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--pages", type=int, default=10000, help="pages on the site")
+    parser.add_argument("--fanout", type=int, default=10, help="links per page")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per page")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    server = FakeSite(
+        (args.host, args.port),
+        pages=args.pages,
+        fanout=args.fanout,
+        latency=args.latency,
+        seed=args.seed,
+    )
+    print(f"Fake site listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {server.requests} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Stand-in for a YaCy peer serving synthetic `yacysearch.json` answers.
+
+Point yose at it with YOSE_YACY_URL (it listens on YaCy's default port, 8090,
+unless told otherwise).
+
+Usage:
+    python benchmarks/fake_yacy.py --latency 0.2 --jitter 0.05 --error-rate 0.01
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from yose.corpus import generate_documents, to_yacy_item  # noqa: E402
+
+
+class FakeYaCy(ThreadingHTTPServer):
+    """A threaded HTTP server answering `/yacysearch.json` from a pool of items."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        pool_size: int = 5000,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 42,
+    ) -> None:
+        super().__init__(address, FakeYaCyHandler)
+        self.items = [
+            to_yacy_item(document)
+            for document in generate_documents(pool_size, seed=seed)
+        ]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+
+    def answer(self, query: str, start: int, count: int) -> dict:
+        # The same query always gets the same pages.
+        offset = zlib.crc32(query.encode("utf-8")) % len(self.items)
+        items = [
+            self.items[(offset + start + i) % len(self.items)] for i in range(count)
+        ]
+        return {
+            "channels": [
+                {
+                    "title": f"YaCy P2P-Search for {query}",
+                    "description": f"Search for {query}",
+                    "startIndex": str(start),
+                    "itemsPerPage": str(count),
+                    "searchTerms": query,
+                    "totalResults": str(len(self.items)),
+                    "items": items,
+                }
+            ]
+        }
+
+
+class FakeYaCyHandler(BaseHTTPRequestHandler):
+    server: FakeYaCy
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/yacysearch.json":
+            self.send_error(404)
+            return
+
+        server = self.server
+        server.requests += 1
+        delay = server.latency + server.rng.gauss(0, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if server.rng.random() < server.error_rate:
+            server.errors += 1
+            self.send_error(500, "Injected error")
+            return
+
+        params = parse_qs(url.query)
+        query = params.get("query", [""])[0]
+        start = int(params.get("startRecord", ["0"])[0])
+        count = int(params.get("maximumRecords", ["10"])[0])
+
+        body = json.dumps(server.answer(query, start, count)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--pool-size", type=int, default=5000, help="distinct items")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency std. dev.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500s")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    server = FakeYaCy(
+        (args.host, args.port),
+        pool_size=args.pool_size,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    print(f"Fake YaCy listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {server.requests} requests, {server.errors} injected errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Load test the search pages with concurrent simulated clients.
+
+Start yose against the fake YaCy server first, e.g.
+
+    python benchmarks/fake_yacy.py --latency 0.2 --jitter 0.05 &
+    python src/yose/main.py
+
+Usage:
+    python benchmarks/load_test.py --clients 50 --duration 60 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from yose.corpus import Vocabulary  # noqa: E402
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def simulated_client(
+    client: httpx.AsyncClient,
+    route: str,
+    words: list,
+    pages: int,
+    deadline: float,
+    rng: random.Random,
+    latencies: list,
+    statuses: Counter,
+) -> None:
+    # Each client searches for a query and then scrolls through a few pages of it.
+    while time.perf_counter() < deadline:
+        query = " ".join(rng.sample(words, rng.randint(1, 2)))
+        for page in range(rng.randint(1, pages)):
+            if time.perf_counter() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.get(
+                    route, params={"query": query, "page": page}
+                )
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run(
+    base_url: str, route: str, clients: int, duration: float, pages: int, seed: int
+) -> dict:
+    words = Vocabulary(random.Random(seed)).words[:200]
+    latencies: list = []
+    statuses: Counter = Counter()
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=60.0
+    ) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(
+            *(
+                simulated_client(
+                    client,
+                    route,
+                    words,
+                    pages,
+                    deadline,
+                    random.Random(seed + number),
+                    latencies,
+                    statuses,
+                )
+                for number in range(clients)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status == 200)
+    return {
+        "base_url": base_url,
+        "route": route,
+        "clients": clients,
+        "seconds": elapsed,
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "throughput_rps": ok / elapsed if elapsed else None,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--route", default="/search/images")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--pages", type=int, default=3, help="max pages per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(
+        run(
+            args.base_url,
+            args.route,
+            args.clients,
+            args.duration,
+            args.pages,
+            args.seed,
+        )
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,13 @@ setup(
     package_data={'yose': ['res/*']},
     long_description=read('README.md'),
     install_requires=[],
+    entry_points={
+        'console_scripts': [
+            'yose-bulk-import=yose.bulk:main',
+            'yose-migrate=yose.migrate:main',
+            'yose-crawl=yose.crawler:main',
+        ],
+    },
     tests_require=[
         'pytest',
         'pytest-cov',
@@ -0,0 +1,263 @@
+import heapq
+import math
+import os
+import shelve
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from yose.config.db.Model import IndexItems
+from yose.index_manager import index_manager
+from yose.lexicon import field_words
+from yose.metrics import metrics
+
+COMPLETION_FIELDS = ["title", "keywords", "tags"]
+
+COMPLETE = metrics.histogram(
+    "yose_autocomplete_seconds", "Time spent looking up completions."
+)
+
+
+class QueryLog:
+    """
+    Counts of the queries users searched for, the popular ones become completions.
+
+    Only the `max_queries` most frequent queries are kept, and counts are saved
+    to a `shelve` file every `save_every` recorded queries and on `close`.
+
+    Usage:
+        >>> query_log.record("red cats")
+        >>> query_log.top(100)
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join("db", "queries"),
+        max_queries: int = 10000,
+        save_every: int = 100,
+    ) -> None:
+        """
+        Args:
+            path (str, optional): The shelve file. Defaults to "db/queries".
+            max_queries (int, optional): Queries kept. Defaults to 10000.
+            save_every (int, optional): Recorded queries between two saves.
+                Defaults to 100.
+        """
+        self.path = path
+        self.max_queries = max_queries
+        self.save_every = save_every
+        self._counts: Optional[Counter] = None
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    @property
+    def counts(self) -> Counter:
+        if self._counts is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with shelve.open(self.path) as shelf:
+                self._counts = Counter(shelf.get("counts", {}))
+        return self._counts
+
+    def record(self, query: str) -> None:
+        """Count a submitted query."""
+        query = " ".join(query.lower().split())
+        if not query:
+            return
+        with self._lock:
+            counts = self.counts
+            counts[query] += 1
+            if len(counts) > 2 * self.max_queries:
+                self._counts = Counter(dict(counts.most_common(self.max_queries)))
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self._save()
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        """Return the `n` most frequent queries with their counts."""
+        with self._lock:
+            return self.counts.most_common(n)
+
+    def _save(self) -> None:
+        with shelve.open(self.path) as shelf:
+            shelf["counts"] = dict(self.counts.most_common(self.max_queries))
+        self._unsaved = 0
+
+    def close(self) -> None:
+        """Save the counts."""
+        with self._lock:
+            if self._counts is not None and self._unsaved:
+                self._save()
+
+
+class _Completions:
+    # An immutable snapshot, swapped in whole by CompletionTable.rebuild.
+
+    def __init__(self, entries: Dict[str, float], k: int, precomputed: int) -> None:
+        self.keys = sorted(entries)
+        self.scores = [entries[key] for key in self.keys]
+        self.k = k
+        self.top: Dict[str, List[str]] = {}
+        # Short prefixes match the most entries, their answers are computed once.
+        for length in range(1, precomputed + 1):
+            prefixes = sorted({key[:length] for key in self.keys if len(key) >= length})
+            for prefix in prefixes:
+                self.top[prefix] = self._scan(prefix, k)
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        return (
+            bisect_left(self.keys, prefix),
+            bisect_left(self.keys, prefix + "\U0010ffff"),
+        )
+
+    def _scan(self, prefix: str, k: int) -> List[str]:
+        start, end = self._range(prefix)
+        best = heapq.nlargest(k, range(start, end), key=self.scores.__getitem__)
+        return [self.keys[i] for i in best]
+
+    def complete(self, prefix: str, k: int) -> List[str]:
+        if k <= self.k and prefix in self.top:
+            return self.top[prefix][:k]
+        return self._scan(prefix, k)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class CompletionTable:
+    """
+    Precomputed prefix completions for the search boxes.
+
+    The table is a sorted array of words and popular queries with a score each:
+    a prefix is completed with a binary search and a top-k over the matching
+    range, and the top-k of every prefix up to `precomputed` characters is
+    stored outright. Lookups never touch the index, which only `rebuild` reads,
+    periodically and in the background.
+
+    Words come from the `title`, `keywords` and `tags` fields, weighted by the
+    number of documents they appear in, see `field_words`. Popular queries from
+    `query_log` complete the whole input, words complete its last word.
+
+    Usage:
+        >>> completion_table.rebuild()
+        >>> completion_table.complete("red ca")
+        ['red cats', 'red car', 'red carpet']
+    """
+
+    def __init__(
+        self,
+        indexname: str = "documents",
+        schema=IndexItems,
+        fields: List[str] = COMPLETION_FIELDS,
+        max_words: int = 200000,
+        min_frequency: int = 2,
+        query_weight: float = 2.0,
+        k: int = 8,
+        precomputed: int = 3,
+        queries: Optional[QueryLog] = None,
+    ) -> None:
+        """
+        Args:
+            indexname (str, optional): The index to read. Defaults to "documents".
+            schema (IndexItems, optional): The schema of the index. Defaults to
+                IndexItems.
+            fields (list, optional): Fields the words come from. Defaults to
+                COMPLETION_FIELDS.
+            max_words (int, optional): The most frequent words kept. Defaults to 200000.
+            min_frequency (int, optional): Words in fewer documents are left out.
+                Defaults to 2.
+            query_weight (float, optional): Score multiplier of past queries over
+                index words. Defaults to 2.0.
+            k (int, optional): Completions precomputed per prefix. Defaults to 8.
+            precomputed (int, optional): Length of the longest prefix whose
+                completions are precomputed. Defaults to 3.
+            queries (QueryLog, optional): The past queries. Defaults to `query_log`.
+        """
+        self.indexname = indexname
+        self.schema = schema
+        self.fields = fields
+        self.max_words = max_words
+        self.min_frequency = min_frequency
+        self.query_weight = query_weight
+        self.k = k
+        self.precomputed = precomputed
+        self.query_log = queries if queries is not None else query_log
+        self._completions = _Completions({}, k, 0)
+        self.built_at: Optional[float] = None
+
+    def rebuild(self) -> int:
+        """
+        Read the words of the index and the popular queries into a new table.
+
+        Returns:
+            int: The number of completions in the table.
+        """
+        start = time.perf_counter()
+        entries: Dict[str, float] = {}
+        with index_manager.searcher(self.indexname, self.schema) as searcher:
+            words = field_words(searcher, self.fields)
+        for word, frequency in words.most_common(self.max_words):
+            if frequency < self.min_frequency:
+                break
+            entries[word] = math.log1p(frequency)
+        for query, count in self.query_log.top(self.query_log.max_queries):
+            score = self.query_weight * math.log1p(count)
+            entries[query] = max(entries.get(query, 0.0), score)
+
+        self._completions = _Completions(entries, self.k, self.precomputed)
+        self.built_at = time.time()
+        logger.debug(
+            f"Built {len(entries)} completions in {time.perf_counter() - start:.2f}s"
+        )
+        return len(entries)
+
+    def complete(self, text: str, k: int = 8) -> List[str]:
+        """
+        Return the best completions of what was typed so far.
+
+        Args:
+            text (str): The text of the search box.
+            k (int, optional): Maximum number of completions. Defaults to 8.
+
+        Returns:
+            list: Completions of the whole text, best first.
+        """
+        with COMPLETE.time():
+            normalized = " ".join(text.lower().split())
+            if not normalized:
+                return []
+            completions = self._completions
+            results = completions.complete(normalized, k)
+
+            head, _, last = normalized.rpartition(" ")
+            if len(results) < k and head:
+                seen = set(results)
+                for word in completions.complete(last, k):
+                    completion = f"{head} {word}"
+                    # Single words only complete the last word of the input.
+                    if " " not in word and completion not in seen:
+                        results.append(completion)
+                        seen.add(completion)
+                        if len(results) == k:
+                            break
+            return results
+
+    def stats(self) -> dict:
+        """
+        Return the table size.
+
+        Returns:
+            dict: completions in the table and queries in the query log.
+        """
+        return {
+            "completions": len(self._completions),
+            "queries": len(self.query_log._counts or ()),
+        }
+
+
+query_log = QueryLog()
+completion_table = CompletionTable()
+metrics.gauge("yose_autocomplete", "Completion table sizes.", completion_table.stats)
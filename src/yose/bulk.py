@@ -0,0 +1,242 @@
+"""
+Index large JSONL or YaCy dump files using several processes.
+
+Usage:
+    python -m yose.bulk dump-1.jsonl.gz dump-2.json --procs 8 --limitmb 512
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import Pool, cpu_count
+from typing import Deque, Iterable, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from yose.config.db.Model import IndexItems
+from yose.dedup import MODES, ensure_fields, near_duplicates, sign_documents
+from yose.index_manager import index_manager
+from yose.ingest import yacy_item_to_document
+from yose.merge import merge_scheduler
+from yose.utils import make_document_index
+
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _items(record: dict) -> Iterator[dict]:
+    # A YaCy search answer wraps its result items, anything else is a document.
+    if "channels" in record:
+        for channel in record["channels"]:
+            yield from channel.get("items", [])
+    else:
+        yield record
+
+
+def iter_dump_file(path: str) -> Iterator[dict]:
+    """
+    Stream the records of a dump file, one at a time.
+
+    JSONL files (optionally gzipped) hold one document or one YaCy search answer per
+    line. Files ending in `.json` hold a single YaCy search answer or a list of
+    documents and are loaded whole.
+
+    Args:
+        path (str): The path of the dump file.
+
+    Yields:
+        dict: The raw documents or YaCy result items.
+    """
+    with _open_text(path) as f:
+        if path.endswith((".json", ".json.gz")):
+            data = json.load(f)
+            for record in data if isinstance(data, list) else [data]:
+                yield from _items(record)
+            return
+
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping invalid line {number} of {path}: {e}")
+                continue
+            yield from _items(record)
+
+
+def bulk_import(
+    paths: Iterable[str],
+    procs: Optional[int] = None,
+    limitmb: int = 256,
+    batchsize: int = 1000,
+    multisegment: bool = False,
+    indexname: str = "documents",
+    schema=IndexItems,
+) -> dict:
+    """
+    Index the documents of dump files across several worker processes.
+
+    Documents are read and converted in this process and handed to Whoosh's
+    multi-process writer in batches; every worker analyzes its batches into its own
+    segment and the segments are merged when the import is committed. All documents
+    are added in a single commit, so the import should not run while other writers
+    are active.
+
+    Each batch goes through `near_duplicates` first, like the ingestion queue's, and
+    documents replace those of the index with the same guid, so importing a dump
+    again does not duplicate it. Within one import only the first document with a
+    guid is indexed, the writer cannot replace documents it has not committed yet;
+    the guids read are kept in memory until the import ends.
+
+    The batches are signed by a pool of `procs` processes, only the LSH lookups
+    run in this process. Those are serial and cap how far the import scales with
+    `procs`, an initial load that needs no deduplication can set
+    `near_duplicates.mode` to "off" (`--dedup off`).
+
+    Args:
+        paths (Iterable[str]): The dump files, see iter_dump_file for the formats.
+        procs (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        limitmb (int, optional): Memory each worker may use for its indexing buffer
+            before spilling to disk. Defaults to 256.
+        batchsize (int, optional): Documents sent to a worker at a time. Defaults to 1000.
+        multisegment (bool, optional): Keep the worker segments as they are instead of
+            merging them into one at the end. Defaults to False.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema used if the index does not exist.
+            Defaults to IndexItems.
+
+    Returns:
+        dict: The number of documents indexed, skipped (without a guid), repeated
+            (a guid already read) and dropped as near-duplicates, the elapsed time
+            and the number of documents indexed per second.
+    """
+    procs = procs or cpu_count()
+    ensure_fields(indexname, schema)
+    ix = make_document_index(indexname=indexname, schema=schema)
+
+    start = time.perf_counter()
+    indexed = skipped = repeated = dropped = 0
+    guids: Set[str] = set()
+    batch: List[dict] = []
+    signer = Pool(procs) if near_duplicates.mode != "off" else None
+    # Batches being signed, at most two per signing process.
+    signing: Deque[Tuple[List[dict], object]] = deque()
+    writer = merge_scheduler.writer(
+        ix,
+        indexname,
+        procs=procs,
+        limitmb=limitmb,
+        batchsize=batchsize,
+        multisegment=multisegment,
+    )
+
+    def write(documents: List[dict], signatures=None) -> None:
+        nonlocal indexed, dropped
+        kept = near_duplicates.process(documents, signatures)
+        for document in kept:
+            writer.update_document(**document)
+        indexed += len(kept)
+        dropped += len(documents) - len(kept)
+
+    def sign(flush: bool = False) -> None:
+        # Hands the batch read to the signing pool and writes the batches signed.
+        nonlocal batch
+        if batch:
+            if signer is None:
+                write(batch)
+            else:
+                signing.append(
+                    (
+                        batch,
+                        signer.apply_async(
+                            sign_documents,
+                            (batch,),
+                            {"min_shingles": near_duplicates.min_shingles},
+                        ),
+                    )
+                )
+            batch = []
+        while signing and (flush or len(signing) > 2 * procs):
+            documents, signatures = signing.popleft()
+            write(documents, signatures.get())
+
+    try:
+        for path in paths:
+            logger.info(f"Importing {path}")
+            for item in iter_dump_file(path):
+                document = yacy_item_to_document(item, ix.schema)
+                if document is None:
+                    skipped += 1
+                    continue
+                if document["guid"] in guids:
+                    repeated += 1
+                    continue
+                guids.add(document["guid"])
+                batch.append(document)
+                if len(batch) >= batchsize:
+                    sign()
+                if len(guids) % 100000 == 0:
+                    logger.info(f"Read {len(guids)} documents")
+        sign(flush=True)
+        logger.info(f"Merging the segments of {procs} workers")
+        writer.commit()
+    except BaseException:
+        writer.cancel()
+        raise
+    finally:
+        if signer is not None:
+            signer.terminate()
+    index_manager.invalidate(indexname)
+    near_duplicates.save()
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "indexed": indexed,
+        "skipped": skipped,
+        "repeated": repeated,
+        "dropped": dropped,
+        "procs": procs,
+        "seconds": elapsed,
+        "docs_per_second": indexed / elapsed if elapsed else None,
+    }
+    logger.info(f"Bulk import finished: {report}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="JSONL or YaCy dump files")
+    parser.add_argument("--procs", type=int, default=None)
+    parser.add_argument("--limitmb", type=int, default=256)
+    parser.add_argument("--batchsize", type=int, default=1000)
+    parser.add_argument("--multisegment", action="store_true")
+    parser.add_argument("--index", default="documents")
+    parser.add_argument("--dedup", choices=MODES, default=near_duplicates.mode)
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if not os.path.isfile(path):
+            parser.error(f"No such file: {path}")
+    near_duplicates.mode = args.dedup
+
+    report = bulk_import(
+        args.paths,
+        procs=args.procs,
+        limitmb=args.limitmb,
+        batchsize=args.batchsize,
+        multisegment=args.multisegment,
+        indexname=args.index,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
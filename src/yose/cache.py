@@ -0,0 +1,231 @@
+import asyncio
+import shelve
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from loguru import logger
+
+from yose.metrics import metrics
+
+
+class ResultCache:
+    """
+    Bounded cache for search results with TTL expiry and LRU eviction.
+
+    Entries live in memory and, when a `path` is given, are also written to a
+    `shelve` file so they survive restarts. Entries evicted from memory are
+    removed from the file too, and the file is swept of expired entries, and of
+    the oldest beyond `max_entries`, when it is opened and closed. Concurrent requests for the same key
+    share a single fetch, which is what lets `prefetch` warm the next page while
+    the user is still looking at the current one.
+
+    Usage:
+        >>> results = await search_cache.get_or_fetch(key, lambda: fetch_page(key))
+        >>> search_cache.prefetch(next_key, lambda: fetch_page(next_key))
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, ttl: float = 300.0, path: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            max_entries (int, optional): Maximum number of entries kept in memory
+                and on disk. Defaults to 1024.
+            ttl (float, optional): Seconds an entry stays valid. Defaults to 300.0.
+            path (str, optional): File used to persist the entries. Defaults to None,
+                which keeps the cache in memory only.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._shelf: Optional[shelve.Shelf] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.prefetches = 0
+
+    @property
+    def shelf(self) -> Optional[shelve.Shelf]:
+        if self._shelf is None and self.path is not None:
+            self._shelf = shelve.open(self.path)
+            self._prune()
+        return self._shelf
+
+    def _prune(self) -> None:
+        # Drops the expired entries from disk, then the oldest beyond max_entries.
+        now = time.time()
+        kept = []
+        for name in list(self._shelf.keys()):
+            stored_at, _ = self._shelf[name]
+            if now - stored_at >= self.ttl:
+                del self._shelf[name]
+            else:
+                kept.append((stored_at, name))
+        kept.sort()
+        for _, name in kept[: max(0, len(kept) - self.max_entries)]:
+            del self._shelf[name]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value for `key`, or `default` if it is missing or expired.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any, optional): Returned on a miss. Defaults to None.
+
+        Returns:
+            Any: The cached value or `default`.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is None and self.shelf is not None:
+            stored = self.shelf.get(repr(key))
+            if stored is not None:
+                # Wall clock time on disk, monotonic time in memory.
+                stored_at, value = stored
+                entry = (now - (time.time() - stored_at), value)
+                self._store(key, entry)
+
+        if entry is not None:
+            stored_at, value = entry
+            if now - stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.expirations += 1
+            self.delete(key)
+
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value, it must be picklable if the cache is disk backed.
+        """
+        self._store(key, (time.monotonic(), value))
+        if self.shelf is not None:
+            self.shelf[repr(key)] = (time.time(), value)
+
+    def _store(self, key: Hashable, entry: tuple) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self._shelf is not None:
+                self._shelf.pop(repr(evicted), None)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Remove `key` from memory and from disk."""
+        self._entries.pop(key, None)
+        if self.shelf is not None:
+            self.shelf.pop(repr(key), None)
+
+    async def get_or_fetch(
+        self, key: Hashable, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return the cached value for `key`, calling `fetch` to fill the cache on a miss.
+
+        If a fetch for the same key is already running (e.g. a prefetch), it is awaited
+        instead of starting a new one.
+
+        Args:
+            key (Hashable): The cache key.
+            fetch (Callable[[], Awaitable[Any]]): Coroutine function producing the value.
+
+        Returns:
+            Any: The cached or freshly fetched value.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(
+                self._fetch(key, fetch)
+            )
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+            self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def prefetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Fetch `key` in the background if it is neither cached nor already being fetched.
+
+        Failures are logged and otherwise ignored, a later `get_or_fetch` will retry.
+
+        Args:
+            key (Hashable): The cache key.
+            fetch (Callable[[], Awaitable[Any]]): Coroutine function producing the value.
+        """
+        if key in self._inflight:
+            return
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return
+
+        self.prefetches += 1
+        future = self._inflight[key] = asyncio.ensure_future(self._fetch(key, fetch))
+        future.add_done_callback(
+            lambda f: f.cancelled()
+            or f.exception() is None
+            or logger.warning(f"Prefetch of {key!r} failed: {f.exception()!r}")
+        )
+
+    def keys(self) -> list:
+        """Return the keys currently held in memory, least recently used first."""
+        return list(self._entries)
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters, useful to size `max_entries` and `ttl`.
+
+        Returns:
+            dict: size, hits, misses, hit_rate, evictions, expirations and prefetches.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "prefetches": self.prefetches,
+        }
+
+    def clear(self) -> None:
+        """Remove every entry from memory and from disk."""
+        self._entries.clear()
+        if self.shelf is not None:
+            self.shelf.clear()
+
+    def close(self) -> None:
+        """Flush and close the disk backing, if any."""
+        if self._shelf is not None:
+            self._prune()
+            self._shelf.close()
+            self._shelf = None
+
+
+search_cache = ResultCache()
+metrics.gauge("yose_search_cache", "Search result cache counters.", search_cache.stats)
@@ -31,6 +31,7 @@ class Options(SchemaClass):
     automatic_updates_interval = NUMERIC(stored=True)
     automatically_refresh_metadata = BOOLEAN(stored=True)
     show_unread_count_in_update_button = BOOLEAN(stored=True)
+    version = NUMERIC(stored=True, sortable=True)
 
 
 class IndexItems(SchemaClass):
@@ -75,7 +76,7 @@ class IndexItems(SchemaClass):
     path = TEXT(analyzer=analyzer, stored=True, sortable=True)
     protocol = TEXT(analyzer=analyzer, stored=True, sortable=True)
     pubDate = TEXT(analyzer=analyzer, stored=True, sortable=True)
-    rating = NUMERIC(stored=True)
+    rating = NUMERIC(stored=True, sortable=True)
     rating_count = NUMERIC(stored=True)
     second = NUMERIC(stored=True, sortable=True)
     sentiment = TEXT(analyzer=analyzer, stored=True, sortable=True)
@@ -93,3 +94,81 @@ class IndexItems(SchemaClass):
     icon = TEXT(analyzer=analyzer, stored=True, sortable=True)
     url = TEXT(analyzer=analyzer, stored=True, sortable=True)
     urlhash = ID(stored=True, unique=True)
+    cluster = ID(stored=True, sortable=True)
+
+
+class LeanIndexItems(SchemaClass):
+    """
+    Storage optimized profile of IndexItems with the same field names.
+
+    Identifiers and URLs are indexed as single terms instead of stemmed text,
+    dimensions and dates are numeric, columns are only kept for the fields we sort,
+    rank or facet on, and long text is not duplicated into columns.
+    """
+
+    author = TEXT(analyzer=analyzer, stored=True)
+    author_email = ID(stored=True)
+    author_link = ID(stored=True)
+    cache = ID(stored=True)
+    category = KEYWORD(stored=True, sortable=True, lowercase=True, commas=True)
+    comment_count = NUMERIC(stored=True, default=0)
+    comments = TEXT(analyzer=analyzer, stored=True)
+    content = TEXT(analyzer=analyzer, stored=True)
+    content_type = ID(stored=True, sortable=True)
+    created_at = DATETIME(stored=True, sortable=True)
+    day = NUMERIC(stored=True)
+    deleted_at = DATETIME(stored=True)
+    description = TEXT(analyzer=analyzer, stored=True)
+    download_count = NUMERIC(stored=True, default=0)
+    duration = NUMERIC(stored=True, default=0)
+    ext = ID(stored=True, sortable=True)
+    file = ID(stored=True)
+    guid = ID(stored=True, unique=True)
+    hashtags = KEYWORD(stored=True, lowercase=True, commas=True)
+    height = NUMERIC(stored=True)
+    host = ID(stored=True, sortable=True)
+    hour = NUMERIC(stored=True)
+    image = ID(stored=True)
+    is_active = BOOLEAN(stored=True)
+    is_deleted = BOOLEAN(stored=True)
+    is_featured = BOOLEAN(stored=True)
+    is_new = BOOLEAN(stored=True)
+    is_popular = BOOLEAN(stored=True)
+    is_trending = BOOLEAN(stored=True)
+    is_verified = BOOLEAN(stored=True)
+    keywords = KEYWORD(stored=True, lowercase=True, commas=True, scorable=True)
+    language = ID(stored=True, sortable=True)
+    last_used = DATETIME(stored=True)
+    likes = NUMERIC(stored=True, default=0, sortable=True)
+    link = ID(stored=True)
+    location = TEXT(analyzer=analyzer, stored=True)
+    minute = NUMERIC(stored=True)
+    month = NUMERIC(stored=True)
+    path = ID(stored=True)
+    protocol = ID(stored=True)
+    pubDate = DATETIME(stored=True, sortable=True)
+    rating = NUMERIC(stored=True, sortable=True, default=0)
+    rating_count = NUMERIC(stored=True, default=0)
+    second = NUMERIC(stored=True)
+    sentiment = ID(stored=True)
+    sentiment_score = NUMERIC(stored=True, sortable=True, default=0)
+    shares = NUMERIC(stored=True, default=0, sortable=True)
+    size = NUMERIC(stored=True, sortable=True, default=0)
+    sizename = ID(stored=True)
+    source = ID(stored=True)
+    tags = KEYWORD(stored=True, lowercase=True, commas=True, scorable=True)
+    title = TEXT(analyzer=analyzer, stored=True)
+    updated_at = DATETIME(stored=True, sortable=True)
+    views = NUMERIC(stored=True, default=0, sortable=True)
+    width = NUMERIC(stored=True)
+    year = NUMERIC(stored=True, sortable=True)
+    icon = ID(stored=True)
+    url = ID(stored=True)
+    urlhash = ID(stored=True, unique=True)
+    cluster = ID(stored=True, sortable=True)
+
+
+SCHEMA_PROFILES = {
+    "default": IndexItems,
+    "lean": LeanIndexItems,
+}
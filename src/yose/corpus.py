@@ -0,0 +1,160 @@
+"""
+Deterministic synthetic documents for benchmarks and load tests.
+"""
+
+import hashlib
+import random
+import string
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ta", "ri", "so", "vu", "pe", "da", "gi", "ho", "ba",
+    "ze", "fo", "lu", "wa", "xi", "ny", "qu", "tre", "sta", "pla", "mon", "ser",
+]  # fmt: skip
+
+TLDS = ["com", "org", "net", "io", "de", "fr", "es", "info"]
+LANGUAGES = ["en", "en", "en", "de", "fr", "es", "it", "pt"]
+CONTENT_TYPES = ["text/html", "text/html", "application/pdf", "image/jpeg", "image/png"]
+EXTENSIONS = ["html", "html", "htm", "pdf", "jpg", "png", "php"]
+CATEGORIES = ["news", "science", "sports", "technology", "art", "travel", "food"]
+
+EPOCH = datetime(2015, 1, 1)
+
+
+class Vocabulary:
+    """A fixed vocabulary of made up words drawn with a Zipf-like distribution."""
+
+    def __init__(self, rng: random.Random, size: int = 5000) -> None:
+        words = set()
+        while len(words) < size:
+            words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+        self.words: List[str] = sorted(words)
+        rng.shuffle(self.words)
+        # Rank r is drawn with a probability proportional to 1 / r.
+        self.weights = [1.0 / rank for rank in range(1, size + 1)]
+        self.cumulative = []
+        total = 0.0
+        for weight in self.weights:
+            total += weight
+            self.cumulative.append(total)
+
+    def sample(self, rng: random.Random, k: int) -> List[str]:
+        return rng.choices(self.words, cum_weights=self.cumulative, k=k)
+
+
+def urlhash(url: str) -> str:
+    """Return a 12 character hash of a URL, the same length as YaCy's url hashes."""
+    digest = hashlib.sha1(url.encode("utf-8")).digest()
+    alphabet = string.ascii_letters + string.digits + "-_"
+    return "".join(alphabet[byte % len(alphabet)] for byte in digest[:12])
+
+
+def generate_documents(
+    count: int, seed: int = 42, hosts: int = 500, vocabulary_size: int = 5000
+) -> Iterator[dict]:
+    """
+    Generate realistic IndexItems documents, the same ones for the same arguments.
+
+    Words follow a Zipf-like distribution, documents are spread over a fixed pool of
+    hosts, and popularity counters are heavy tailed, so term statistics and column
+    values resemble those of a crawled index.
+
+    Args:
+        count (int): The number of documents.
+        seed (int, optional): The random seed. Defaults to 42.
+        hosts (int, optional): The number of distinct hosts. Defaults to 500.
+        vocabulary_size (int, optional): The number of distinct words. Defaults to 5000.
+
+    Yields:
+        dict: Documents with the field names of IndexItems.
+    """
+    rng = random.Random(seed)
+    vocabulary = Vocabulary(rng, vocabulary_size)
+    host_names = [
+        f"{'www.' if rng.random() < 0.5 else ''}{vocabulary.words[i]}.{rng.choice(TLDS)}"
+        for i in range(hosts)
+    ]
+
+    for number in range(count):
+        host = rng.choice(host_names[: max(1, int(rng.paretovariate(1.2)) * 10)])
+        ext = rng.choice(EXTENSIONS)
+        path = "/" + "/".join(vocabulary.sample(rng, rng.randint(1, 3)))
+        file = f"{vocabulary.sample(rng, 1)[0]}-{number}.{ext}"
+        url = f"https://{host}{path}/{file}"
+        title = " ".join(vocabulary.sample(rng, rng.randint(3, 10))).capitalize()
+        created_at = EPOCH + timedelta(seconds=rng.randint(0, 10 * 365 * 24 * 3600))
+        updated_at = created_at + timedelta(days=rng.randint(0, 365))
+        views = int(rng.paretovariate(1.1) * 10)
+
+        yield {
+            "guid": urlhash(url),
+            "urlhash": urlhash(url),
+            "url": url,
+            "link": url,
+            "host": host,
+            "protocol": "https",
+            "path": path,
+            "file": file,
+            "ext": ext,
+            "title": title,
+            "description": " ".join(vocabulary.sample(rng, rng.randint(10, 30))),
+            "content": " ".join(vocabulary.sample(rng, rng.randint(100, 800))),
+            "keywords": ", ".join(vocabulary.sample(rng, rng.randint(2, 6))),
+            "tags": ",".join(vocabulary.sample(rng, rng.randint(1, 5))),
+            "author": " ".join(vocabulary.sample(rng, 2)).title(),
+            "category": rng.choice(CATEGORIES),
+            "language": rng.choice(LANGUAGES),
+            "content_type": rng.choice(CONTENT_TYPES),
+            "size": rng.randint(500, 5000000),
+            "views": views,
+            "likes": int(views * rng.random() * 0.2),
+            "shares": int(views * rng.random() * 0.05),
+            "comment_count": int(views * rng.random() * 0.02),
+            "rating": rng.randint(0, 5),
+            "rating_count": rng.randint(0, 500),
+            "sentiment_score": rng.randint(-100, 100),
+            "is_active": rng.random() < 0.95,
+            "is_deleted": rng.random() < 0.05,
+            "is_featured": rng.random() < 0.02,
+            "is_verified": rng.random() < 0.3,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "year": created_at.year,
+            "month": created_at.month,
+            "day": created_at.day,
+            "pubDate": created_at.strftime("%a, %d %b %Y %H:%M:%S +0000"),
+        }
+
+
+def to_yacy_item(document: dict) -> dict:
+    """
+    Convert a generated document to an item of a YaCy `yacysearch.json` answer.
+
+    Args:
+        document (dict): A document from generate_documents.
+
+    Returns:
+        dict: The item, with YaCy's field names and string values.
+    """
+    size = document["size"]
+    width = 200 + document["size"] % 1800
+    return {
+        "title": document["title"],
+        "link": document["link"],
+        "code": "",
+        "description": document["description"],
+        "pubDate": document["pubDate"],
+        "size": str(size),
+        "sizename": f"{size // 1024} kbyte",
+        "guid": document["guid"],
+        "urlhash": document["urlhash"],
+        "host": document["host"],
+        "path": document["path"],
+        "file": document["file"],
+        "image": f"https://{document['host']}/images/{document['guid']}.jpg",
+        "url": document["url"],
+        "width": str(width),
+        "height": str(width * 2 // 3),
+        "ext": "jpg",
+    }
@@ -0,0 +1,580 @@
+"""
+Crawl web pages into the document index.
+
+Usage:
+    python -m yose.crawler https://example.org/ --depth 2 --max-pages 10000
+    python -m yose.crawler  # resume an interrupted crawl
+"""
+
+import argparse
+import asyncio
+import json
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+from loguru import logger
+
+from yose.corpus import urlhash
+from yose.frontier import Frontier, crawl_frontier, url_key
+from yose.ingest import ingestion_queue
+from yose.metrics import metrics
+
+USER_AGENT = "yose-crawler/1.0 (+https://github.com/Sygil-Dev/yose)"
+
+CRAWL_FETCH = metrics.histogram(
+    "yose_crawl_fetch_seconds", "Time spent fetching and parsing crawled pages."
+)
+CRAWL_PAGES = metrics.counter(
+    "yose_crawl_pages_total", "Crawled URLs by outcome (indexed, skipped, error...)."
+)
+
+
+class PageParser(HTMLParser):
+    """
+    Streaming HTML parser collecting what the document index needs from a page.
+
+    Feed it the page as it arrives, there is no need to hold the whole page in
+    memory. Text inside scripts, styles and similar tags is ignored and the body
+    text is truncated to `max_content` characters.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+    def __init__(self, base_url: str, max_content: int = 100000) -> None:
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.max_content = max_content
+        self.meta: Dict[str, str] = {}
+        self.language: Optional[str] = None
+        self.icon: Optional[str] = None
+        self.images: List[str] = []
+        self.links: List[str] = []
+        self._title: List[str] = []
+        self._text: List[str] = []
+        self._text_length = 0
+        self._skipping = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        attrs = {name: value for name, value in attrs if value is not None}
+        if tag in self.SKIPPED_TAGS:
+            self._skipping += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "html" and "lang" in attrs:
+            self.language = attrs["lang"]
+        elif tag == "base" and "href" in attrs:
+            self.base_url = urljoin(self.base_url, attrs["href"])
+        elif tag == "meta":
+            name = attrs.get("name") or attrs.get("property") or attrs.get("http-equiv")
+            if name and "content" in attrs:
+                self.meta.setdefault(name.lower(), attrs["content"].strip())
+        elif tag == "a" and "href" in attrs:
+            if "nofollow" not in attrs.get("rel", "").lower():
+                self.links.append(urljoin(self.base_url, attrs["href"]))
+        elif tag == "img" and "src" in attrs and len(self.images) < 10:
+            self.images.append(urljoin(self.base_url, attrs["src"]))
+        elif tag == "link" and "icon" in attrs.get("rel", "").lower().split():
+            if "href" in attrs:
+                self.icon = urljoin(self.base_url, attrs["href"])
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self.SKIPPED_TAGS and self._skipping:
+            self._skipping -= 1
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data: str) -> None:
+        if self._skipping:
+            return
+        if self._in_title:
+            self._title.append(data)
+        elif self._text_length < self.max_content:
+            self._text.append(data)
+            self._text_length += len(data)
+
+    @property
+    def title(self) -> str:
+        return " ".join("".join(self._title).split())
+
+    @property
+    def content(self) -> str:
+        return " ".join(" ".join(self._text).split())[: self.max_content]
+
+
+def page_to_document(
+    url: str, parser: PageParser, headers: httpx.Headers, size: int
+) -> dict:
+    """
+    Build an IndexItems document from a parsed page.
+
+    Values are left as strings, they are converted to the field types when the
+    document is queued for indexing.
+
+    Args:
+        url (str): The final URL of the page, after redirects.
+        parser (PageParser): The parser the page was fed to.
+        headers (Headers): The response headers.
+        size (int): The number of bytes read.
+
+    Returns:
+        dict: The document, without empty fields.
+    """
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    file = posixpath.basename(path)
+    meta = parser.meta
+    document = {
+        "guid": urlhash(url),
+        "urlhash": urlhash(url),
+        "url": url,
+        "link": url,
+        "host": parts.hostname,
+        "protocol": parts.scheme,
+        "path": posixpath.dirname(path),
+        "file": file,
+        "ext": posixpath.splitext(file)[1].lstrip(".").lower(),
+        "title": parser.title or meta.get("og:title"),
+        "description": meta.get("description") or meta.get("og:description"),
+        "keywords": meta.get("keywords"),
+        "author": meta.get("author"),
+        "content": parser.content,
+        "image": meta.get("og:image") or next(iter(parser.images), None),
+        "icon": parser.icon,
+        "language": parser.language or meta.get("content-language"),
+        "content_type": headers.get("content-type", "").split(";")[0].strip(),
+        "size": size,
+        "pubDate": headers.get("last-modified"),
+        "source": "crawler",
+    }
+    return {name: value for name, value in document.items() if value not in (None, "")}
+
+
+def parse_page(
+    url: str, data: bytes, response: httpx.Response
+) -> Tuple[dict, List[str]]:
+    """
+    Parse a downloaded page into a document and its links.
+
+    Args:
+        url (str): The final URL of the page, after redirects.
+        data (bytes): The body of the page, possibly cut at `max_bytes`.
+        response (httpx.Response): The response, for its headers and charset.
+
+    Returns:
+        tuple: The document, see `page_to_document`, and the links of the page.
+    """
+    try:
+        text = data.decode(response.charset_encoding or "utf-8", errors="replace")
+    except LookupError:
+        text = data.decode("utf-8", errors="replace")
+    parser = PageParser(url)
+    parser.feed(text)
+    parser.close()
+    return page_to_document(url, parser, response.headers, len(data)), parser.links
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """Return the URL without its fragment, or None if it is not http(s)."""
+    url, _ = urldefrag(url.strip())
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    return url
+
+
+class _Host:
+    def __init__(self, concurrency: int, delay: float) -> None:
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.robots_lock = asyncio.Lock()
+        self.robots: Optional[RobotFileParser] = None
+        self.robots_expires = 0.0
+        self.delay = delay
+        self.next_fetch = 0.0
+
+
+class WebCrawler:
+    """
+    Asynchronous crawler feeding the document index.
+
+    A pool of worker tasks shares one pooled HTTP client. Requests to the same host
+    are capped at `per_host_concurrency` and spaced by `politeness_delay` seconds
+    (or the robots.txt Crawl-delay, if longer). robots.txt is fetched once per host
+    and cached for `robots_ttl` seconds, or `robots_retry` seconds when the site
+    could not answer it. Discovered URLs wait in a persistent `Frontier`, which
+    hands them out one host after the other and skips URLs that were already
+    seen; its SQLite calls run on a thread of their own, off the event loop.
+    Pages are parsed on a worker thread too, once downloaded, and handed to
+    `sink` in batches of `batch_size` documents, by default the ingestion queue,
+    which slows the crawl down when the index writer falls behind.
+
+    Usage:
+        >>> report = await web_crawler.crawl(["https://example.org/"], max_depth=2)
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 64,
+        per_host_concurrency: int = 2,
+        politeness_delay: float = 1.0,
+        timeout: float = 10.0,
+        max_bytes: int = 2 * 1024 * 1024,
+        obey_robots: bool = True,
+        robots_ttl: float = 24 * 3600,
+        robots_retry: float = 300,
+        user_agent: str = USER_AGENT,
+        batch_size: int = 100,
+        sink: Optional[Callable[[List[dict]], Awaitable]] = None,
+        frontier: Optional[Frontier] = None,
+    ) -> None:
+        """
+        Args:
+            concurrency (int, optional): Number of worker tasks, which is also the
+                size of the connection pool. Defaults to 64.
+            per_host_concurrency (int, optional): Maximum parallel requests to one
+                host. Defaults to 2.
+            politeness_delay (float, optional): Minimum seconds between two requests
+                to one host. Defaults to 1.0.
+            timeout (float, optional): Request timeout in seconds. Defaults to 10.0.
+            max_bytes (int, optional): Bytes read from a page at most. Defaults to
+                2 MiB.
+            obey_robots (bool, optional): Honour robots.txt. Defaults to True.
+            robots_ttl (float, optional): Seconds robots.txt stays cached. Defaults
+                to a day.
+            robots_retry (float, optional): Seconds before robots.txt is asked for
+                again after a network error or a 5xx answer, the host is not
+                crawled meanwhile. Defaults to 5 minutes.
+            user_agent (str, optional): The User-Agent header, also matched against
+                robots.txt rules.
+            batch_size (int, optional): Documents handed to the sink at once.
+                Defaults to 100.
+            sink (Callable, optional): Coroutine function receiving the batches.
+                Defaults to `ingestion_queue.put`.
+            frontier (Frontier, optional): Where discovered URLs wait. Defaults to
+                `crawl_frontier`.
+        """
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.politeness_delay = politeness_delay
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.obey_robots = obey_robots
+        self.robots_ttl = robots_ttl
+        self.robots_retry = robots_retry
+        self.user_agent = user_agent
+        self.batch_size = batch_size
+        self.sink = sink or ingestion_queue.put
+        self.frontier = frontier if frontier is not None else crawl_frontier
+        self._hosts: Dict[str, _Host] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._batch: List[dict] = []
+        self._stopping = False
+        self.running = False
+        self._reset_counters()
+
+    def _reset_counters(self) -> None:
+        self.started = None
+        self.fetched = 0
+        self.indexed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.blocked = 0
+        self.bytes = 0
+        self.queued = 0
+
+    def _host(self, url: str) -> _Host:
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        host = self._hosts.get(key)
+        if host is None:
+            host = self._hosts[key] = _Host(
+                self.per_host_concurrency, self.politeness_delay
+            )
+        return host
+
+    async def _allowed(self, url: str, host: _Host) -> bool:
+        if not self.obey_robots:
+            return True
+        async with host.robots_lock:
+            if host.robots is None or time.monotonic() >= host.robots_expires:
+                host.robots, ttl = await self._fetch_robots(url)
+                host.robots_expires = time.monotonic() + ttl
+                delay = host.robots.crawl_delay(self.user_agent)
+                host.delay = max(self.politeness_delay, float(delay or 0))
+        return host.robots.can_fetch(self.user_agent, url)
+
+    async def _fetch_robots(self, url: str) -> Tuple[RobotFileParser, float]:
+        # Returns the rules and the seconds they may be cached for.
+        parts = urlsplit(url)
+        robots = RobotFileParser(f"{parts.scheme}://{parts.netloc}/robots.txt")
+        try:
+            response = await self._client.get(robots.url)
+        except httpx.HTTPError as e:
+            logger.debug(f"Could not fetch {robots.url}: {e!r}")
+            robots.disallow_all = True
+            return robots, self.robots_retry
+        if response.status_code >= 500:
+            # The site is having trouble, come back later instead of guessing.
+            robots.disallow_all = True
+            return robots, self.robots_retry
+        if response.status_code >= 400:
+            robots.allow_all = True
+        else:
+            robots.parse(response.text.splitlines())
+        return robots, self.robots_ttl
+
+    async def _frontier(self, function: Callable, *args):
+        # The frontier and its seen set are SQLite backed, their calls run on a
+        # single thread of their own, in the order the workers make them.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    async def _wait_turn(self, host: _Host) -> None:
+        async with host.lock:
+            wait = host.next_fetch - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            host.next_fetch = time.monotonic() + host.delay
+
+    async def fetch(self, url: str) -> Optional[Tuple[dict, List[str]]]:
+        """
+        Fetch and parse one page, respecting robots.txt and the per host limits.
+
+        Args:
+            url (str): The URL of the page.
+
+        Returns:
+            tuple or None: The document and the links of the page, or None if the
+            page was not fetched or is not HTML.
+        """
+        host = self._host(url)
+        if not await self._allowed(url, host):
+            self.blocked += 1
+            CRAWL_PAGES.inc(result="blocked")
+            return None
+
+        async with host.semaphore:
+            await self._wait_turn(host)
+            try:
+                with CRAWL_FETCH.time():
+                    return await self._download(url)
+            except (httpx.HTTPError, UnicodeError) as e:
+                logger.debug(f"Fetching {url} failed: {e!r}")
+                self.errors += 1
+                CRAWL_PAGES.inc(result="error")
+                return None
+
+    async def _download(self, url: str) -> Optional[Tuple[dict, List[str]]]:
+        async with self._client.stream("GET", url) as response:
+            self.fetched += 1
+            content_type = response.headers.get("content-type", "")
+            if response.status_code != 200 or "html" not in content_type:
+                self.skipped += 1
+                CRAWL_PAGES.inc(result="skipped")
+                return None
+
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= self.max_bytes:
+                    break
+
+        self.bytes += size
+        # Parsing is CPU bound, it would hold up every other download.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, parse_page, str(response.url), b"".join(chunks), response
+        )
+
+    async def _emit(self, document: Optional[dict]) -> None:
+        if document is not None:
+            self._batch.append(document)
+        if self._batch and (document is None or len(self._batch) >= self.batch_size):
+            batch, self._batch = self._batch, []
+            await self.sink(batch)
+            self.indexed += len(batch)
+
+    async def crawl(
+        self,
+        seeds: Iterable[str] = (),
+        max_depth: int = 2,
+        max_pages: Optional[int] = None,
+        same_host: bool = True,
+    ) -> dict:
+        """
+        Crawl from the seed URLs until the frontier is empty or a limit is reached.
+
+        URLs left in the frontier by a stopped or interrupted crawl are crawled too,
+        so calling this without seeds resumes the previous crawl.
+
+        Args:
+            seeds (Iterable[str], optional): The start URLs, crawled again even if
+                they were seen before. Defaults to none.
+            max_depth (int, optional): Links followed away from the seeds.
+                Defaults to 2.
+            max_pages (int, optional): Stop queueing links after this many URLs.
+                Defaults to None.
+            same_host (bool, optional): Only follow links to the hosts of the seeds,
+                or to the hosts already in the frontier when resuming. Defaults to True.
+
+        Returns:
+            dict: The crawl report, see `stats`.
+        """
+        if self.running:
+            raise RuntimeError("A crawl is already running")
+        frontier = self.frontier
+        seeds = [url for url in map(normalize_url, seeds) if url]
+        hosts = {urlsplit(url).netloc for url in seeds} or set(frontier.hosts())
+        active = 0
+
+        def enqueue(links: List[str], depth: int) -> None:
+            for url in map(normalize_url, links):
+                if url is None or (same_host and urlsplit(url).netloc not in hosts):
+                    continue
+                if max_pages is not None and self.queued >= max_pages:
+                    return
+                if frontier.push(url, depth, priority=depth):
+                    self.queued += 1
+
+        async def worker() -> None:
+            nonlocal active
+            while not self._stopping:
+                entry = await self._frontier(frontier.pop)
+                if entry is None:
+                    if active == 0:
+                        return
+                    # Pages in flight may still add links.
+                    await asyncio.sleep(0.05)
+                    continue
+                entry_id, url, depth = entry
+                active += 1
+                try:
+                    page = await self.fetch(url)
+                    if page is not None:
+                        document, links = page
+                        # Redirects land on URLs that must not be fetched again.
+                        await self._frontier(
+                            frontier.seen.add, url_key(document["url"])
+                        )
+                        CRAWL_PAGES.inc(result="indexed")
+                        await self._emit(document)
+                        if depth < max_depth:
+                            await self._frontier(enqueue, links, depth + 1)
+                except Exception as e:
+                    logger.exception(f"Crawling {url} failed: {e!r}")
+                    self.errors += 1
+                finally:
+                    await self._frontier(frontier.done, entry_id)
+                    active -= 1
+
+        self._reset_counters()
+        self.started = time.monotonic()
+        self._stopping = False
+        self.running = True
+        limits = httpx.Limits(
+            max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+        )
+        self._client = httpx.AsyncClient(
+            limits=limits,
+            timeout=self.timeout,
+            follow_redirects=True,
+            headers={"User-Agent": self.user_agent},
+        )
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="yose-frontier")
+        try:
+            for url in seeds:
+                await self._frontier(frontier.push, url, 0, 0, True)
+                self.queued += 1
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            await self._emit(None)
+        finally:
+            await self._frontier(frontier.flush)
+            self._executor.shutdown()
+            self._executor = None
+            await self._client.aclose()
+            self._client = None
+            self.running = False
+
+        report = self.stats()
+        logger.info(f"Crawl finished: {report}")
+        return report
+
+    def stop(self) -> None:
+        """Stop the running crawl, the pages being fetched are finished first."""
+        self._stopping = True
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the current (or last) crawl.
+
+        Returns:
+            dict: queued, fetched, indexed, skipped, blocked, errors, bytes, seconds
+            and pages_per_minute.
+        """
+        seconds = time.monotonic() - self.started if self.started else 0.0
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "fetched": self.fetched,
+            "indexed": self.indexed,
+            "skipped": self.skipped,
+            "blocked": self.blocked,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "seconds": round(seconds, 2),
+            "pages_per_minute": (
+                round(self.fetched / seconds * 60, 1) if seconds else 0.0
+            ),
+        }
+
+
+web_crawler = WebCrawler()
+
+
+async def _crawl_and_index(args: argparse.Namespace) -> dict:
+    crawler = WebCrawler(
+        concurrency=args.concurrency,
+        per_host_concurrency=args.per_host,
+        politeness_delay=args.delay,
+        obey_robots=not args.ignore_robots,
+    )
+    ingestion_queue.start()
+    try:
+        return await crawler.crawl(
+            args.urls,
+            max_depth=args.depth,
+            max_pages=args.max_pages,
+            same_host=not args.any_host,
+        )
+    finally:
+        await ingestion_queue.stop()
+        crawler.frontier.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("urls", nargs="*", help="start URLs, none to resume")
+    parser.add_argument("--depth", type=int, default=2, help="links to follow")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=64, help="worker tasks")
+    parser.add_argument("--per-host", type=int, default=2, help="requests per host")
+    parser.add_argument("--delay", type=float, default=1.0, help="seconds per host")
+    parser.add_argument("--any-host", action="store_true", help="leave seed hosts")
+    parser.add_argument("--ignore-robots", action="store_true")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(_crawl_and_index(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
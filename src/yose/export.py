@@ -0,0 +1,212 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+from loguru import logger
+
+from yose.bulk import iter_dump_file
+from yose.config.db.Model import IndexItems
+from yose.index_manager import index_manager
+from yose.utils import coerce_document, make_document_index, update_documents
+
+Progress = Optional[Callable[[int, int], None]]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _manifest_path(prefix: str) -> str:
+    return f"{prefix}.manifest.json"
+
+
+def _read_manifest(prefix: str) -> Optional[dict]:
+    path = _manifest_path(prefix)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_manifest(prefix: str, manifest: dict) -> None:
+    # Write then rename, so an interrupted export never leaves a broken manifest.
+    path = _manifest_path(prefix)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_index(
+    prefix: str,
+    indexname: str = "documents",
+    schema=IndexItems,
+    chunk_size: int = 100000,
+    progress: Progress = None,
+) -> dict:
+    """
+    Export the stored documents of an index to gzipped JSONL chunk files.
+
+    Documents are read one at a time in docnum order, so memory use does not depend
+    on the size of the index. Every `chunk_size` documents the current file is closed
+    and recorded in a manifest (`<prefix>.manifest.json`); calling the function again
+    with the same prefix resumes after the last complete chunk, as long as the index
+    has not been written to in the meantime.
+
+    Args:
+        prefix (str): Path prefix of the files, e.g. "exports/documents". Chunks are
+            written to `<prefix>-00000.jsonl.gz`, `<prefix>-00001.jsonl.gz`, ...
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+        chunk_size (int, optional): Documents per chunk file. Defaults to 100000.
+        progress (Callable[[int, int], None], optional): Called with the number of
+            documents exported so far and the total. Defaults to None.
+
+    Returns:
+        dict: The manifest, listing the chunk files and their document counts.
+
+    Raises:
+        ValueError: If resuming an export of an index that changed since it started.
+    """
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with index_manager.searcher(indexname, schema) as searcher:
+        reader = searcher.reader()
+        generation = reader.generation()
+        total = reader.doc_count()
+
+        manifest = _read_manifest(prefix)
+        if manifest is None:
+            manifest = {
+                "indexname": indexname,
+                "generation": generation,
+                "documents": total,
+                "chunks": [],
+                "complete": False,
+            }
+        elif manifest["complete"]:
+            return manifest
+        elif manifest["generation"] != generation:
+            raise ValueError(
+                f"Index {indexname!r} changed since the export to {prefix!r} started, "
+                f"remove {_manifest_path(prefix)} to start over"
+            )
+
+        chunks = manifest["chunks"]
+        first_docnum = chunks[-1]["last_docnum"] + 1 if chunks else 0
+        exported = sum(chunk["documents"] for chunk in chunks)
+        if chunks:
+            logger.info(f"Resuming export of {indexname!r} after {exported} documents")
+
+        stream = None
+        count = 0
+        last_docnum = -1
+
+        def close_chunk():
+            stream.close()
+            filename = f"{os.path.basename(prefix)}-{len(chunks):05d}.jsonl.gz"
+            os.replace(f"{prefix}.partial", os.path.join(directory, filename))
+            chunks.append(
+                {"file": filename, "documents": count, "last_docnum": last_docnum}
+            )
+            _write_manifest(prefix, manifest)
+
+        for docnum in reader.all_doc_ids():
+            if docnum < first_docnum:
+                continue
+            if stream is None:
+                stream = gzip.open(f"{prefix}.partial", "wt", encoding="utf-8")
+                count = 0
+
+            fields = reader.stored_fields(docnum)
+            stream.write(json.dumps(fields, default=_json_default) + "\n")
+            count += 1
+            exported += 1
+            last_docnum = docnum
+
+            if count >= chunk_size:
+                close_chunk()
+                stream = None
+            if progress is not None and exported % 1000 == 0:
+                progress(exported, total)
+
+        if stream is not None:
+            close_chunk()
+
+    manifest["complete"] = True
+    _write_manifest(prefix, manifest)
+    if progress is not None:
+        progress(exported, total)
+    logger.info(f"Exported {exported} documents of {indexname!r} to {prefix!r}")
+    return manifest
+
+
+def iter_export(prefix: str) -> Iterator[dict]:
+    """
+    Stream the documents of an export made by export_index.
+
+    Args:
+        prefix (str): The prefix the export was made with.
+
+    Yields:
+        dict: The stored fields of each exported document, as decoded from JSON.
+    """
+    manifest = _read_manifest(prefix)
+    if manifest is None:
+        raise FileNotFoundError(f"No export manifest at {_manifest_path(prefix)}")
+
+    directory = os.path.dirname(prefix)
+    for chunk in manifest["chunks"]:
+        yield from iter_dump_file(os.path.join(directory, chunk["file"]))
+
+
+def import_index(
+    prefix: str,
+    indexname: str = "documents",
+    schema=IndexItems,
+    batch_size: int = 1000,
+    progress: Progress = None,
+) -> int:
+    """
+    Import an export made by export_index through the bulk ingestion path.
+
+    Documents are streamed from the chunk files and written with update_documents,
+    so importing the same export twice, or again after an interruption, replaces
+    documents instead of duplicating them.
+
+    Args:
+        prefix (str): The prefix the export was made with.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema used if the index does not exist.
+            Defaults to IndexItems.
+        batch_size (int, optional): Documents per commit. Defaults to 1000.
+        progress (Callable[[int, int], None], optional): Called with the number of
+            documents imported so far and the total. Defaults to None.
+
+    Returns:
+        int: The number of documents imported.
+    """
+    manifest = _read_manifest(prefix)
+    if manifest is None:
+        raise FileNotFoundError(f"No export manifest at {_manifest_path(prefix)}")
+    total = sum(chunk["documents"] for chunk in manifest["chunks"])
+    ix_schema = make_document_index(indexname=indexname, schema=schema).schema
+
+    def documents():
+        for done, fields in enumerate(iter_export(prefix), 1):
+            yield coerce_document(fields, ix_schema)
+            if progress is not None and done % 1000 == 0:
+                progress(done, total)
+
+    count = update_documents(
+        documents(), indexname=indexname, schema=schema, batch_size=batch_size
+    )
+    if progress is not None:
+        progress(count, total)
+    logger.info(f"Imported {count} documents from {prefix!r} into {indexname!r}")
+    return count
@@ -0,0 +1,195 @@
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from whoosh.query import Query
+from whoosh.searching import Searcher
+
+from yose.filters import Where, filter_cache, index_state, normalize
+from yose.metrics import metrics
+
+FACET_FIELDS = ["host", "ext", "language", "content_type", "category", "year"]
+
+FACETS = metrics.histogram("yose_facets_seconds", "Time spent counting facets.")
+
+# {fieldname: values}, documents must have one of the values of every field.
+Filters = Dict[str, Iterable]
+
+
+def as_where(filters: Optional[Filters]) -> Where:
+    """Return drill-down filters as `yose.filters` conditions."""
+    return {name: list(values) for name, values in (filters or {}).items() if values}
+
+
+class _SegmentColumn:
+    """The values of one column of one segment as ordinals into a value list."""
+
+    def __init__(self, reader, fieldname: str) -> None:
+        # Ordinal 0 stands for documents without a value.
+        self.values: List = [None]
+        ordinals: Dict[Hashable, int] = {}
+        self.ordinals = array("I")
+        for value in reader.column_reader(fieldname):
+            if value in ("", None, b"", 0):
+                self.ordinals.append(0)
+                continue
+            ordinal = ordinals.get(value)
+            if ordinal is None:
+                ordinal = ordinals[value] = len(self.values)
+                self.values.append(value)
+            self.ordinals.append(ordinal)
+
+
+class FacetCounter:
+    """
+    Per-query facet counts read from column readers.
+
+    Segments never change once written, so the columns of the facet fields are
+    loaded once per segment into arrays of value ordinals: a commit only costs
+    the loading of its new segment. Counting looks up the ordinal of each
+    matching document in those arrays, no stored fields are read and no hits
+    are built. Drill-down filters are per segment bitsets of `filter_cache`,
+    and counts are cached per `index_state`.
+
+    Usage:
+        >>> with index_manager.searcher("documents", IndexItems) as searcher:
+        ...     counts = facet_counter.counts(searcher, query, {"language": ["en"]})
+    """
+
+    def __init__(
+        self,
+        fields: List[str] = FACET_FIELDS,
+        max_values: int = 10,
+        cache_size: int = 256,
+    ) -> None:
+        """
+        Args:
+            fields (list, optional): The facet fields, they need a column.
+                Defaults to FACET_FIELDS.
+            max_values (int, optional): Values returned per facet. Defaults to 10.
+            cache_size (int, optional): Counts kept. Defaults to 256.
+        """
+        self.fields = fields
+        self.max_values = max_values
+        self.cache_size = cache_size
+        self._columns: Dict[Tuple[str, str], _SegmentColumn] = {}
+        self._counts: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._segments: Set[str] = set()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _leaves(self, searcher: Searcher) -> List[Tuple[Searcher, int, str]]:
+        leaves = filter_cache.leaves(searcher)
+        segments = {segment for _, _, segment in leaves}
+        with self._lock:
+            if segments != self._segments:
+                # Drop the columns of merged away segments.
+                gone = self._segments - segments
+                for key in [key for key in self._columns if key[0] in gone]:
+                    del self._columns[key]
+                self._segments = segments
+        return leaves
+
+    def _column(self, leaf: Searcher, segment: str, fieldname: str):
+        key = (segment, fieldname)
+        with self._lock:
+            column = self._columns.get(key)
+            if column is None:
+                reader = leaf.reader()
+                if not reader.has_column(fieldname):
+                    return None
+                column = self._columns[key] = _SegmentColumn(reader, fieldname)
+            return column
+
+    def counts(
+        self,
+        searcher: Searcher,
+        query: Query,
+        filters: Optional[Filters] = None,
+        where: Optional[Where] = None,
+    ) -> Dict[str, List[Tuple[object, int]]]:
+        """
+        Count the values of the facet fields among the documents matching a query.
+
+        The counts of each field are taken with the filters of the other fields
+        only, so the values of a field stay selectable after one was picked.
+
+        Args:
+            searcher (Searcher): A searcher of the index.
+            query (Query): The parsed query.
+            filters (dict, optional): Drill-down filters, {fieldname: values}.
+                Documents must have one of the values of each field.
+            where (dict, optional): Other conditions every counted document
+                meets, see `yose.filters`.
+
+        Returns:
+            dict: For each facet field with a column, its most frequent values as
+            (value, count) pairs.
+        """
+        selected = normalize(as_where(filters))
+        key = (index_state(searcher), query, selected, normalize(where))
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        with FACETS.time():
+            totals = {fieldname: Counter() for fieldname in self.fields}
+            for leaf, _, segment in self._leaves(searcher):
+                matching = list(leaf.docs_for_query(query))
+                if not matching:
+                    continue
+                for fieldname in self.fields:
+                    column = self._column(leaf, segment, fieldname)
+                    if column is None:
+                        continue
+                    others = {
+                        name: values
+                        for name, values in as_where(filters).items()
+                        if name != fieldname
+                    }
+                    allowed = filter_cache.segment_bitset(
+                        leaf, segment, normalize(where, as_where(others))
+                    )
+                    docs = (
+                        matching
+                        if allowed is None
+                        else [doc for doc in matching if doc in allowed]
+                    )
+                    ordinals = Counter(map(column.ordinals.__getitem__, docs))
+                    ordinals.pop(0, None)
+                    for ordinal, count in ordinals.items():
+                        totals[fieldname][column.values[ordinal]] += count
+
+            result = {
+                fieldname: counter.most_common(self.max_values)
+                for fieldname, counter in totals.items()
+                if counter
+            }
+        with self._lock:
+            self._counts[key] = result
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+            return result
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: cached columns, count cache hits and misses.
+        """
+        return {
+            "columns": len(self._columns),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+facet_counter = FacetCounter()
+metrics.gauge("yose_facets", "Facet counter caches.", facet_counter.stats)
@@ -0,0 +1,294 @@
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from whoosh.fields import DATETIME
+from whoosh.idsets import BitSet
+from whoosh.query import DateRange, NumericRange, Or, Query, Term
+from whoosh.searching import Searcher
+
+from yose.metrics import metrics
+
+# {fieldname: condition}, a document must meet every condition:
+#   True / False     a boolean flag, documents without the flag count as False
+#   (low, high)      a numeric or date range, inclusive, None leaves a side open
+#   [a, b, ...]      one of the values
+#   a                the value
+Where = Dict[str, object]
+
+# Soft-deleted documents are hidden unless a search asks for them.
+DEFAULT_WHERE: Where = {"is_deleted": False}
+
+FILTER_BUILD = metrics.histogram(
+    "yose_filter_build_seconds", "Time spent building filter bitsets."
+)
+
+Clause = Tuple[str, object]
+
+
+def normalize(*wheres: Optional[Where]) -> Tuple[Clause, ...]:
+    """
+    Turn filter dictionaries into one hashable, ordered tuple of clauses.
+
+    Conditions on the same field from several dictionaries must all be met.
+
+    Args:
+        wheres (dict): {fieldname: condition} dictionaries, None is skipped.
+
+    Returns:
+        tuple: (fieldname, condition) clauses, conditions being a bool,
+        ("range", low, high) or ("in", frozenset).
+    """
+    clauses = set()
+    for where in wheres:
+        for fieldname, condition in (where or {}).items():
+            if isinstance(condition, bool):
+                clauses.add((fieldname, condition))
+            elif isinstance(condition, tuple) and len(condition) == 2:
+                clauses.add((fieldname, ("range",) + condition))
+            elif isinstance(condition, (list, set, frozenset)):
+                clauses.add((fieldname, ("in", frozenset(condition))))
+            else:
+                clauses.add((fieldname, ("in", frozenset([condition]))))
+    return tuple(sorted(clauses, key=lambda clause: (clause[0], repr(clause[1]))))
+
+
+def index_state(searcher: Searcher) -> Tuple[Tuple[str, int], ...]:
+    """
+    Identify the documents a searcher sees, for cache keys.
+
+    Segment ids are random and never reused, so unlike the generation, which
+    starts over when an index is recreated and is the same in unrelated indexes,
+    they tell indexes and their versions apart. Deletions are counted in too.
+
+    Returns:
+        tuple: (segment id, deleted document count) of each segment.
+    """
+    return tuple(
+        (segment.segment_id(), segment.deleted_count())
+        for segment in (
+            leaf.reader().segment() for leaf, _ in searcher.leaf_searchers()
+        )
+        if segment is not None
+    )
+
+
+def _bits(docs: Iterable[int], doccount: int) -> int:
+    # A bitset of local document numbers as an int, bit n set for document n.
+    packed = bytearray((doccount + 7) // 8)
+    for doc in docs:
+        packed[doc >> 3] |= 1 << (doc & 7)
+    return int.from_bytes(packed, "little")
+
+
+def _to_bitset(bits: int, doccount: int) -> BitSet:
+    bitset = BitSet()
+    bitset.bits = array("B", bits.to_bytes((doccount + 7) // 8, "little"))
+    return bitset
+
+
+class FilterCache:
+    """
+    Compiled search filters, cached as doc-id bitsets per segment.
+
+    Every clause of a filter is compiled once per segment into a bitset of the
+    segment's documents, from the column of the field when it has one and from
+    its postings otherwise. Segments never change once written, so those
+    bitsets are reused by every later query until the segment is merged away;
+    a commit only costs compiling the clauses for its new segment. A filter is
+    the AND of its clause bitsets, and the bitsets of all segments are shifted
+    into one `BitSet` of global document numbers that `Searcher.search` takes as
+    its `filter`, cached per `index_state`.
+
+    Whoosh ignores a filter that is empty, so a caller getting an empty
+    `BitSet` must not search at all: nothing can match.
+
+    Hiding soft-deleted documents, DEFAULT_WHERE, is thus one cached bitset
+    ANDed with the others, and no subquery runs at search time.
+
+    Usage:
+        >>> with index_manager.searcher("documents", IndexItems) as searcher:
+        ...     allowed = filter_cache.bitset(
+        ...         searcher, normalize(DEFAULT_WHERE, {"year": (2020, None)})
+        ...     )
+        ...     results = searcher.search(query, filter=allowed)
+    """
+
+    def __init__(self, cache_size: int = 512) -> None:
+        """
+        Args:
+            cache_size (int, optional): Clause bitsets and combined bitsets kept
+                each. Defaults to 512.
+        """
+        self.cache_size = cache_size
+        self._clauses: "OrderedDict[tuple, int]" = OrderedDict()
+        self._segment_bitsets: "OrderedDict[tuple, BitSet]" = OrderedDict()
+        self._bitsets: "OrderedDict[tuple, BitSet]" = OrderedDict()
+        self._segments: Set[str] = set()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cache(self, cache: OrderedDict, key: tuple, value):
+        cache[key] = value
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def leaves(self, searcher: Searcher) -> List[Tuple[Searcher, int, str]]:
+        """
+        Return the segments of a searcher, forgetting those merged away.
+
+        Returns:
+            list: (leaf searcher, document number offset, segment id) tuples.
+        """
+        leaves = [
+            (leaf, offset, leaf.reader().segment().segment_id())
+            for leaf, offset in searcher.leaf_searchers()
+            # An empty index has a reader without segments.
+            if leaf.reader().segment() is not None
+        ]
+        segments = {segment for _, _, segment in leaves}
+        with self._lock:
+            if segments != self._segments:
+                gone = self._segments - segments
+                for cache in (self._clauses, self._segment_bitsets):
+                    for key in [key for key in cache if key[0] in gone]:
+                        del cache[key]
+                self._segments = segments
+        return leaves
+
+    def _compile(self, leaf: Searcher, fieldname: str, condition) -> int:
+        reader = leaf.reader()
+        doccount = reader.doc_count_all()
+        if fieldname not in leaf.schema:
+            # No document has the field, so none has the flag either.
+            return ((1 << doccount) - 1) if condition is False else 0
+
+        if isinstance(condition, bool):
+            flagged = _bits(leaf.docs_for_query(Term(fieldname, True)), doccount)
+            return flagged if condition else ((1 << doccount) - 1) & ~flagged
+
+        kind = condition[0]
+        if reader.has_column(fieldname):
+            values = reader.column_reader(fieldname)
+            if kind == "range":
+                _, low, high = condition
+                docs = (
+                    doc
+                    for doc, value in enumerate(values)
+                    if value is not None
+                    and (low is None or value >= low)
+                    and (high is None or value <= high)
+                )
+            else:
+                wanted = condition[1]
+                docs = (doc for doc, value in enumerate(values) if value in wanted)
+            return _bits(docs, doccount)
+
+        if kind == "range":
+            _, low, high = condition
+            if isinstance(leaf.schema[fieldname], DATETIME):
+                q: Query = DateRange(fieldname, low, high)
+            else:
+                q = NumericRange(fieldname, low, high)
+        else:
+            q = Or([Term(fieldname, value) for value in condition[1]])
+        return _bits(leaf.docs_for_query(q), doccount)
+
+    def _clause(self, leaf: Searcher, segment: str, clause: Clause) -> int:
+        key = (segment, clause)
+        with self._lock:
+            bits = self._clauses.get(key)
+            if bits is not None:
+                self._clauses.move_to_end(key)
+                return bits
+        with FILTER_BUILD.time():
+            bits = self._compile(leaf, *clause)
+        with self._lock:
+            return self._cache(self._clauses, key, bits)
+
+    def _segment_bits(self, leaf: Searcher, segment: str, clauses: tuple) -> int:
+        doccount = leaf.reader().doc_count_all()
+        bits = (1 << doccount) - 1
+        for clause in clauses:
+            bits &= self._clause(leaf, segment, clause)
+            if not bits:
+                break
+        return bits
+
+    def segment_bitset(
+        self, leaf: Searcher, segment: str, clauses: tuple
+    ) -> Optional[BitSet]:
+        """
+        Return the documents of one segment meeting every clause.
+
+        Args:
+            leaf (Searcher): The searcher of the segment, see `leaves`.
+            segment (str): The segment id.
+            clauses (tuple): Clauses from `normalize`.
+
+        Returns:
+            BitSet or None: Local document numbers, None if there are no clauses.
+        """
+        if not clauses:
+            return None
+        key = (segment, clauses)
+        with self._lock:
+            bitset = self._segment_bitsets.get(key)
+            if bitset is not None:
+                self._segment_bitsets.move_to_end(key)
+                return bitset
+        bitset = _to_bitset(
+            self._segment_bits(leaf, segment, clauses), leaf.reader().doc_count_all()
+        )
+        with self._lock:
+            return self._cache(self._segment_bitsets, key, bitset)
+
+    def bitset(self, searcher: Searcher, clauses: tuple) -> Optional[BitSet]:
+        """
+        Return the documents of the index meeting every clause, for `Searcher.search`.
+
+        Args:
+            searcher (Searcher): A searcher of the index.
+            clauses (tuple): Clauses from `normalize`.
+
+        Returns:
+            BitSet or None: Global document numbers, None if there are no clauses.
+            An empty BitSet means no document meets them.
+        """
+        if not clauses:
+            return None
+        key = (index_state(searcher), clauses)
+        with self._lock:
+            bitset = self._bitsets.get(key)
+            if bitset is not None:
+                self._bitsets.move_to_end(key)
+                self.hits += 1
+                return bitset
+            self.misses += 1
+
+        bits = 0
+        for leaf, offset, segment in self.leaves(searcher):
+            bits |= self._segment_bits(leaf, segment, clauses) << offset
+        bitset = _to_bitset(bits, searcher.reader().doc_count_all())
+        with self._lock:
+            return self._cache(self._bitsets, key, bitset)
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: cached clause bitsets, combined bitset hits and misses.
+        """
+        return {
+            "clauses": len(self._clauses),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+filter_cache = FilterCache()
+metrics.gauge("yose_filters", "Filter bitset caches.", filter_cache.stats)
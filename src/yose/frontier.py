@@ -0,0 +1,437 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Tuple
+from urllib.parse import urldefrag, urlsplit, urlunsplit
+
+from loguru import logger
+
+from yose.corpus import urlhash
+from yose.metrics import metrics
+
+
+def url_key(url: str) -> str:
+    """
+    Return the key of a URL in the seen set.
+
+    It is the url hash of the URL without its fragment and with a lowercase scheme
+    and host, whoever marks the URL as seen. YaCy's own url hashes are computed
+    differently and are never used as keys.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The key.
+    """
+    parts = urlsplit(urldefrag(url.strip())[0])
+    return urlhash(
+        urlunsplit(
+            parts._replace(scheme=parts.scheme.lower(), netloc=parts.netloc.lower())
+        )
+    )
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over string keys.
+
+    With the default 1% error rate it needs about 9.6 bits per key, 60 MB for
+    50 million keys.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        """
+        Args:
+            capacity (int): The number of keys the filter is sized for.
+            error_rate (float, optional): False positive rate at capacity.
+                Defaults to 0.01.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Double hashing, two 64 bit halves of one digest give all the positions.
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class SeenSet:
+    """
+    Set of url keys with an in-memory Bloom filter in front of an exact SQLite set.
+
+    Keys the filter has never seen are known to be new without touching the disk,
+    only possible duplicates are looked up in SQLite. The filter is saved next to
+    the database on `close` and rebuilt from the database if that file is missing,
+    so it survives restarts either way.
+
+    Whatever must be on disk before a key is, like the frontier the URL was queued
+    in, registers a `commit_first` callback, called before every commit.
+
+    Usage:
+        >>> if seen_urls.add(url_key(url)):
+        ...     frontier.push(url)
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join("db", "seen.sqlite"),
+        capacity: int = 50_000_000,
+        error_rate: float = 0.01,
+        commit_every: int = 1000,
+    ) -> None:
+        """
+        Args:
+            path (str, optional): The SQLite file. Defaults to "db/seen.sqlite".
+            capacity (int, optional): Expected number of keys, sizes the Bloom
+                filter. Defaults to 50 million (about 60 MB of memory).
+            error_rate (float, optional): Bloom filter false positive rate.
+                Defaults to 0.01.
+            commit_every (int, optional): Inserts between two commits. Defaults to 1000.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.commit_every = commit_every
+        self._db: Optional[sqlite3.Connection] = None
+        self._bloom: Optional[BloomFilter] = None
+        self._pending = 0
+        self._lock = threading.RLock()
+        self._commit_first: List[Callable[[], None]] = []
+        self.disk_lookups = 0
+        self.false_positives = 0
+
+    @property
+    def bloom_path(self) -> str:
+        return self.path + ".bloom"
+
+    def _open(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS seen (urlhash TEXT PRIMARY KEY) WITHOUT ROWID"
+            )
+            self._bloom = self._load_bloom()
+        return self._db
+
+    def _load_bloom(self) -> BloomFilter:
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        if os.path.exists(self.bloom_path):
+            with open(self.bloom_path, "rb") as f:
+                bits = f.read()
+            if len(bits) == len(bloom.bits):
+                bloom.bits = bytearray(bits)
+                # The file is only valid until the next insert, a crash would
+                # otherwise leave a filter missing keys.
+                os.remove(self.bloom_path)
+                return bloom
+        count = 0
+        for (key,) in self._db.execute("SELECT urlhash FROM seen"):
+            bloom.add(key)
+            count += 1
+        if count:
+            logger.debug(f"Rebuilt the seen URL filter from {count} url hashes")
+        return bloom
+
+    def add(self, key: str) -> bool:
+        """
+        Add a url hash.
+
+        Args:
+            key (str): The url hash.
+
+        Returns:
+            bool: True if the key was not in the set yet.
+        """
+        with self._lock:
+            db = self._open()
+            maybe_seen = key in self._bloom
+            if maybe_seen:
+                self.disk_lookups += 1
+            cursor = db.execute("INSERT OR IGNORE INTO seen VALUES (?)", (key,))
+            added = cursor.rowcount == 1
+            if added:
+                if maybe_seen:
+                    self.false_positives += 1
+                self._bloom.add(key)
+                self._pending += 1
+                if self._pending >= self.commit_every:
+                    self.flush()
+            return added
+
+    def add_many(self, keys: Iterable[str]) -> int:
+        """Add several url hashes, returning how many were new."""
+        with self._lock:
+            return sum(self.add(key) for key in keys)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._open()
+            if key not in self._bloom:
+                return False
+            self.disk_lookups += 1
+            row = self._db.execute(
+                "SELECT 1 FROM seen WHERE urlhash = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.false_positives += 1
+            return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._open().execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def commit_first(self, callback: Callable[[], None]) -> None:
+        """
+        Call `callback` before every commit of the set, under the set's lock.
+
+        Args:
+            callback (Callable[[], None]): Commits what the keys depend on.
+        """
+        self._commit_first.append(callback)
+
+    def _commit(self) -> None:
+        for callback in self._commit_first:
+            callback()
+        self._db.commit()
+        self._pending = 0
+
+    def flush(self) -> None:
+        """Commit the pending inserts."""
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+
+    def clear(self) -> None:
+        """Forget every url hash."""
+        with self._lock:
+            self._open().execute("DELETE FROM seen")
+            self._db.commit()
+            self._bloom = BloomFilter(self.capacity, self.error_rate)
+            self._pending = 0
+
+    def close(self) -> None:
+        """Commit, save the Bloom filter and close the database."""
+        with self._lock:
+            if self._db is None:
+                return
+            self._commit()
+            self._db.close()
+            self._db = None
+            with open(self.bloom_path, "wb") as f:
+                f.write(self._bloom.bits)
+            self._bloom = None
+
+    def stats(self) -> dict:
+        """
+        Return the lookup counters.
+
+        Returns:
+            dict: disk_lookups and false_positives of the Bloom filter.
+        """
+        return {
+            "disk_lookups": self.disk_lookups,
+            "false_positives": self.false_positives,
+        }
+
+
+class Frontier:
+    """
+    Persistent crawl frontier with a priority queue per host.
+
+    URLs wait in SQLite, so the frontier can grow far beyond memory and a crawl
+    can be resumed after a restart. `pop` takes the hosts in turn, so concurrent
+    fetches spread over as many hosts as possible instead of queueing behind one
+    host's politeness delay. A popped URL stays in the database until `done` is
+    called for it, URLs still in flight when the process stops are handed out
+    again on the next start.
+
+    URLs are deduplicated on their `url_key` with a `SeenSet`, a URL is only ever
+    pushed once unless `force` is given. The frontier is committed before the
+    seen set every time, whoever commits it, so a crash can at worst queue a URL
+    twice but never mark one as seen that was not queued.
+
+    Usage:
+        >>> crawl_frontier.push("https://example.org/", force=True)
+        >>> entry = crawl_frontier.pop()
+        >>> crawl_frontier.done(entry[0])
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join("db", "frontier.sqlite"),
+        seen: Optional[SeenSet] = None,
+        commit_every: int = 1000,
+    ) -> None:
+        """
+        Args:
+            path (str, optional): The SQLite file. Defaults to "db/frontier.sqlite".
+            seen (SeenSet, optional): The seen URL set. Defaults to `seen_urls`.
+            commit_every (int, optional): Changes between two commits. Defaults to 1000.
+        """
+        self.path = path
+        self.seen = seen if seen is not None else seen_urls
+        self.commit_every = commit_every
+        self._db: Optional[sqlite3.Connection] = None
+        self._hosts: "OrderedDict[str, int]" = OrderedDict()
+        self._pending = 0
+        # One lock for both, the seen set commits the frontier under its own.
+        self._lock = self.seen._lock
+        self.seen.commit_first(self._commit)
+
+    def _open(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS frontier ("
+                "id INTEGER PRIMARY KEY, host TEXT NOT NULL, priority INTEGER NOT NULL,"
+                " depth INTEGER NOT NULL, url TEXT NOT NULL, leased INTEGER DEFAULT 0)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS frontier_next"
+                " ON frontier (host, leased, priority, id)"
+            )
+            # Whatever was in flight when the process stopped is due again.
+            self._db.execute("UPDATE frontier SET leased = 0 WHERE leased = 1")
+            self._db.commit()
+            self._hosts = OrderedDict(
+                self._db.execute(
+                    "SELECT host, COUNT(*) FROM frontier GROUP BY host ORDER BY MIN(id)"
+                )
+            )
+        return self._db
+
+    def _changed(self) -> None:
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    def push(
+        self, url: str, depth: int = 0, priority: int = 0, force: bool = False
+    ) -> bool:
+        """
+        Queue a URL, unless it was seen before.
+
+        Args:
+            url (str): The URL.
+            depth (int, optional): Links followed from a start URL. Defaults to 0.
+            priority (int, optional): Lower is fetched first within its host.
+                Defaults to 0.
+            force (bool, optional): Queue it even if it was seen, e.g. to recrawl
+                a start URL. Defaults to False.
+
+        Returns:
+            bool: True if the URL was queued.
+        """
+        with self._lock:
+            db = self._open()
+            if not self.seen.add(url_key(url)) and not force:
+                return False
+            host = urlsplit(url).netloc
+            db.execute(
+                "INSERT INTO frontier (host, priority, depth, url) VALUES (?, ?, ?, ?)",
+                (host, priority, depth, url),
+            )
+            self._hosts[host] = self._hosts.get(host, 0) + 1
+            self._changed()
+            return True
+
+    def pop(self) -> Optional[Tuple[int, str, int]]:
+        """
+        Take the next URL, from the next host in turn.
+
+        Returns:
+            tuple or None: (entry id, url, depth), or None if nothing is waiting.
+        """
+        with self._lock:
+            db = self._open()
+            for _ in range(len(self._hosts)):
+                host, waiting = self._hosts.popitem(last=False)
+                row = db.execute(
+                    "SELECT id, url, depth FROM frontier WHERE host = ? AND leased = 0"
+                    " ORDER BY priority, id LIMIT 1",
+                    (host,),
+                ).fetchone()
+                if row is None:
+                    continue
+                db.execute("UPDATE frontier SET leased = 1 WHERE id = ?", (row[0],))
+                if waiting > 1:
+                    self._hosts[host] = waiting - 1
+                self._changed()
+                return row
+            return None
+
+    def done(self, entry_id: int) -> None:
+        """Remove a popped URL for good, once it was fetched (or given up on)."""
+        with self._lock:
+            self._open().execute("DELETE FROM frontier WHERE id = ?", (entry_id,))
+            self._changed()
+
+    def hosts(self) -> List[str]:
+        """Return the hosts with URLs waiting."""
+        with self._lock:
+            self._open()
+            return list(self._hosts)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._open()
+            return sum(self._hosts.values())
+
+    def _commit(self) -> None:
+        if self._db is not None:
+            self._db.commit()
+            self._pending = 0
+
+    def flush(self) -> None:
+        """Commit the pending changes, and those of the seen set."""
+        with self._lock:
+            self._commit()
+            self.seen.flush()
+
+    def clear(self) -> None:
+        """Drop every waiting URL. The seen set is kept."""
+        with self._lock:
+            self._open().execute("DELETE FROM frontier")
+            self._db.commit()
+            self._hosts.clear()
+            self._pending = 0
+
+    def close(self) -> None:
+        """Commit and close the database, and the seen set."""
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+                self._hosts.clear()
+            self.seen.close()
+
+
+seen_urls = SeenSet()
+crawl_frontier = Frontier()
+metrics.gauge("yose_seen_urls", "Seen URL set lookup counters.", seen_urls.stats)
@@ -0,0 +1,187 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+from whoosh import index
+from whoosh.fields import Schema
+from whoosh.searching import Searcher
+
+from yose.metrics import INDEX_OPEN
+
+
+class _Lease:
+    """A shared searcher together with the number of queries currently using it."""
+
+    def __init__(self, searcher: Searcher) -> None:
+        self.searcher = searcher
+        self.refs = 0
+        self.retired = False
+
+
+class _ManagedIndex:
+    def __init__(self, ix: index.Index) -> None:
+        self.ix = ix
+        self.lease: Optional[_Lease] = None
+        self.stale = False
+        self.last_check = 0.0
+
+
+class IndexManager:
+    """
+    Keeps every named index open for the lifetime of the process and hands out
+    a shared searcher for each one.
+
+    The shared searcher is only replaced when a newer generation of the index has
+    been committed. The old searcher is closed as soon as the last query using it
+    is done, so queries in flight are never cut short.
+
+    Usage:
+        >>> with index_manager.searcher("documents", IndexItems) as searcher:
+        ...     results = searcher.search(query)
+    """
+
+    def __init__(self, dirname: str = "db", refresh_interval: float = 1.0) -> None:
+        """
+        Args:
+            dirname (str, optional): The directory the indexes live in. Defaults to "db".
+            refresh_interval (float, optional): How often, in seconds, to check the
+                index for commits made by other processes. Commits made through
+                `invalidate` are picked up immediately. Defaults to 1.0.
+        """
+        self.dirname = dirname
+        self.refresh_interval = refresh_interval
+        self._indexes: Dict[Tuple[str, str], _ManagedIndex] = {}
+        self._lock = threading.RLock()
+
+    def _managed(self, indexname: str, schema: Schema, dirname: str) -> _ManagedIndex:
+        key = (dirname, indexname)
+        managed = self._indexes.get(key)
+        if managed is None:
+            with INDEX_OPEN.time(kind="index"):
+                if index.exists_in(dirname, indexname=indexname):
+                    # The schema saved in the index wins over the one we were given,
+                    # so an index migrated to another schema profile keeps working.
+                    ix = index.open_dir(dirname, indexname=indexname)
+                else:
+                    ix = index.create_in(dirname, schema=schema, indexname=indexname)
+            managed = self._indexes[key] = _ManagedIndex(ix)
+        return managed
+
+    def get_index(
+        self, indexname: str, schema: Schema, dirname: Optional[str] = None
+    ) -> index.Index:
+        """
+        Return the open index with the given name, opening (or creating) it on first use.
+
+        Args:
+            indexname (str): The name of the index.
+            schema (Schema): The schema used to create the index if it does not exist.
+            dirname (str, optional): The index directory. Defaults to the manager's dirname.
+
+        Returns:
+            Index: The shared index object.
+        """
+        with self._lock:
+            return self._managed(indexname, schema, dirname or self.dirname).ix
+
+    def _acquire(self, managed: _ManagedIndex) -> _Lease:
+        lease = managed.lease
+        now = time.monotonic()
+
+        if lease is None:
+            lease = managed.lease = self._open_searcher(managed)
+            managed.last_check = now
+        elif managed.stale or now - managed.last_check >= self.refresh_interval:
+            managed.stale = False
+            managed.last_check = now
+            if not lease.searcher.up_to_date():
+                # Searcher.refresh() is not used on purpose: whoosh-reloaded keeps
+                # the segments of the reused reader even when they were merged
+                # away, which duplicates documents after an optimize.
+                self._retire(lease)
+                lease = managed.lease = self._open_searcher(managed)
+
+        lease.refs += 1
+        return lease
+
+    def _open_searcher(self, managed: _ManagedIndex) -> _Lease:
+        with INDEX_OPEN.time(kind="searcher"):
+            return _Lease(managed.ix.searcher())
+
+    def _retire(self, lease: _Lease) -> None:
+        lease.retired = True
+        if lease.refs == 0:
+            lease.searcher.close()
+
+    def _release(self, lease: _Lease) -> None:
+        lease.refs -= 1
+        if lease.retired and lease.refs == 0:
+            lease.searcher.close()
+
+    @contextmanager
+    def searcher(
+        self, indexname: str, schema: Schema, dirname: Optional[str] = None
+    ) -> Iterator[Searcher]:
+        """
+        Borrow the shared searcher of an index for the duration of a `with` block.
+
+        The searcher must not be closed by the caller, nor used after the block ends.
+
+        Args:
+            indexname (str): The name of the index.
+            schema (Schema): The schema used to create the index if it does not exist.
+            dirname (str, optional): The index directory. Defaults to the manager's dirname.
+
+        Yields:
+            Searcher: A searcher on an up to date generation of the index.
+        """
+        with self._lock:
+            managed = self._managed(indexname, schema, dirname or self.dirname)
+            lease = self._acquire(managed)
+        try:
+            yield lease.searcher
+        finally:
+            with self._lock:
+                self._release(lease)
+
+    def invalidate(self, indexname: str, dirname: Optional[str] = None) -> None:
+        """
+        Mark an index as changed so the next searcher request checks for a new generation.
+
+        Call this after committing a writer obtained from `get_index`.
+
+        Args:
+            indexname (str): The name of the index.
+            dirname (str, optional): The index directory. Defaults to the manager's dirname.
+        """
+        with self._lock:
+            managed = self._indexes.get((dirname or self.dirname, indexname))
+            if managed is not None:
+                managed.stale = True
+
+    def forget(self, indexname: str, dirname: Optional[str] = None) -> None:
+        """
+        Drop an index from the manager, e.g. after it was recreated from scratch.
+
+        Its searcher is closed immediately if unused, or once the last query finishes.
+
+        Args:
+            indexname (str): The name of the index.
+            dirname (str, optional): The index directory. Defaults to the manager's dirname.
+        """
+        with self._lock:
+            managed = self._indexes.pop((dirname or self.dirname, indexname), None)
+            if managed is not None and managed.lease is not None:
+                self._retire(managed.lease)
+
+    def close(self) -> None:
+        """Close every searcher and forget every index."""
+        with self._lock:
+            for dirname, indexname in list(self._indexes):
+                self.forget(indexname, dirname)
+        logger.debug("Closed all managed indexes")
+
+
+index_manager = IndexManager()
@@ -0,0 +1,264 @@
+import asyncio
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from loguru import logger
+
+from yose.config.db.Model import IndexItems
+from yose.dedup import ensure_fields, near_duplicates
+from yose.frontier import seen_urls, url_key
+from yose.metrics import metrics
+from yose.utils import coerce_document, make_document_index, update_documents
+
+
+def yacy_item_to_document(item: dict, schema=IndexItems) -> Optional[dict]:
+    """
+    Map a YaCy result item onto the fields of the document schema.
+
+    Keys that are not fields of the schema are dropped and values are converted to
+    the field types with `coerce_document`. YaCy uses the url hash as `guid`, so
+    each one is used to fill the other when missing.
+
+    Args:
+        item (dict): An item from `channels[0].items` of a YaCy answer.
+        schema (IndexItems, optional): The schema to map onto. Defaults to IndexItems.
+
+    Returns:
+        dict or None: The document, or None if it has neither a guid nor a urlhash.
+    """
+    fields = schema() if isinstance(schema, type) else schema
+    document = coerce_document(item, fields)
+
+    document.setdefault("guid", document.get("urlhash"))
+    document.setdefault("urlhash", document.get("guid"))
+    if not document["guid"]:
+        return None
+    return document
+
+
+class IngestionQueue:
+    """
+    Write-behind queue that indexes documents in the background.
+
+    Request handlers `offer` search results, which are mapped onto the document
+    schema, deduplicated on their guid and put on a bounded queue. A single writer
+    task drains the queue in batches and writes them with `update_documents` in a
+    worker thread, so no request ever waits for an index commit and there is never
+    more than one writer competing for the index lock. Each batch goes through
+    `near_duplicates` first, which clusters or drops near-duplicate documents.
+
+    Usage:
+        >>> app.on_startup(ingestion_queue.start)
+        >>> app.on_shutdown(ingestion_queue.stop)
+        >>> ingestion_queue.offer(results)
+    """
+
+    def __init__(
+        self,
+        indexname: str = "documents",
+        schema=IndexItems,
+        maxsize: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 5.0,
+        seen_size: int = 100000,
+    ) -> None:
+        """
+        Args:
+            indexname (str, optional): The index to write to. Defaults to "documents".
+            schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+            maxsize (int, optional): Maximum number of queued documents. Defaults to 10000.
+            batch_size (int, optional): Maximum documents per commit. Defaults to 500.
+            flush_interval (float, optional): Maximum seconds a queued document waits
+                before being committed. Defaults to 5.0.
+            seen_size (int, optional): Number of recently queued guids remembered for
+                deduplication. Defaults to 100000.
+        """
+        self.indexname = indexname
+        self.schema = schema
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.seen_size = seen_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._offers: set = set()
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.indexed = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        return self._queue
+
+    def _is_duplicate(self, document: dict) -> bool:
+        guid = document["guid"]
+        if guid in self._seen:
+            self._seen.move_to_end(guid)
+            self.duplicates += 1
+            return True
+        self._seen[guid] = None
+        while len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+        return False
+
+    def _schema(self):
+        # The schema the index was actually created with, which differs from
+        # self.schema once the index has been migrated to another profile. It is
+        # read from the index directory, so this runs off the event loop.
+        return make_document_index(self.indexname, self.schema).schema
+
+    def _documents(self, items: Iterable[dict], schema) -> List[dict]:
+        documents = []
+        for item in items:
+            document = yacy_item_to_document(item, schema)
+            if document is not None and not self._is_duplicate(document):
+                documents.append(document)
+        return documents
+
+    def offer(self, items: Iterable[dict]) -> asyncio.Task:
+        """
+        Queue result items in the background, dropping them if the queue is full.
+
+        This is what request handlers should use: it returns at once, and when the
+        writer falls behind, indexing is shed instead of slowing down searches.
+
+        Args:
+            items (Iterable[dict]): YaCy result items.
+
+        Returns:
+            Task: The task queueing them, its result is the number of documents
+            queued.
+        """
+        task = asyncio.ensure_future(self._offer(list(items)))
+        self._offers.add(task)
+        task.add_done_callback(self._offers.discard)
+        return task
+
+    async def _offer(self, items: List[dict]) -> int:
+        loop = asyncio.get_running_loop()
+        schema = await loop.run_in_executor(None, self._schema)
+        queued = 0
+        for document in self._documents(items, schema):
+            try:
+                self.queue.put_nowait(document)
+                queued += 1
+            except asyncio.QueueFull:
+                # Forget it so it can be offered again once there is room.
+                self._seen.pop(document["guid"], None)
+                self.dropped += 1
+        return queued
+
+    async def put(self, items: Iterable[dict]) -> int:
+        """
+        Queue result items, waiting for room when the queue is full.
+
+        Use this from background producers (imports, crawlers) that should be slowed
+        down to the pace of the writer.
+
+        Args:
+            items (Iterable[dict]): YaCy result items.
+
+        Returns:
+            int: The number of documents queued.
+        """
+        loop = asyncio.get_running_loop()
+        schema = await loop.run_in_executor(None, self._schema)
+        documents = self._documents(items, schema)
+        for document in documents:
+            await self.queue.put(document)
+        return len(documents)
+
+    async def _next_batch(self) -> List[dict]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _index(self, batch: List[dict]) -> List[dict]:
+        # Returns the documents written, near-duplicates may have been dropped.
+        if "cluster" not in self._schema():
+            ensure_fields(self.indexname, self.schema)
+        documents = near_duplicates.process(batch)
+        if documents:
+            update_documents(
+                documents,
+                indexname=self.indexname,
+                schema=self.schema,
+                batch_size=len(documents),
+            )
+        return documents
+
+    async def _write(self, batch: List[dict]) -> None:
+        loop = asyncio.get_running_loop()
+        written: Optional[List[dict]] = None
+        try:
+            written = await loop.run_in_executor(None, self._index, batch)
+            self.indexed += len(written)
+            # Lets the crawler know these URLs are indexed without asking the index.
+            urls = [document.get("url") or document.get("link") for document in written]
+            await loop.run_in_executor(
+                None, seen_urls.add_many, [url_key(url) for url in urls if url]
+            )
+        except Exception as e:
+            logger.error(f"Failed to index a batch of {len(batch)} documents: {e!r}")
+            if written is None:
+                # Nothing was written, so they can be offered again.
+                for document in batch:
+                    self._seen.pop(document["guid"], None)
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    async def run(self) -> None:
+        """Drain the queue forever, writing one batch at a time."""
+        while True:
+            await self._write(await self._next_batch())
+
+    def start(self) -> None:
+        """Start the writer task on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        """Write out everything still queued and stop the writer task."""
+        if self._task is None:
+            return
+        await asyncio.gather(*self._offers, return_exceptions=True)
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> dict:
+        """
+        Return the queue counters.
+
+        Returns:
+            dict: queued, indexed, duplicates and dropped document counts.
+        """
+        return {
+            "queued": self.queue.qsize(),
+            "indexed": self.indexed,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+        }
+
+
+ingestion_queue = IngestionQueue()
+metrics.gauge(
+    "yose_ingestion_queue", "Background ingestion counters.", ingestion_queue.stats
+)
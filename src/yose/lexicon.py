@@ -0,0 +1,61 @@
+import re
+from collections import Counter
+from typing import Iterable
+
+from whoosh.analysis import StemFilter
+from whoosh.searching import Searcher
+
+WORDS = re.compile(r"\w+", re.UNICODE)
+_WORD = re.compile(r"^\w+$", re.UNICODE)
+
+
+def _stems(field) -> bool:
+    # True if the terms of the field are stems rather than the words written.
+    analyzer = getattr(field, "analyzer", None)
+    return any(isinstance(item, StemFilter) for item in getattr(analyzer, "items", ()))
+
+
+def field_words(searcher: Searcher, fieldnames: Iterable[str]) -> Counter:
+    """
+    Count the documents each word of some fields appears in.
+
+    Columns hold the text as it was written, so sortable fields are read from
+    their column. The terms of stemmed fields are stems, "comput" for
+    "computer", so stored stemmed fields are read from the stored text instead,
+    in one pass over the stored documents. Other fields use their term
+    dictionary, which holds what the analyzer made of the text, and only terms
+    that are whole words are kept.
+
+    Args:
+        searcher (Searcher): A searcher of the index.
+        fieldnames (Iterable[str]): The fields, missing ones are skipped.
+
+    Returns:
+        Counter: Document frequency of each lowercased word.
+    """
+    frequencies = Counter()
+    reader = searcher.reader()
+    stored = []
+    for fieldname in fieldnames:
+        if fieldname not in searcher.schema:
+            continue
+        field = searcher.schema[fieldname]
+        if reader.has_column(fieldname):
+            for value in reader.column_reader(fieldname):
+                if value:
+                    frequencies.update(set(WORDS.findall(value.lower())))
+        elif field.stored and _stems(field):
+            stored.append(fieldname)
+        else:
+            for term, info in reader.iter_field(fieldname):
+                word = term.decode("utf-8") if isinstance(term, bytes) else term
+                if _WORD.match(word):
+                    frequencies[word.lower()] += info.doc_frequency()
+
+    if stored:
+        for _, fields in reader.iter_docs():
+            for fieldname in stored:
+                value = fields.get(fieldname)
+                if isinstance(value, str):
+                    frequencies.update(set(WORDS.findall(value.lower())))
+    return frequencies
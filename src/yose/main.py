@@ -1,21 +1,68 @@
-import asyncio
 import sys
-from typing import List
+from datetime import datetime
+from typing import Dict, List
 
-import requests
+from fastapi import Request, Response
+from fastapi.responses import PlainTextResponse
 from loguru import logger
-from nicegui import app, color, events, icon, ui
-
+from nicegui import app, color, events, icon, run, ui
+
+from yose.autocomplete import completion_table, query_log
+from yose.cache import search_cache
+from yose.config.db.Model import IndexItems
+from yose.crawler import web_crawler
+from yose.dedup import MODES, near_duplicates
+from yose.export import export_index, import_index
+from yose.frontier import crawl_frontier
+from yose.ingest import ingestion_queue
+from yose.merge import merge_scheduler
+from yose.metrics import PAGE_RENDER, Counter, Histogram, metrics, timed
+from yose.options import options_store
+from yose.ranking import ranking_engine
+from yose.scheduler import process_scheduler
+from yose.spelling import spelling_corrector
+from yose.thumbnails import ThumbnailError, thumbnail_cache, thumbnail_url
 from yose.utils import (
-    add_document,
     first_run,
-    get_all_documents,
     get_options,
-    search_documents,
+    search_facets,
+    search_page as search_index_page,
     set_icon,
 )
+from yose.yacy import YaCyError, yacy_client
 
 app.native.window_args["resizable"] = True
+app.on_shutdown(yacy_client.close)
+app.on_shutdown(search_cache.close)
+app.on_startup(ingestion_queue.start)
+app.on_shutdown(ingestion_queue.stop)
+app.on_startup(merge_scheduler.start)
+app.on_shutdown(merge_scheduler.stop)
+app.on_startup(process_scheduler.start)
+app.on_shutdown(process_scheduler.stop)
+app.on_shutdown(crawl_frontier.close)
+app.on_shutdown(near_duplicates.save)
+app.on_shutdown(thumbnail_cache.close)
+app.on_shutdown(query_log.close)
+app.on_startup(
+    lambda: process_scheduler.add_periodic(
+        "rebuild-completions",
+        completion_table.rebuild,
+        600,
+        delay=0,
+        job_class="maintenance",
+    )
+)
+# Only rebuilds when the index changed since the last run.
+app.on_startup(
+    lambda: process_scheduler.add_periodic(
+        "rebuild-spelling",
+        spelling_corrector.refresh,
+        300,
+        delay=0,
+        job_class="maintenance",
+    )
+)
 
 
 # def startup():
@@ -34,9 +81,133 @@ def search_page():
     ui.label("Search page not implemented yet.")
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return metrics.render()
+
+
+@app.get("/autocomplete")
+def autocomplete_endpoint(q: str = "", k: int = 8):
+    return {"query": q, "completions": completion_table.complete(q, max(1, min(k, 20)))}
+
+
+def enable_autocomplete(search_field: ui.input, delay: float = 0.2) -> ui.input:
+    """
+    Offer completions from the completion table while typing in a search box.
+
+    The browser only sends the text once typing pauses for `delay` seconds, every
+    keystroke starts the wait over, so the server does nothing per keystroke.
+    """
+    debounce = f"""(event) => {{
+        const timers = (window.yoseCompletionTimers ??= {{}});
+        clearTimeout(timers[{search_field.id}]);
+        timers[{search_field.id}] = setTimeout(
+            () => emit(event.target.value), {int(delay * 1000)}
+        );
+    }}"""
+
+    def update_completions(e: events.GenericEventArguments) -> None:
+        search_field.set_autocomplete(completion_table.complete(e.args or ""))
+
+    search_field.on("input", update_completions, js_handler=debounce)
+    return search_field
+
+
+@app.get("/thumbnail")
+async def thumbnail_endpoint(
+    request: Request, url: str, size: str = "tile", sig: str = ""
+):
+    # Only images the pages linked to through thumbnail_url are fetched.
+    if not thumbnail_cache.verify(url, size, sig):
+        return Response(status_code=404)
+    try:
+        digest, data = await thumbnail_cache.get(url, size)
+    except ThumbnailError as e:
+        logger.debug(e)
+        return Response(status_code=404)
+
+    # Thumbnails are named after their content, the ETag never goes stale and
+    # browsers need not revalidate within the year.
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type="image/jpeg", headers=headers)
+
+
+def _format_labels(labels):
+    return ", ".join(f"{name}={value}" for name, value in labels) or "-"
+
+
+def _format_ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+
+def _metric_rows():
+    timings, counters = [], []
+    for name, metric in sorted(metrics.metrics.items()):
+        if isinstance(metric, Histogram):
+            for labels, series in sorted(metric.series.items()):
+                timings.append(
+                    {
+                        "metric": name,
+                        "labels": _format_labels(labels),
+                        "count": series.count,
+                        "mean": _format_ms(series.sum / series.count),
+                        "p50": _format_ms(metric.quantile(0.50, labels)),
+                        "p95": _format_ms(metric.quantile(0.95, labels)),
+                    }
+                )
+        elif isinstance(metric, Counter):
+            for labels, value in sorted(metric.values.items()):
+                counters.append(
+                    {"metric": name, "labels": _format_labels(labels), "value": value}
+                )
+    for name, (_, values) in sorted(metrics.collectors.items()):
+        for labels, value in sorted(values().items()):
+            if isinstance(value, float):
+                value = round(value, 3)
+            counters.append(
+                {"metric": name, "labels": _format_labels(labels), "value": value}
+            )
+    return timings, counters
+
+
 @ui.page("/SystemStatus")
 def system_status():
-    ui.label("System Status page not implemented yet.")
+    SideBar()
+
+    def column(name, label=None):
+        return {"name": name, "label": label or name, "field": name, "align": "left"}
+
+    with ui.column().style("width: 80%; margin: auto; padding-top: 5%;"):
+        ui.label("System Status").style("font-size: 2rem;")
+        ui.label("Timings (ms)").style("font-size: 1.25rem;")
+        timings_table = ui.table(
+            columns=[
+                column("metric"),
+                column("labels"),
+                column("count"),
+                column("mean"),
+                column("p50"),
+                column("p95"),
+            ],
+            rows=[],
+        ).style("width: 100%;")
+        ui.label("Counters").style("font-size: 1.25rem;")
+        counters_table = ui.table(
+            columns=[column("metric"), column("labels"), column("value")], rows=[]
+        ).style("width: 100%;")
+
+    def update():
+        timings_table.rows, counters_table.rows = _metric_rows()
+        timings_table.update()
+        counters_table.update()
+
+    update()
+    ui.timer(2.0, update)
 
 
 @ui.page("/P2PNetwork")
@@ -61,17 +232,134 @@ def crawler_monitor():
 
 @ui.page("/AdvancedCrawler")
 def advanced_crawler():
-    ui.label("Advanced Crawler page not implemented yet.")
+    SideBar()
+
+    def save():
+        web_crawler.concurrency = int(concurrency.value)
+        web_crawler.per_host_concurrency = int(per_host.value)
+        web_crawler.politeness_delay = float(delay.value)
+        web_crawler.timeout = float(timeout.value)
+        web_crawler.max_bytes = int(max_kb.value) * 1024
+        web_crawler.obey_robots = obey_robots.value
+        web_crawler.user_agent = user_agent.value
+        ui.notify("Crawler settings saved, they apply to the next crawl")
+
+    with ui.column().style("width: 60%; margin: auto; padding-top: 5%;"):
+        ui.label("Advanced Crawler").style("font-size: 2rem;")
+        concurrency = ui.number(
+            "Parallel requests", value=web_crawler.concurrency, min=1
+        )
+        per_host = ui.number(
+            "Parallel requests per host",
+            value=web_crawler.per_host_concurrency,
+            min=1,
+        )
+        delay = ui.number(
+            "Seconds between requests to a host",
+            value=web_crawler.politeness_delay,
+            min=0,
+        )
+        timeout = ui.number("Timeout (seconds)", value=web_crawler.timeout, min=1)
+        max_kb = ui.number(
+            "Maximum page size (KiB)", value=web_crawler.max_bytes // 1024, min=1
+        )
+        obey_robots = ui.checkbox("Obey robots.txt", value=web_crawler.obey_robots)
+        user_agent = ui.input("User agent", value=web_crawler.user_agent).style(
+            "width: 100%;"
+        )
+        ui.button("Save", on_click=lambda e: save())
 
 
 @ui.page("/IndexExportImport")
 def index_export_import():
-    ui.label("Index Export/Import page not implemented yet.")
+    SideBar()
+    progress = {"done": 0, "total": 0}
+
+    def report_progress(done, total):
+        # Called from the worker thread, the timer below pushes it to the page.
+        progress["done"], progress["total"] = done, total
+
+    async def run_job(job, verb):
+        progress["done"] = progress["total"] = 0
+        export_button.disable()
+        import_button.disable()
+        try:
+            await run.io_bound(job, prefix.value, progress=report_progress)
+            ui.notify(f"{verb} of {prefix.value} finished", type="positive")
+        except Exception as e:
+            logger.exception(e)
+            ui.notify(f"{verb} failed: {e}", type="negative")
+        finally:
+            export_button.enable()
+            import_button.enable()
+
+    def update_progress():
+        total = progress["total"]
+        progress_bar.set_value(progress["done"] / total if total else 0)
+        progress_label.set_text(f"{progress['done']} / {total} documents")
+
+    with ui.column().style("width: 60%; margin: auto; padding-top: 5%;"):
+        ui.label("Index Export/Import").style("font-size: 2rem;")
+        prefix = ui.input(label="Export path prefix", value="exports/documents").style(
+            "width: 100%;"
+        )
+        with ui.row():
+            export_button = ui.button(
+                "Export", on_click=lambda e: run_job(export_index, "Export")
+            )
+            import_button = ui.button(
+                "Import", on_click=lambda e: run_job(import_index, "Import")
+            )
+        progress_bar = ui.linear_progress(value=0, show_value=False)
+        progress_label = ui.label("")
+
+    ui.timer(0.5, update_progress)
 
 
 @ui.page("/ContentSemantic")
 def content_semantic():
-    ui.label("Content Semantic page not implemented yet.")
+    SideBar()
+
+    def save():
+        near_duplicates.mode = mode.value
+        near_duplicates.threshold = float(threshold.value) / 100
+        ui.notify("Near-duplicate settings saved, they apply to the next batch")
+
+    def forget():
+        near_duplicates.clear()
+        ui.notify("Near-duplicate signatures cleared")
+
+    def update_stats():
+        stats = near_duplicates.stats()
+        counters.set_text(
+            f"{stats['signatures']} signatures, {stats['checked']} documents checked,"
+            f" {stats['duplicates']} near-duplicates, {stats['dropped']} dropped"
+        )
+
+    with ui.column().style("width: 60%; margin: auto; padding-top: 5%;"):
+        ui.label("Content Semantic").style("font-size: 2rem;")
+        ui.label("Near-duplicate detection").style("font-size: 1.5rem;")
+        ui.label(
+            "Documents are compared on the word shingles of their title and"
+            " content when they are indexed. In cluster mode near-duplicates are"
+            " indexed in the cluster of the first copy, which searches can collapse"
+            " to one result. In drop mode they are not indexed at all."
+        )
+        mode = ui.select(list(MODES), label="Mode", value=near_duplicates.mode)
+        threshold = ui.number(
+            "Minimum similarity (%)",
+            value=round(near_duplicates.threshold * 100),
+            min=50,
+            max=100,
+        )
+        with ui.row():
+            ui.button("Save", on_click=lambda e: save())
+            ui.button("Save signatures", on_click=lambda e: near_duplicates.save())
+            ui.button("Clear signatures", on_click=lambda e: forget())
+        counters = ui.label()
+
+    update_stats()
+    ui.timer(2.0, update_stats)
 
 
 @ui.page("/TargetAnalysis")
@@ -94,9 +382,115 @@ def filter_blacklists():
     ui.label("Filter & Blacklists page not implemented yet.")
 
 
+def _format_time(timestamp):
+    if timestamp is None:
+        return "-"
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _format_seconds(seconds):
+    return "-" if seconds is None else f"{seconds:.2f}s"
+
+
 @ui.page("/ProcessScheduler")
-def process_scheduler():
-    ui.label("Process Scheduler page not implemented yet.")
+def process_scheduler_page():
+    SideBar()
+
+    def column(name, label=None):
+        return {"name": name, "label": label or name, "field": name, "align": "left"}
+
+    def selected_job():
+        if not jobs_table.selected:
+            ui.notify("Select a job first", type="warning")
+            return None
+        return jobs_table.selected[0]["name"]
+
+    def run_now():
+        name = selected_job()
+        if name is not None:
+            process_scheduler.run_now(name)
+
+    def pause():
+        name = selected_job()
+        if name is not None:
+            process_scheduler.pause(name)
+
+    def resume():
+        name = selected_job()
+        if name is not None:
+            process_scheduler.resume(name)
+
+    def optimize_index():
+        process_scheduler.add_once(
+            "optimize-documents",
+            "yose.merge:merge_scheduler.optimize",
+            job_class="maintenance",
+            args=("documents", IndexItems),
+        )
+        ui.notify("Index optimization queued")
+
+    with ui.column().style("width: 80%; margin: auto; padding-top: 5%;"):
+        ui.label("Process Scheduler").style("font-size: 2rem;")
+        with ui.row():
+            ui.button("Run now", on_click=lambda e: run_now())
+            ui.button("Pause", on_click=lambda e: pause())
+            ui.button("Resume", on_click=lambda e: resume())
+            ui.button("Optimize index", on_click=lambda e: optimize_index())
+        jobs_table = ui.table(
+            columns=[
+                column("name"),
+                column("class"),
+                column("priority"),
+                column("state"),
+                column("interval"),
+                column("next_run", "next run"),
+                column("last_duration", "last duration"),
+                column("runs"),
+                column("failures"),
+                column("last_error", "last error"),
+            ],
+            rows=[],
+            row_key="name",
+            selection="single",
+        ).style("width: 100%;")
+        ui.label("Recent runs").style("font-size: 1.25rem;")
+        history_table = ui.table(
+            columns=[
+                column("name"),
+                column("started"),
+                column("queued", "waited"),
+                column("duration"),
+                column("error"),
+            ],
+            rows=[],
+        ).style("width: 100%;")
+
+    def update():
+        jobs_table.rows = [
+            {
+                **job,
+                "interval": _format_seconds(job["interval"]),
+                "next_run": _format_time(job["next_run"]),
+                "last_duration": _format_seconds(job["last_duration"]),
+                "last_error": job["last_error"] or "",
+            }
+            for job in process_scheduler.jobs()
+        ]
+        history_table.rows = [
+            {
+                **run,
+                "started": _format_time(run["started"]),
+                "queued": _format_seconds(run["queued"]),
+                "duration": _format_seconds(run["duration"]),
+                "error": run["error"] or "",
+            }
+            for run in process_scheduler.history()
+        ]
+        jobs_table.update()
+        history_table.update()
+
+    update()
+    ui.timer(1.0, update)
 
 
 @ui.page("/GeneralSettings")
@@ -111,7 +505,66 @@ def theme_settings():
 
 @ui.page("/RankingHeuristics")
 def ranking_heuristics():
-    ui.label("Ranking and Heuristics page not implemented yet.")
+    SideBar()
+    settings = ranking_engine.settings()
+
+    def save():
+        try:
+            ranking_engine.configure(
+                field_boosts={
+                    name: float(field.value or 0) for name, field in boosts.items()
+                },
+                weights={
+                    name: float(field.value or 0) for name, field in weights.items()
+                },
+                top_n=int(top_n.value or 1),
+                half_life_days=float(half_life.value or 1),
+            )
+        except ValueError as e:
+            ui.notify(str(e), type="negative")
+            return
+        ui.notify("Ranking settings saved, they apply to the next search")
+
+    def update_stats():
+        stats = ranking_engine.stats()
+        counters.set_text(
+            f"{stats['rescored']} searches rescored,"
+            f" signals loaded for {stats['segments']} index segments"
+        )
+
+    with ui.column().style("width: 60%; margin: auto; padding-top: 5%;"):
+        ui.label("Ranking and Heuristics").style("font-size: 2rem;")
+        ui.label("Field boosts").style("font-size: 1.5rem;")
+        ui.label(
+            "Matches in a field count this many times more in the text relevance"
+            " score."
+        )
+        with ui.row():
+            boosts = {
+                name: ui.number(name, value=boost, min=0, step=0.1)
+                for name, boost in settings["field_boosts"].items()
+            }
+        ui.label("Signals").style("font-size: 1.5rem;")
+        ui.label(
+            "The best results of each search are rescored with these signals, each"
+            " between -1 and 1, times their weight. A weight of 0 ignores a signal,"
+            " all at 0 keeps the text relevance order."
+        )
+        with ui.row():
+            weights = {
+                name: ui.number(name, value=weight, step=0.1)
+                for name, weight in settings["weights"].items()
+            }
+        with ui.row():
+            top_n = ui.number("Results rescored", value=settings["top_n"], min=1)
+            half_life = ui.number(
+                "Recency half-life (days)", value=settings["half_life_days"], min=1
+            )
+        ui.button("Save", on_click=lambda e: save())
+        counters = ui.label()
+
+    update_stats()
+    ui.timer(2.0, update_stats)
 
 
 @ui.page("/UseCase")
@@ -120,8 +573,56 @@ def use_case():
 
 
 @ui.page("/WebCrawler")
-def web_crawler():
-    ui.label("Load Web Pages, Crawler page not implemented yet.")
+def web_crawler_page():
+    SideBar()
+
+    def start():
+        seeds = [line.strip() for line in urls.value.splitlines() if line.strip()]
+        if not seeds:
+            ui.notify("Enter at least one start URL", type="warning")
+            return
+        if web_crawler.running:
+            ui.notify("A crawl is already running", type="warning")
+            return
+        process_scheduler.add_once(
+            "web-crawl",
+            web_crawler.crawl,
+            job_class="network",
+            priority=20,
+            args=(seeds,),
+            kwargs={
+                "max_depth": int(depth.value),
+                "max_pages": int(max_pages.value) if max_pages.value else None,
+                "same_host": same_host.value,
+            },
+        )
+        ui.notify("Crawl queued")
+
+    def update():
+        stats = web_crawler.stats()
+        status.set_text(
+            f"{'Running' if stats['running'] else 'Idle'}: "
+            f"{stats['fetched']} fetched, {stats['indexed']} indexed, "
+            f"{stats['blocked']} blocked by robots.txt, {stats['errors']} errors, "
+            f"{stats['pages_per_minute']} pages/minute, "
+            f"{len(crawl_frontier)} URLs waiting"
+        )
+
+    with ui.column().style("width: 60%; margin: auto; padding-top: 5%;"):
+        ui.label("Load Web Pages, Crawler").style("font-size: 2rem;")
+        urls = ui.textarea("Start URLs, one per line").style("width: 100%;")
+        with ui.row():
+            depth = ui.number("Link depth", value=2, min=0)
+            max_pages = ui.number("Maximum pages", value=10000, min=1)
+            same_host = ui.checkbox("Stay on the start hosts", value=True)
+        with ui.row():
+            ui.button("Start", on_click=lambda e: start())
+            ui.button("Stop", on_click=lambda e: web_crawler.stop())
+            ui.button("Clear waiting URLs", on_click=lambda e: crawl_frontier.clear())
+        status = ui.label("")
+
+    update()
+    ui.timer(1.0, update)
 
 
 @ui.page("/RAMDiskUsage")
@@ -134,13 +635,62 @@ def admin_panel():
     SideBar()
 
 
-def get_or_create_search_index(query, max_results=50, page=0):
-    results = requests.get(
-        f"http://localhost:8090/yacysearch.json?query={query}&Enter=&auth=&verify=ifexist&contentdom=image&nav=location%2Chosts%2Cauthors%2Cnamespace%2Ctopics%2Cfiletype%2Cprotocol%2Clanguage&startRecord={page * max_results}&indexof=off&meanCount=5&resource=global&prefermaskfilter=&maximumRecords={max_results}&timezoneOffset=420"
-    ).json()["channels"][0]["items"]
+def _fetch_search_results(query, contentdom, page, max_results):
+    async def fetch():
+        results = await yacy_client.search(
+            query, contentdom=contentdom, page=page, max_results=max_results
+        )
+        # Index fresh results locally in the background, off the request path.
+        ingestion_queue.offer(results)
+        return results
+
+    return fetch
+
+
+def prefetch_search_index(query, max_results=50, page=0, contentdom="image"):
+    """Start fetching a page of results in the background so it is cached when needed."""
+    search_cache.prefetch(
+        (query, contentdom, page, max_results),
+        _fetch_search_results(query, contentdom, page, max_results),
+    )
+
+
+async def refresh_cached_searches():
+    """Fetch every cached search again, which also re-indexes the fresh results."""
+    for key in search_cache.keys():
+        search_cache.set(key, await _fetch_search_results(*key)())
+
+
+def schedule_metadata_refresh(options):
+    # automatic_updates_interval is in minutes, an hour when it was never set.
+    interval = (options.get("automatic_updates_interval") or 60) * 60
+    if options.get("automatically_refresh_metadata"):
+        process_scheduler.add_periodic(
+            "refresh-cached-searches",
+            refresh_cached_searches,
+            interval,
+            job_class="network",
+            priority=5,
+        )
+    else:
+        process_scheduler.remove("refresh-cached-searches")
+
+
+app.on_startup(lambda: schedule_metadata_refresh(options_store.get()))
+options_store.subscribe(schedule_metadata_refresh)
+
 
-    # async for result in results:
-    #     await add_document(result)
+async def get_or_create_search_index(query, max_results=50, page=0, contentdom="image"):
+    try:
+        results = await search_cache.get_or_fetch(
+            (query, contentdom, page, max_results),
+            _fetch_search_results(query, contentdom, page, max_results),
+        )
+    except YaCyError as e:
+        # Nothing is cached, the next call asks the peer again.
+        logger.warning(e)
+        ui.notify("The YaCy peer could not be reached, please retry", type="negative")
+        return []
 
     return results
 
@@ -153,6 +703,9 @@ def web_search_page(query: str = ""):
 class Lightbox:
     """A thumbnail gallery where each image can be clicked to enlarge.
     Inspired by https://lokeshdhakar.com/projects/lightbox2/.
+
+    The gallery remembers the position of the open image, so keyboard
+    navigation does not search the image list.
     """
 
     def __init__(self) -> None:
@@ -160,65 +713,215 @@ class Lightbox:
             ui.keyboard(self._handle_key)
             self.large_image = ui.image().props("no-spinner fit=scale-down")
         self.image_list: List[str] = []
+        self._position = 0
+
+    def clear(self) -> None:
+        """Forget every image of the gallery."""
+        self.image_list = []
+        self._position = 0
 
-    def add_image(self, thumb_url: str, orig_url: str) -> ui.image:
-        """Place a thumbnail image in the UI and make it clickable to enlarge."""
+    def append(self, orig_url: str) -> int:
+        """Add an image to the gallery without placing anything in the UI."""
         self.image_list.append(orig_url)
-        with ui.button(on_click=lambda: self._open(orig_url)).props(
-            "flat dense square"
-        ):
-            return ui.image(thumb_url)
+        return len(self.image_list) - 1
+
+    def trim(self, count: int) -> None:
+        """Forget the first `count` images, the positions of the others move down."""
+        del self.image_list[:count]
+        self._position = max(0, self._position - count)
 
     def _handle_key(self, event_args: events.KeyEventArguments) -> None:
         if not event_args.action.keydown:
             return
         if event_args.key.escape:
             self.dialog.close()
-        image_index = self.image_list.index(self.large_image.source)
-        if event_args.key.arrow_left and image_index > 0:
-            self._open(self.image_list[image_index - 1])
-        if event_args.key.arrow_right and image_index < len(self.image_list) - 1:
-            self._open(self.image_list[image_index + 1])
-
-    def _open(self, url: str) -> None:
-        self.large_image.set_source(url)
+        if event_args.key.arrow_left and self._position > 0:
+            self.open(self._position - 1)
+        if event_args.key.arrow_right and self._position < len(self.image_list) - 1:
+            self.open(self._position + 1)
+
+    def open(self, position: int) -> None:
+        """Enlarge the image at a position of the gallery."""
+        self._position = position
+        self.large_image.set_source(self.image_list[position])
         self.dialog.open()
 
 
-@ui.page("/search/images")
-def image_search_page(query: str = "* /date", page: int = 0, max_results: int = 50):
-    SearchFilters()
-    lightbox = Lightbox()
+class _ResultCard:
+    """A recyclable image result card, see ResultGrid."""
 
-    def infinite_scroll(
-        query: str = "* /date", page: int = 0, max_results: int = max_results
+    def __init__(self, grid: "ResultGrid") -> None:
+        self.position = 0
+        with ui.card() as self.card:
+            with ui.button(on_click=lambda: grid.lightbox.open(self.position)).props(
+                "flat dense square"
+            ):
+                self.image = ui.image().classes("w-[300px] h-[200px]")
+            self.link = ui.link()
+            self.host = ui.label()
+
+    def bind(self, position: int, result: dict) -> None:
+        self.position = position
+        self.image.set_source(thumbnail_url(result["image"]))
+        self.link.text = result.get("title", "")
+        # Quotes would end the prop value, they are valid percent-encoded.
+        href = result["image"].replace('"', "%22")
+        self.link.props(f'href="{href}"')
+        self.host.text = result.get("host", "")
+        self.card.set_visibility(True)
+
+
+class ResultGrid:
+    """
+    Image results grid that keeps a bounded window of cards alive.
+
+    The latest `max_results` results are kept as data, for the lightbox and for
+    going back, but at most `window` cards exist. Moving the window rebinds the
+    existing cards to other results instead of adding new ones, so a long
+    scrolling session costs the server and the browser no more elements, and no
+    more memory, than the first pages did.
+    """
+
+    def __init__(
+        self,
+        lightbox: Lightbox,
+        window: int = 100,
+        page_size: int = 50,
+        max_results: int = 1000,
     ):
-        with results_grid:
-            for result in get_or_create_search_index(query, max_results, page):
-                with ui.card():
-                    lightbox.add_image(
-                        thumb_url=f"{result['image']}",
-                        orig_url=f"{result['image']}",
-                    ).classes("w-[300px] h-[200px]")
-                    ui.link(result["title"], result["image"])
-                    ui.label(result["host"])
-
-        #logger.debug(f"page: {page + 1}")
-
-        load_more = ui.button(
-            "Load More",
-            on_click=lambda e: [
-                infinite_scroll(query, page + 1, max_results),
-                load_more.set_visibility(False),
-            ],
+        """
+        Args:
+            lightbox (Lightbox): The gallery the cards open.
+            window (int, optional): Maximum number of cards. Defaults to 100.
+            page_size (int, optional): Results the window moves by. Defaults to 50.
+            max_results (int, optional): Results kept, older ones are forgotten by
+                the grid and the lightbox. At least `window`. Defaults to 1000.
+        """
+        self.lightbox = lightbox
+        self.window = window
+        self.page_size = page_size
+        self.max_results = max(max_results, window)
+        self.results: List[dict] = []
+        self.start = 0
+        self._cards: List[_ResultCard] = []
+
+        self.previous = ui.button(
+            "Previous results", on_click=lambda: self.show(self.start - page_size)
         ).style("align-self: center; width: 100%;")
+        self.previous.set_visibility(False)
+        self.grid = (
+            ui.grid(columns=6)
+            .style("object-fit: scale-down; justify-content: center; margin-top: 5%; ")
+            .classes("mx-auto")
+        )
+
+    @property
+    def at_end(self) -> bool:
+        """True when the window shows the last results."""
+        return self.start + self.window >= len(self.results)
+
+    def extend(self, results: List[dict]) -> None:
+        """Add a page of results and move the window so it ends with them."""
+        for result in results:
+            self.lightbox.append(result["image"])
+        self.results.extend(results)
+        excess = len(self.results) - self.max_results
+        if excess > 0:
+            del self.results[:excess]
+            self.lightbox.trim(excess)
+        self.show(len(self.results) - self.window)
+
+    def clear(self) -> None:
+        """Drop every result, the cards are kept hidden for the next ones."""
+        self.lightbox.clear()
+        self.results = []
+        self.show(0)
+
+    def show(self, start: int) -> None:
+        """Bind the cards to the results from `start` on."""
+        self.start = max(0, min(start, len(self.results) - self.window))
+        visible = self.results[self.start : self.start + self.window]
+        with self.grid:
+            while len(self._cards) < len(visible):
+                self._cards.append(_ResultCard(self))
+        for offset, (card, result) in enumerate(zip(self._cards, visible)):
+            card.bind(self.start + offset, result)
+        for card in self._cards[len(visible) :]:
+            card.card.set_visibility(False)
+        self.previous.set_visibility(self.start > 0)
+
+
+async def search_local_images(query, filters, page=1, max_results=50):
+    """Return a page of image results from the local index, under facet filters."""
+    found = await run.io_bound(
+        search_index_page,
+        query,
+        page=page,
+        pagelen=max_results,
+        fields=["image", "title", "host"],
+        filters=filters,
+    )
+    # search_index_page clamps to the last page, past it there is nothing more.
+    if found["page"] != page:
+        return []
+    return [result for result in found["results"] if result.get("image")]
+
+
+@ui.page("/search/images")
+@timed(PAGE_RENDER, page="/search/images")
+async def image_search_page(
+    query: str = "* /date", page: int = 0, max_results: int = 50
+):
+    lightbox = Lightbox()
+    last_page = page
+    active_filters: Dict[str, list] = {}
+    if query != "* /date":
+        query_log.record(query)
+
+    async def apply_filters(filters):
+        # Facets describe the local index, so filtered results come from it too.
+        nonlocal last_page, active_filters
+        active_filters = {name: list(values) for name, values in filters.items()}
+        results_grid.clear()
+        if active_filters:
+            last_page = 1
+            results_grid.extend(
+                await search_local_images(query, active_filters, 1, max_results)
+            )
+        else:
+            last_page = page
+            results_grid.extend(
+                await get_or_create_search_index(query, max_results, page)
+            )
+
+    async def load_more_results():
+        nonlocal last_page
+        if not results_grid.at_end:
+            results_grid.show(results_grid.start + max_results)
+            return
+        last_page += 1
+        if active_filters:
+            results = await search_local_images(
+                query, active_filters, last_page, max_results
+            )
+        else:
+            results = await get_or_create_search_index(query, max_results, last_page)
+        if not results:
+            # Past the last page, or the peer failed: the next click asks again.
+            last_page -= 1
+            return
+        results_grid.extend(results)
+        if not active_filters:
+            prefetch_search_index(query, max_results, last_page + 1)
+
+    search_filters = SearchFilters(query, on_change=apply_filters)
 
     with ui.column().style("width: 100%; height: 100%; padding: 0; margin: 0;"):
         with ui.page_sticky("top").style(
             "width: 100%; gap: 1px; padding: 0; margin-left: 2%; z-index: 1000 !important;"
         ):
             with ui.row():
-                ui.label(options["app_title"]).style(
+                ui.label(options_store["app_title"]).style(
                     "font-size: 2.5em; font-weight: bold; text-shadow: 2px 2px 2px #000;"
                 ).on("click", lambda e: ui.navigate.to("/")).tailwind.font_style(
                     "italic"
@@ -242,6 +945,7 @@ def image_search_page(query: str = "* /date", page: int = 0, max_results: int =
                         f"/search/images?query={search_field.value}"
                     ),
                 )
+                enable_autocomplete(search_field)
 
                 ui.button(
                     "Administration",
@@ -299,27 +1003,17 @@ def image_search_page(query: str = "* /date", page: int = 0, max_results: int =
                     "end"
                 ).drop_shadow("lg").backdrop_blur("lg").opacity("0.2")
 
-        with ui.grid(columns=6, rows=6).style(
-            "object-fit: scale-down; justify-content: center; margin-top: 5%; "
-        ).props("scrollable").classes("mx-auto") as results_grid:
-            for result in get_or_create_search_index(query, max_results, page):
-                # logger.debug(result)
-
-                with ui.card():
-                    lightbox.add_image(
-                        thumb_url=f"{result['image']}",
-                        orig_url=f"{result['image']}",
-                    ).classes("w-[300px] h-[200px]")
-                    ui.link(result["title"], result["image"])
-                    ui.label(result["host"])
-
-        load_more = ui.button(
-            "Load More",
-            on_click=lambda e: [
-                infinite_scroll(query, page + 1, max_results),
-                load_more.set_visibility(False),
-            ],
-        ).style("align-self: center; width: 100%;")
+        results_grid = ResultGrid(
+            lightbox, window=2 * max_results, page_size=max_results
+        )
+        results_grid.extend(await get_or_create_search_index(query, max_results, page))
+        prefetch_search_index(query, max_results, page + 1)
+
+        ui.button("Load More", on_click=load_more_results).style(
+            "align-self: center; width: 100%;"
+        )
+
+    await search_filters.refresh()
 
 
 @ui.page("/search/videos")
@@ -333,7 +1027,27 @@ def search_news(query: str = ""):
 
 
 class SearchFilters(ui.element):
-    def __init__(self, *args, **kwargs):
+    """
+    Left drawer with the facets of the local index for a query.
+
+    Each facet field lists its most frequent values with their counts, see
+    `yose.facets`. Ticking values calls `on_change` with the selected filters,
+    {fieldname: [values]}, and the counts are taken again under them.
+    """
+
+    LABELS = {
+        "host": "Host",
+        "ext": "File Extension",
+        "language": "Language",
+        "content_type": "Content Type",
+        "category": "Category",
+        "year": "Year",
+    }
+
+    def __init__(self, query: str = "", on_change=None, *args, **kwargs):
+        self.query = query
+        self.on_change = on_change
+        self.filters: Dict[str, list] = {}
         self.build()
 
     def build(self):
@@ -348,27 +1062,48 @@ class SearchFilters(ui.element):
         ) as self.left_drawer:
             ui.label("Search Filters").style("font-size: 2rem; align-self: center; ")
             ui.separator().style(self.menu_width)
-
-            # ui.label("First Steps").style(
-            #     ui.Style(text_align="center", width="100%", bgcolor=color.PRIMARY)
-            # )
-
-            # ui.button(
-            #     "Use Case & Account",
-            #     color=color.SLATE700,
-            #     on_click=lambda e: ui.navigate.to("/UseCase"),
-            # ).style(self.menu_width)
-
-            # ui.button(
-            #     "Load Web Pages, Crawler",
-            #     color=color.SLATE700,
-            #     on_click=lambda e: ui.navigate.to("/WebCrawler"),
-            # ).style(self.menu_width)
+            self.facets = ui.column().style(self.menu_width)
 
         ui.button(
             on_click=lambda: self.left_drawer.toggle(), icon=icon.FILTER_LIST
         ).tailwind.position("fixed").z_index("50")
 
+    async def refresh(self) -> None:
+        """Count the facets of the query under the current filters and show them."""
+        counts = await run.io_bound(search_facets, self.query, self.filters)
+        self.facets.clear()
+        with self.facets:
+            for fieldname, label in self.LABELS.items():
+                values = dict(counts.get(fieldname, []))
+                # Selected values stay listed even when nothing matches them.
+                for value in self.filters.get(fieldname, []):
+                    values.setdefault(value, 0)
+                if not values:
+                    continue
+                ui.label(label).style(
+                    ui.Style(text_align="center", width="100%", bgcolor=color.PRIMARY)
+                )
+                for value, count in values.items():
+                    ui.checkbox(
+                        f"{value} ({count})",
+                        value=value in self.filters.get(fieldname, []),
+                        on_change=lambda e, f=fieldname, v=value: self.select(
+                            f, v, e.value
+                        ),
+                    )
+
+    async def select(self, fieldname: str, value, selected: bool) -> None:
+        values = self.filters.setdefault(fieldname, [])
+        if selected and value not in values:
+            values.append(value)
+        elif not selected and value in values:
+            values.remove(value)
+        if not values:
+            del self.filters[fieldname]
+        if self.on_change is not None:
+            await self.on_change(self.filters)
+        await self.refresh()
+
 
 class SideBar(ui.element):
     def __init__(self, *args, **kwargs):
@@ -539,7 +1274,7 @@ def home_page():
         "width: 100%; gap: 1px; padding: 0; margin-left: 2% ;"
     ):
         with ui.row():
-            ui.label(options["app_title"]).style(
+            ui.label(options_store["app_title"]).style(
                 "font-size: 2.5em; font-weight: bold; text-shadow: 2px 2px 2px #000;"
             ).on("click", lambda e: ui.navigate.to("/")).tailwind.font_style(
                 "italic"
@@ -614,6 +1349,7 @@ def home_page():
             .props("autofocus outlined rounded item-aligned bg-opacity-20")
             .classes("elevation-4")
         ).on("keydown.enter", lambda e: print(f"searching...{search_field.value}"))
+        enable_autocomplete(search_field)
 
 
 if __name__ in {"__main__", "__mp_main__"}:
@@ -0,0 +1,440 @@
+import math
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+from whoosh.fields import Schema
+from whoosh.index import LockError
+from whoosh.reading import SegmentReader
+from whoosh.writing import OPTIMIZE
+
+from yose.index_manager import index_manager
+from yose.metrics import metrics
+
+MERGE = metrics.histogram(
+    "yose_index_merge_seconds", "Time spent merging index segments in the background."
+)
+
+
+class TieredMergePolicy:
+    """
+    Whoosh merge function grouping segments into tiers of similar size.
+
+    A segment with up to `floor_docs` documents is in tier 0, the next tiers are
+    `segments_per_tier` times bigger each. Once a tier holds `segments_per_tier`
+    segments, its smallest ones are merged into one segment of the next tier, so
+    every document is rewritten about once per tier instead of on every commit.
+    Segments where at least `deletes_ratio` of the documents are deleted are
+    merged on their own to reclaim the space.
+
+    Usage:
+        >>> writer.commit(mergetype=TieredMergePolicy(segments_per_tier=4))
+    """
+
+    def __init__(
+        self,
+        segments_per_tier: int = 8,
+        max_merge_at_once: int = 8,
+        floor_docs: int = 1000,
+        max_merged_docs: int = 500000,
+        deletes_ratio: float = 0.3,
+    ) -> None:
+        """
+        Args:
+            segments_per_tier (int, optional): Segments allowed in a tier before it
+                is merged. Defaults to 8.
+            max_merge_at_once (int, optional): Maximum segments merged together.
+                Defaults to 8.
+            floor_docs (int, optional): Size of the smallest tier, smaller segments
+                count as this size. Defaults to 1000.
+            max_merged_docs (int, optional): Segments bigger than this are never
+                merged, except by a full optimize. Defaults to 500000.
+            deletes_ratio (float, optional): Share of deleted documents that makes
+                a segment worth rewriting. Defaults to 0.3.
+        """
+        if segments_per_tier < 2 or max_merge_at_once < 2:
+            raise ValueError("segments_per_tier and max_merge_at_once must be >= 2")
+        self.segments_per_tier = segments_per_tier
+        self.max_merge_at_once = max_merge_at_once
+        self.floor_docs = floor_docs
+        self.max_merged_docs = max_merged_docs
+        self.deletes_ratio = deletes_ratio
+
+    def tier(self, segment) -> int:
+        docs = max(segment.doc_count_all(), self.floor_docs)
+        return int(math.log(docs / self.floor_docs, self.segments_per_tier) + 1e-9)
+
+    def select(self, segments: list) -> list:
+        """
+        Choose the segments of the next merge.
+
+        Args:
+            segments (list): The segments of the index.
+
+        Returns:
+            list: The segments to merge, empty if the index is in shape.
+        """
+        candidates = [
+            segment
+            for segment in segments
+            if segment.doc_count_all() <= self.max_merged_docs
+        ]
+
+        tiers: Dict[int, list] = {}
+        for segment in sorted(candidates, key=lambda segment: segment.doc_count_all()):
+            tiers.setdefault(self.tier(segment), []).append(segment)
+        for number in sorted(tiers):
+            if len(tiers[number]) >= self.segments_per_tier:
+                return self._bounded(tiers[number][: self.max_merge_at_once])
+
+        for segment in candidates:
+            total = segment.doc_count_all()
+            if total and segment.deleted_count() / total >= self.deletes_ratio:
+                return [segment]
+        return []
+
+    def _bounded(self, segments: list) -> list:
+        selected, total = [], 0
+        for segment in segments:
+            total += segment.doc_count_all()
+            if total > self.max_merged_docs and len(selected) > 1:
+                break
+            selected.append(segment)
+        return selected
+
+    def __call__(self, writer, segments: list) -> list:
+        selected = self.select(segments)
+        for segment in selected:
+            reader = SegmentReader(writer.storage, writer.schema, segment)
+            writer.add_reader(reader)
+            reader.close()
+        return [segment for segment in segments if segment not in selected]
+
+
+class MergeScheduler:
+    """
+    Background thread merging index segments so that writes never have to.
+
+    Writers commit without merging and call `notify`. The scheduler then applies
+    its `TieredMergePolicy` one bounded merge at a time, sleeping between merges so
+    that no more than `max_docs_per_second` documents are rewritten per second.
+    During `quiet_hours` each index with more than one segment is fully optimized
+    once a day.
+
+    A merge holds the write lock of its index for as long as it takes, which can
+    be longer than writers wait for a lock. Writers opened with `writer` wait for
+    the merge to end instead of failing, and the scheduler does not start another
+    merge of the index before they are done.
+
+    Usage:
+        >>> merge_scheduler.start()
+        >>> merge_scheduler.notify("documents", IndexItems)
+    """
+
+    def __init__(
+        self,
+        policy: Optional[TieredMergePolicy] = None,
+        interval: float = 30.0,
+        max_docs_per_second: float = 50000.0,
+        quiet_hours: Optional[Tuple[int, int]] = (2, 5),
+        debounce: float = 1.0,
+    ) -> None:
+        """
+        Args:
+            policy (TieredMergePolicy, optional): The merge policy. Defaults to a
+                TieredMergePolicy with its default thresholds.
+            interval (float, optional): Seconds between checks when nothing was
+                notified. Defaults to 30.0.
+            max_docs_per_second (float, optional): Throttle on the documents
+                rewritten by merges. Defaults to 50000.0.
+            quiet_hours (tuple, optional): Local (start, end) hours during which the
+                full optimize may run, e.g. (22, 4) wraps around midnight. None
+                disables it. Defaults to (2, 5).
+            debounce (float, optional): Seconds to wait after a notification, so a
+                burst of commits is handled in one round. Defaults to 1.0.
+        """
+        self.policy = policy or TieredMergePolicy()
+        self.interval = interval
+        self.max_docs_per_second = max_docs_per_second
+        self.quiet_hours = quiet_hours
+        self.debounce = debounce
+        self._indexes: Dict[Tuple[str, str], Schema] = {}
+        self._dirty: set = set()
+        self._optimized: Dict[Tuple[str, str], date] = {}
+        self._lock = threading.Lock()
+        # Indexes being merged, and writers waiting for them, by key.
+        self._merging: set = set()
+        self._waiting: Dict[Tuple[str, str], int] = {}
+        self._merged = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.merges = 0
+        self.optimizes = 0
+        self.merged_docs = 0
+        self.lock_conflicts = 0
+
+    def notify(self, indexname: str, schema: Schema, dirname: Optional[str] = None):
+        """
+        Tell the scheduler an index was committed to and may need merging.
+
+        Args:
+            indexname (str): The name of the index.
+            schema (Schema): The schema of the index.
+            dirname (str, optional): The index directory. Defaults to the index
+                manager's dirname.
+        """
+        key = (dirname or index_manager.dirname, indexname)
+        with self._lock:
+            self._indexes[key] = schema
+            self._dirty.add(key)
+        self._wakeup.set()
+
+    def writer(
+        self,
+        ix,
+        indexname: str,
+        dirname: Optional[str] = None,
+        timeout: float = 30.0,
+        **kwargs,
+    ):
+        """
+        Open a writer of an index, waiting for a background merge of it to end.
+
+        Args:
+            ix (Index): The index.
+            indexname (str): The name of the index.
+            dirname (str, optional): The index directory. Defaults to the index
+                manager's dirname.
+            timeout (float, optional): Seconds to wait for the lock held by another
+                writer, merges are waited for until they end. Defaults to 30.0.
+            **kwargs: Passed on to `Index.writer`.
+
+        Returns:
+            IndexWriter: The writer.
+
+        Raises:
+            LockError: If another writer held the lock for `timeout` seconds.
+        """
+        key = (dirname or index_manager.dirname, indexname)
+        with self._lock:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            while True:
+                with self._lock:
+                    while key in self._merging:
+                        self._merged.wait()
+                try:
+                    return ix.writer(timeout=timeout, **kwargs)
+                except LockError:
+                    with self._lock:
+                        if key not in self._merging:
+                            raise
+        finally:
+            with self._lock:
+                self._waiting[key] -= 1
+
+    def in_quiet_hours(self, now: Optional[datetime] = None) -> bool:
+        if self.quiet_hours is None:
+            return False
+        start, end = self.quiet_hours
+        hour = (now or datetime.now()).hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def _merge_once(self, key: Tuple[str, str], schema: Schema, optimize: bool) -> int:
+        dirname, indexname = key
+        ix = index_manager.get_index(indexname, schema, dirname)
+        with self._lock:
+            if self._waiting.get(key):
+                # Writers go first, try again on the next round.
+                self.lock_conflicts += 1
+                return -1
+            try:
+                writer = ix.writer()
+            except LockError:
+                # A request is writing, try again on the next round.
+                self.lock_conflicts += 1
+                return -1
+            self._merging.add(key)
+        try:
+            docs, elapsed = self._merge(key, writer, optimize)
+        finally:
+            with self._lock:
+                self._merging.discard(key)
+                self._merged.notify_all()
+        self._throttle(docs, elapsed)
+        return docs
+
+    def _merge(self, key: Tuple[str, str], writer, optimize: bool) -> Tuple[int, float]:
+        # Returns the documents rewritten and the seconds it took.
+        dirname, indexname = key
+        segments = writer.segments
+        if optimize:
+            selected = segments if len(segments) > 1 else []
+            if len(segments) == 1 and segments[0].has_deletions():
+                selected = segments
+        else:
+            selected = self.policy.select(segments)
+        if not selected:
+            writer.cancel()
+            return 0, 0.0
+
+        docs = sum(segment.doc_count_all() for segment in selected)
+        kind = "optimize" if optimize else "tiered"
+        start = time.perf_counter()
+        try:
+            with MERGE.time(kind=kind):
+                writer.commit(mergetype=OPTIMIZE if optimize else self.policy)
+        except Exception:
+            writer.cancel()
+            raise
+        index_manager.invalidate(indexname, dirname)
+
+        logger.debug(
+            f"Merged {len(selected)} segments ({docs} documents) of {indexname} "
+            f"in {time.perf_counter() - start:.2f}s ({kind})"
+        )
+        self.merged_docs += docs
+        if optimize:
+            self.optimizes += 1
+        else:
+            self.merges += 1
+        return docs, time.perf_counter() - start
+
+    def _throttle(self, docs: int, elapsed: float) -> None:
+        if self.max_docs_per_second:
+            self._stopping.wait(max(0.0, docs / self.max_docs_per_second - elapsed))
+
+    def run_once(self, optimize: bool = False) -> int:
+        """
+        Merge every notified index until the policy has nothing left to merge.
+
+        Args:
+            optimize (bool, optional): Fully optimize every known index instead,
+                regardless of the quiet hours. Defaults to False.
+
+        Returns:
+            int: The number of documents rewritten.
+        """
+        with self._lock:
+            keys = set(self._indexes) if optimize else set(self._dirty)
+            self._dirty.clear()
+            schemas = dict(self._indexes)
+
+        total = 0
+        for key in keys:
+            while not self._stopping.is_set():
+                try:
+                    docs = self._merge_once(key, schemas[key], optimize)
+                except Exception as e:
+                    logger.exception(f"Merging {key[1]} failed: {e!r}")
+                    break
+                if docs < 0:
+                    with self._lock:
+                        self._dirty.add(key)
+                    break
+                total += docs
+                if docs == 0 or optimize:
+                    break
+        return total
+
+    def optimize(
+        self, indexname: str, schema: Schema, dirname: Optional[str] = None
+    ) -> int:
+        """
+        Merge every segment of an index into one, right now.
+
+        Args:
+            indexname (str): The name of the index.
+            schema (Schema): The schema of the index.
+            dirname (str, optional): The index directory. Defaults to the index
+                manager's dirname.
+
+        Returns:
+            int: The number of documents rewritten, -1 if the index was locked.
+        """
+        key = (dirname or index_manager.dirname, indexname)
+        with self._lock:
+            self._indexes[key] = schema
+        return self._merge_once(key, schema, optimize=True)
+
+    def _quiet_optimize(self) -> None:
+        today = date.today()
+        with self._lock:
+            keys = [key for key in self._indexes if self._optimized.get(key) != today]
+            schemas = dict(self._indexes)
+        for key in keys:
+            if self._stopping.is_set():
+                return
+            try:
+                docs = self._merge_once(key, schemas[key], optimize=True)
+            except Exception as e:
+                logger.exception(f"Optimizing {key[1]} failed: {e!r}")
+                continue
+            if docs >= 0:
+                self._optimized[key] = today
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            if self._wakeup.wait(self.interval):
+                self._stopping.wait(self.debounce)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            self.run_once()
+            if self.in_quiet_hours():
+                self._quiet_optimize()
+
+    def start(self) -> None:
+        """Start the background thread, if it is not running yet."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="yose-merge-scheduler", daemon=True
+        )
+        self._thread.start()
+        logger.debug("Merge scheduler started")
+
+    def stop(self, timeout: Optional[float] = 30.0) -> None:
+        """
+        Stop the background thread, letting a merge in progress finish.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the thread. Defaults to 30.0.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.debug("Merge scheduler stopped")
+
+    def stats(self) -> dict:
+        """
+        Return the scheduler counters.
+
+        Returns:
+            dict: merges, optimizes, merged_docs, lock_conflicts and pending indexes.
+        """
+        with self._lock:
+            pending = len(self._dirty)
+        return {
+            "merges": self.merges,
+            "optimizes": self.optimizes,
+            "merged_docs": self.merged_docs,
+            "lock_conflicts": self.lock_conflicts,
+            "pending": pending,
+        }
+
+
+merge_scheduler = MergeScheduler()
+metrics.gauge(
+    "yose_merge_scheduler",
+    "Background merge scheduler counters.",
+    merge_scheduler.stats,
+)
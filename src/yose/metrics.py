@@ -0,0 +1,263 @@
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (
+        name
+        + '="'
+        + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(labels)} {value}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    Distribution of observed values (durations in seconds) in fixed buckets.
+
+    Observing a value is a bisect and three additions, cheap enough for every
+    request on the hot path.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series(len(self.buckets))
+            series.counts[bisect_left(self.buckets, value)] += 1
+            series.sum += value
+            series.count += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the time spent in a `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q: float, labels: Labels = ()) -> Optional[float]:
+        """
+        Estimate a quantile by interpolating inside the bucket that contains it.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+            labels (Labels, optional): The series. Defaults to the unlabelled one.
+
+        Returns:
+            float or None: The estimate, or None if nothing was observed.
+        """
+        series = self.series.get(labels)
+        if series is None or series.count == 0:
+            return None
+        rank = q * series.count
+        seen = 0
+        for index, count in enumerate(series.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series.counts):
+                cumulative += count
+                le = ("le", str(bound))
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(labels, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series.sum}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series.count}")
+        return lines
+
+
+class Registry:
+    """
+    Holds every metric of the process and renders them in the Prometheus text format.
+
+    Values that are cheaper to read than to track (cache sizes, queue lengths) are
+    provided by collectors, called only when the metrics are rendered.
+
+    Usage:
+        >>> SEARCH = metrics.histogram("yose_search_seconds", "Time spent searching")
+        >>> with SEARCH.time(function="search_page"):
+        ...     ...
+    """
+
+    def __init__(self) -> None:
+        self.metrics: Dict[str, object] = {}
+        self.collectors: Dict[str, Tuple[str, Callable[[], Dict[Labels, float]]]] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def gauge(self, name: str, help: str, collect: Callable[[], dict]) -> None:
+        """
+        Register a gauge whose values are read from `collect` at render time.
+
+        Args:
+            name (str): The metric name.
+            help (str): The metric description.
+            collect (Callable[[], dict]): Returns either a number, or a dictionary
+                mapping a label value to a number. The label is named `key`.
+        """
+
+        def values() -> Dict[Labels, float]:
+            result = collect()
+            if isinstance(result, dict):
+                return {(("key", str(key)),): value for key, value in result.items()}
+            return {(): result}
+
+        self.collectors[name] = (help, values)
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        for name, (help, values) in sorted(self.collectors.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(values().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def timed(histogram: Histogram, **labels) -> Callable:
+    """
+    Decorator observing the duration of every call of a function, sync or async.
+
+    The signature of the function is kept, so it can decorate NiceGUI pages.
+
+    Args:
+        histogram (Histogram): The histogram to observe into.
+        **labels: The labels of the observations.
+    """
+
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await function(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+metrics = Registry()
+
+INDEX_OPEN = metrics.histogram(
+    "yose_index_open_seconds", "Time spent opening an index or a new searcher."
+)
+SEARCH = metrics.histogram("yose_search_seconds", "Time spent running local searches.")
+COMMIT = metrics.histogram(
+    "yose_index_commit_seconds", "Time spent committing index writers."
+)
+YACY_REQUEST = metrics.histogram(
+    "yose_yacy_request_seconds", "Time spent on requests to the YaCy peer."
+)
+YACY_ERRORS = metrics.counter(
+    "yose_yacy_errors_total",
+    "Failed requests to the YaCy peer, including retried ones.",
+)
+PAGE_RENDER = metrics.histogram(
+    "yose_page_render_seconds", "Time spent building pages, including awaited fetches."
+)
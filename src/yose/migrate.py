@@ -0,0 +1,152 @@
+"""
+Rebuild an existing index into another schema profile.
+
+Usage:
+    python -m yose.migrate --profile lean
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+
+from loguru import logger
+from whoosh import index
+from whoosh.filedb.filestore import FileStorage
+from whoosh.index import LockError
+
+from yose.config.db.Model import SCHEMA_PROFILES
+from yose.index_manager import index_manager
+from yose.utils import coerce_document
+
+
+def _index_files(dirname: str, indexname: str) -> list:
+    # TOC files are named _<indexname>_<generation>.toc and segment files
+    # <indexname>_<segment id>.<ext>, the write lock is left alone.
+    pattern = re.compile(rf"^_?{re.escape(indexname)}_[0-9a-z]+\.")
+    return [filename for filename in os.listdir(dirname) if pattern.match(filename)]
+
+
+def index_size(dirname: str, indexname: str) -> int:
+    """
+    Return the size in bytes of all the files (TOC and segments) of an index.
+
+    Args:
+        dirname (str): The index directory.
+        indexname (str): The name of the index.
+
+    Returns:
+        int: The total size in bytes.
+    """
+    return sum(
+        os.path.getsize(os.path.join(dirname, filename))
+        for filename in _index_files(dirname, indexname)
+    )
+
+
+def migrate_index(
+    profile: str = "lean",
+    indexname: str = "documents",
+    dirname: str = "db",
+    limitmb: int = 256,
+) -> dict:
+    """
+    Rebuild an index into a schema profile, streaming its stored documents.
+
+    The documents are read one at a time from the current index, converted to the
+    new field types and written by a single writer into a new index built next to
+    the old one, so memory stays bounded by `limitmb` whatever the size of the index.
+    Once the new index is complete its files replace the old ones.
+
+    The write lock of the index is held for the whole migration, so other writers
+    fail instead of writing documents that would be lost. Only stored fields can be
+    carried over, fields that were indexed but not stored in the old profile are lost.
+
+    Args:
+        profile (str, optional): The name of the profile in SCHEMA_PROFILES.
+            Defaults to "lean".
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        dirname (str, optional): The index directory. Defaults to "db".
+        limitmb (int, optional): Memory used by the writer before it spills to disk.
+            Defaults to 256.
+
+    Returns:
+        dict: A report with the document count, index size before and after, the
+            elapsed time and the number of documents ingested per second.
+
+    Raises:
+        LockError: If another writer holds the lock of the index.
+    """
+    schema = SCHEMA_PROFILES[profile]()
+    source = index.open_dir(dirname, indexname=indexname)
+    lock = source.lock("WRITELOCK")
+    if not lock.acquire(False):
+        raise LockError(f"Index {indexname!r} is locked by another writer")
+
+    tempdir = os.path.join(dirname, f".migrate-{indexname}")
+    try:
+        if os.path.exists(tempdir):
+            shutil.rmtree(tempdir)
+        os.mkdir(tempdir)
+
+        size_before = index_size(dirname, indexname)
+        target = FileStorage(tempdir).create_index(schema, indexname=indexname)
+
+        start = time.perf_counter()
+        count = 0
+        writer = target.writer(limitmb=limitmb)
+        try:
+            with source.reader() as reader:
+                for fields in reader.all_stored_fields():
+                    writer.add_document(**coerce_document(fields, schema))
+                    count += 1
+                    if count % 10000 == 0:
+                        logger.info(f"Migrated {count} documents")
+            writer.commit(optimize=True)
+        except BaseException:
+            writer.cancel()
+            raise
+        elapsed = time.perf_counter() - start
+        size_after = index_size(tempdir, indexname)
+
+        # Swap the files of the new index in place of the old ones.
+        index_manager.forget(indexname, dirname)
+        target.close()
+        for filename in _index_files(dirname, indexname):
+            os.remove(os.path.join(dirname, filename))
+        for filename in _index_files(tempdir, indexname):
+            os.replace(os.path.join(tempdir, filename), os.path.join(dirname, filename))
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+        lock.release()
+        source.close()
+
+    report = {
+        "indexname": indexname,
+        "profile": profile,
+        "documents": count,
+        "size_before": size_before,
+        "size_after": size_after,
+        "size_ratio": size_after / size_before if size_before else None,
+        "seconds": elapsed,
+        "docs_per_second": count / elapsed if elapsed else None,
+    }
+    logger.info(f"Migration finished: {report}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", default="lean", choices=sorted(SCHEMA_PROFILES))
+    parser.add_argument("--index", default="documents")
+    parser.add_argument("--dir", default="db")
+    parser.add_argument("--limitmb", type=int, default=256)
+    args = parser.parse_args()
+
+    report = migrate_index(args.profile, args.index, args.dir, args.limitmb)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import threading
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+from whoosh import index
+from whoosh.fields import NUMERIC
+
+from yose.config.db.Model import Options
+from yose.index_manager import index_manager
+from yose.metrics import COMMIT
+
+
+class OptionsStore:
+    """
+    In-memory view of the versioned `options` index.
+
+    Every change is appended to the index as a new document with the next version
+    number, so older versions stay available for rollback. The versions are loaded
+    once and kept in memory, which makes reading the current options a dictionary
+    lookup instead of an index search.
+
+    Usage:
+        >>> options_store.get()["app_title"]
+        >>> options_store.set(theme_mode="light")
+        >>> unsubscribe = options_store.subscribe(lambda options: print(options))
+    """
+
+    def __init__(self, indexname: str = "options", dirname: str = "db") -> None:
+        """
+        Args:
+            indexname (str, optional): The name of the options index. Defaults to "options".
+            dirname (str, optional): The index directory. Defaults to "db".
+        """
+        self.indexname = indexname
+        self.dirname = dirname
+        self._versions: Optional[List[dict]] = None
+        self._by_version: Dict[int, dict] = {}
+        self._subscribers: List[Callable[[dict], None]] = []
+        self._lock = threading.RLock()
+
+    def _index(self) -> index.Index:
+        ix = index_manager.get_index(self.indexname, Options, self.dirname)
+        if "version" not in ix.schema:
+            # Indexes created before versions were tracked get the field added.
+            writer = ix.writer()
+            writer.add_field("version", NUMERIC(stored=True, sortable=True))
+            writer.commit()
+            index_manager.invalidate(self.indexname, self.dirname)
+        return ix
+
+    def _load(self) -> List[dict]:
+        if self._versions is None:
+            self._index()
+            with index_manager.searcher(
+                self.indexname, Options, self.dirname
+            ) as searcher:
+                documents = [
+                    dict(fields) for _, fields in sorted(searcher.reader().iter_docs())
+                ]
+            # Documents written before versions existed are numbered in the order
+            # they were added, which is also their docnum order.
+            for number, document in enumerate(documents, 1):
+                document.setdefault("version", number)
+            documents.sort(key=lambda document: document["version"])
+
+            self._versions = documents
+            self._by_version = {document["version"]: document for document in documents}
+        return self._versions
+
+    def get(self) -> dict:
+        """
+        Return the latest version of the options.
+
+        The returned dictionary is shared, it must not be modified.
+
+        Returns:
+            dict: The current options, including their `version`.
+        """
+        with self._lock:
+            versions = self._load()
+            return versions[-1] if versions else {}
+
+    def __getitem__(self, name: str):
+        return self.get()[name]
+
+    @property
+    def version(self) -> int:
+        """The current version number, 0 if no options were saved yet."""
+        return self.get().get("version", 0)
+
+    def history(self) -> List[dict]:
+        """
+        Return every version of the options, oldest first.
+
+        Returns:
+            list: The versions as dictionaries.
+        """
+        with self._lock:
+            return list(self._load())
+
+    def set(self, **changes) -> dict:
+        """
+        Save a new version of the options with the given changes applied.
+
+        Args:
+            **changes: The options to change, other options keep their current value.
+
+        Returns:
+            dict: The new version of the options.
+        """
+        with self._lock:
+            current = {
+                name: value
+                for name, value in self.get().items()
+                if name not in ("id", "version")
+            }
+            return self._append({**current, **changes})
+
+    def replace(self, options: dict) -> dict:
+        """
+        Save a new version holding exactly the given options.
+
+        Args:
+            options (dict): The complete set of options.
+
+        Returns:
+            dict: The new version of the options.
+        """
+        with self._lock:
+            options = {
+                name: value
+                for name, value in options.items()
+                if name not in ("id", "version")
+            }
+            return self._append(options)
+
+    def rollback(self, version: int) -> dict:
+        """
+        Make a previous version current again.
+
+        The rollback is saved as a new version, so it can itself be undone.
+
+        Args:
+            version (int): The version to go back to.
+
+        Returns:
+            dict: The new version of the options.
+
+        Raises:
+            KeyError: If there is no such version.
+        """
+        with self._lock:
+            self._load()
+            return self.replace(self._by_version[version])
+
+    def _append(self, options: dict) -> dict:
+        version = self.version + 1
+        document = {**options, "id": str(version), "version": version}
+
+        writer = self._index().writer()
+        writer.add_document(**document)
+        with COMMIT.time():
+            writer.commit()
+        index_manager.invalidate(self.indexname, self.dirname)
+
+        self._versions.append(document)
+        self._by_version[version] = document
+        logger.debug(f"Saved options version {version}")
+        self._notify(document)
+        return document
+
+    def _notify(self, options: dict) -> None:
+        for callback in list(self._subscribers):
+            try:
+                callback(options)
+            except Exception as e:
+                logger.exception(f"Options subscriber {callback!r} failed: {e!r}")
+
+    def subscribe(self, callback: Callable[[dict], None]) -> Callable[[], None]:
+        """
+        Call `callback` with the new options every time they change.
+
+        Args:
+            callback (Callable[[dict], None]): The function to call.
+
+        Returns:
+            Callable[[], None]: A function that removes the subscription.
+        """
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def reload(self) -> None:
+        """Forget the in-memory versions so the next read loads them from the index."""
+        with self._lock:
+            self._versions = None
+            self._by_version = {}
+
+
+options_store = OptionsStore()
@@ -0,0 +1,300 @@
+import json
+import math
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+from whoosh.searching import Results, Searcher
+
+from yose.metrics import metrics
+
+# How each signal is turned into a number between -1 and 1.
+SIGNALS = {
+    "likes": "count",
+    "views": "count",
+    "shares": "count",
+    "rating": "rating",
+    "sentiment_score": "sentiment",
+    "updated_at": "recency",
+}
+
+FIELD_BOOSTS = {
+    "title": 2.0,
+    "content": 1.0,
+    "author": 1.0,
+    "category": 1.0,
+    "keywords": 1.5,
+    "description": 1.2,
+}
+
+RATING_SCALE = 5.0
+SENTIMENT_SCALE = 100.0
+
+RESCORE = metrics.histogram(
+    "yose_rescore_seconds", "Time spent rescoring the top hits of a query."
+)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _number(value, kind: str) -> float:
+    # The value kept in the signal arrays, counts are kept as log1p.
+    if value is None:
+        return 0.0
+    if kind == "recency":
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.replace(tzinfo=None) - value.utcoffset()
+            return (value - _EPOCH).total_seconds()
+        return 0.0
+    if kind == "count":
+        return math.log1p(max(float(value), 0.0))
+    return float(value)
+
+
+class _SegmentSignals:
+    """The signal columns of one segment, loaded into arrays of floats."""
+
+    def __init__(self, reader, signals: Dict[str, str]) -> None:
+        self.values: Dict[str, array] = {}
+        self.maxima: Dict[str, float] = {}
+        for name, kind in signals.items():
+            if not reader.has_column(name):
+                continue
+            values = array("d", (_number(v, kind) for v in reader.column_reader(name)))
+            self.values[name] = values
+            self.maxima[name] = max(values, default=0.0)
+
+
+class RankingEngine:
+    """
+    Field boosts for the first phase and popularity signals for a second phase.
+
+    The first phase is Whoosh's BM25F with a boost per field. The second phase
+    rescores the `top_n` best hits of the first:
+
+        score * max(0, 1 + sum(weight * signal))
+
+    where every signal lies between -1 and 1: `likes`, `views` and `shares` as
+    log1p of the count over the largest in the index, `rating` over 5,
+    `sentiment_score` over 100 and the recency of `updated_at` halving every
+    `half_life_days`. Signal columns are read once per segment into arrays of
+    floats, so a query only costs `top_n` array lookups per weighted signal,
+    however large the index is. Signals without a column in the index are
+    ignored.
+
+    The settings are saved as JSON.
+
+    Usage:
+        >>> ranking_engine.configure(weights={"views": 0.2, "updated_at": 0.5})
+        >>> results = ranking_engine.rescore(searcher, searcher.search(q, limit=100))
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join("db", "ranking.json"),
+        top_n: int = 100,
+        half_life_days: float = 365.0,
+    ) -> None:
+        """
+        Args:
+            path (str, optional): The settings file. Defaults to "db/ranking.json".
+            top_n (int, optional): Hits rescored per query. Defaults to 100.
+            half_life_days (float, optional): Age at which the recency signal is
+                halved. Defaults to 365.0.
+        """
+        self.path = path
+        self.top_n = top_n
+        self.half_life_days = half_life_days
+        self.field_boosts: Dict[str, float] = dict(FIELD_BOOSTS)
+        self.weights: Dict[str, float] = {name: 0.0 for name in SIGNALS}
+        self._segments: Dict[str, _SegmentSignals] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.rescored = 0
+
+    def load(self) -> None:
+        """Read the saved settings, if any."""
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                settings = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the ranking settings {self.path}: {e}")
+            return
+        self.field_boosts.update(settings.get("field_boosts", {}))
+        self.weights.update(
+            (name, weight)
+            for name, weight in settings.get("weights", {}).items()
+            if name in SIGNALS
+        )
+        self.top_n = settings.get("top_n", self.top_n)
+        self.half_life_days = settings.get("half_life_days", self.half_life_days)
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def save(self) -> None:
+        """Write the settings to disk."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.settings(), f, indent=2)
+
+    def settings(self) -> dict:
+        """
+        Return the current settings.
+
+        Returns:
+            dict: field_boosts, weights, top_n and half_life_days.
+        """
+        self._ensure_loaded()
+        return {
+            "field_boosts": dict(self.field_boosts),
+            "weights": dict(self.weights),
+            "top_n": self.top_n,
+            "half_life_days": self.half_life_days,
+        }
+
+    def configure(
+        self,
+        field_boosts: Optional[Dict[str, float]] = None,
+        weights: Optional[Dict[str, float]] = None,
+        top_n: Optional[int] = None,
+        half_life_days: Optional[float] = None,
+        save: bool = True,
+    ) -> None:
+        """
+        Change the settings, they apply to the next query.
+
+        Args:
+            field_boosts (dict, optional): Boost of each searched field.
+            weights (dict, optional): Weight of each signal of SIGNALS, 0 to ignore it.
+            top_n (int, optional): Hits rescored per query.
+            half_life_days (float, optional): Age at which recency is halved.
+            save (bool, optional): Write the settings to disk. Defaults to True.
+        """
+        self._ensure_loaded()
+        if weights is not None:
+            unknown = set(weights) - set(SIGNALS)
+            if unknown:
+                raise ValueError(f"Unknown ranking signals: {sorted(unknown)}")
+        if top_n is not None and top_n < 1:
+            raise ValueError("top_n must be at least 1")
+        if half_life_days is not None and half_life_days <= 0:
+            raise ValueError("half_life_days must be positive")
+
+        # Replaced whole, so queries running meanwhile see old or new settings.
+        if field_boosts is not None:
+            self.field_boosts = {**self.field_boosts, **field_boosts}
+        if weights is not None:
+            self.weights = {**self.weights, **weights}
+        if top_n is not None:
+            self.top_n = int(top_n)
+        if half_life_days is not None:
+            self.half_life_days = float(half_life_days)
+        if save:
+            self.save()
+
+    @property
+    def enabled(self) -> bool:
+        """True when a signal has a weight, otherwise there is no second phase."""
+        self._ensure_loaded()
+        return any(self.weights.values())
+
+    def limit(self, limit: int) -> int:
+        """Return how many hits to collect for `limit` of them, rescoring included."""
+        return max(limit, self.top_n) if self.enabled else limit
+
+    def _leaves(self, searcher: Searcher) -> List[Tuple[int, _SegmentSignals]]:
+        leaves = []
+        with self._lock:
+            present: Set[str] = set()
+            for leaf, offset in searcher.leaf_searchers():
+                reader = leaf.reader()
+                segment = reader.segment().segment_id()
+                present.add(segment)
+                signals = self._segments.get(segment)
+                if signals is None:
+                    signals = self._segments[segment] = _SegmentSignals(reader, SIGNALS)
+                leaves.append((offset, signals))
+            # Merged away segments are not coming back.
+            for segment in set(self._segments) - present:
+                del self._segments[segment]
+        return leaves
+
+    def rescore(self, searcher: Searcher, results: Results) -> Results:
+        """
+        Reorder the `top_n` best hits of a search by their weighted signals.
+
+        Args:
+            searcher (Searcher): The searcher the results come from.
+            results (Results): Scored results, with a limit of at least `top_n`
+                for every hit of interest to be rescored, see `limit`.
+
+        Returns:
+            Results: The same results, their best hits rescored and sorted again.
+            Hits after the first `top_n` keep their first phase order.
+        """
+        self._ensure_loaded()
+        weights = [(name, weight) for name, weight in self.weights.items() if weight]
+        if not weights or not results.top_n:
+            return results
+
+        with RESCORE.time():
+            leaves = self._leaves(searcher)
+            offsets = [offset for offset, _ in leaves]
+            maxima = {
+                name: max(signals.maxima.get(name, 0.0) for _, signals in leaves)
+                for name, _ in weights
+            }
+            now = time.time()
+            half_life = self.half_life_days * 86400
+
+            rescored = []
+            for score, docnum in results.top_n[: self.top_n]:
+                offset, signals = leaves[bisect_right(offsets, docnum) - 1]
+                boost = 1.0
+                for name, weight in weights:
+                    values = signals.values.get(name)
+                    if values is None:
+                        continue
+                    value = values[docnum - offset]
+                    kind = SIGNALS[name]
+                    if kind == "count":
+                        value = value / maxima[name] if maxima[name] else 0.0
+                    elif kind == "rating":
+                        value = min(max(value / RATING_SCALE, 0.0), 1.0)
+                    elif kind == "sentiment":
+                        value = min(max(value / SENTIMENT_SCALE, -1.0), 1.0)
+                    else:
+                        value = (
+                            0.5 ** (max(now - value, 0.0) / half_life) if value else 0.0
+                        )
+                    boost += weight * value
+                rescored.append((score * max(boost, 0.0), docnum))
+
+            rescored.sort(key=lambda item: (-item[0], item[1]))
+            results.top_n = rescored + results.top_n[self.top_n :]
+            self.rescored += 1
+        return results
+
+    def stats(self) -> dict:
+        """
+        Return the rescoring counters.
+
+        Returns:
+            dict: segments with loaded signals and queries rescored.
+        """
+        return {"segments": len(self._segments), "rescored": self.rescored}
+
+
+ranking_engine = RankingEngine()
+metrics.gauge("yose_ranking", "Ranking engine counters.", ranking_engine.stats)
@@ -0,0 +1,505 @@
+import asyncio
+import functools
+import heapq
+import importlib
+import inspect
+import itertools
+import os
+import shelve
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union
+
+from loguru import logger
+
+from yose.metrics import metrics
+
+JOB_RUN = metrics.histogram("yose_job_seconds", "Duration of scheduled job runs.")
+
+EXECUTORS = ("thread", "process")
+
+
+def resolve(target: Union[str, Callable]) -> Callable:
+    """
+    Return the callable named by `target`, given as "module:attribute.path".
+
+    Args:
+        target (str or Callable): The callable, or its import path.
+
+    Returns:
+        Callable: The callable.
+    """
+    if callable(target):
+        return target
+    module_name, _, path = target.partition(":")
+    value = importlib.import_module(module_name)
+    for name in path.split("."):
+        value = getattr(value, name)
+    return value
+
+
+class Job:
+    """A unit of work known to the scheduler, either periodic or one-shot."""
+
+    def __init__(
+        self,
+        name: str,
+        target: Union[str, Callable],
+        interval: Optional[float] = None,
+        job_class: str = "default",
+        priority: int = 10,
+        executor: str = "thread",
+        args: tuple = (),
+        kwargs: Optional[dict] = None,
+    ) -> None:
+        if executor not in EXECUTORS:
+            raise ValueError(f"executor must be one of {EXECUTORS}, got {executor!r}")
+        self.name = name
+        self.target = target
+        self.interval = interval
+        self.job_class = job_class
+        self.priority = priority
+        self.executor = executor
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.state = "idle"
+        self.paused = False
+        self.next_run: Optional[float] = None
+        self.queued_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.last_run: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.failures = 0
+
+    @property
+    def periodic(self) -> bool:
+        return self.interval is not None
+
+    @property
+    def persistable(self) -> bool:
+        # One-shot jobs can only be recreated after a restart from an import path.
+        return self.periodic or isinstance(self.target, str)
+
+    def state_dict(self) -> dict:
+        state = {
+            name: getattr(self, name)
+            for name in (
+                "paused",
+                "next_run",
+                "last_run",
+                "last_duration",
+                "last_error",
+                "runs",
+                "failures",
+            )
+        }
+        if not self.periodic:
+            state["definition"] = {
+                "target": self.target,
+                "job_class": self.job_class,
+                "priority": self.priority,
+                "executor": self.executor,
+                "args": self.args,
+                "kwargs": self.kwargs,
+            }
+        return state
+
+    def restore(self, state: dict) -> None:
+        for name, value in state.items():
+            if name != "definition":
+                setattr(self, name, value)
+
+    def redefine(self, other: "Job") -> None:
+        """Take the definition of another job, keeping the state of this one."""
+        for name in (
+            "target",
+            "interval",
+            "job_class",
+            "priority",
+            "executor",
+            "args",
+            "kwargs",
+        ):
+            setattr(self, name, getattr(other, name))
+
+    def snapshot(self) -> dict:
+        """Return the job as a dictionary, for display."""
+        return {
+            "name": self.name,
+            "class": self.job_class,
+            "priority": self.priority,
+            "executor": self.executor,
+            "state": "paused" if self.paused else self.state,
+            "interval": self.interval,
+            "next_run": self.next_run,
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "runs": self.runs,
+            "failures": self.failures,
+        }
+
+
+class ProcessScheduler:
+    """
+    In-process job scheduler for work that must stay off the request path.
+
+    Jobs are periodic or one-shot. Due jobs are queued by priority (lower runs
+    first) and started as long as their job class is below its concurrency limit.
+    Coroutine functions run on the event loop, other functions on a thread pool or,
+    with `executor="process"`, on a process pool. The state of every job (next run,
+    run counts, last error) is saved in a shelve file so schedules survive restarts,
+    as do pending one-shot jobs given as an import path.
+
+    Usage:
+        >>> process_scheduler.add_periodic("warm-cache", warm_cache, interval=3600)
+        >>> process_scheduler.add_once(
+        ...     "optimize", "yose.merge:merge_scheduler.optimize", args=("documents",)
+        ... )
+        >>> app.on_startup(process_scheduler.start)
+        >>> app.on_shutdown(process_scheduler.stop)
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = os.path.join("db", "scheduler"),
+        class_limits: Optional[Dict[str, int]] = None,
+        default_limit: int = 1,
+        max_threads: int = 4,
+        max_processes: int = 2,
+        tick: float = 1.0,
+        history_size: int = 200,
+    ) -> None:
+        """
+        Args:
+            path (str, optional): File used to persist the job state. Defaults to
+                "db/scheduler", None keeps the state in memory only.
+            class_limits (dict, optional): Maximum concurrent runs per job class.
+                Defaults to None.
+            default_limit (int, optional): Limit of classes missing from
+                `class_limits`. Defaults to 1.
+            max_threads (int, optional): Size of the thread pool. Defaults to 4.
+            max_processes (int, optional): Size of the process pool. Defaults to 2.
+            tick (float, optional): Seconds between checks for due jobs. Defaults to 1.0.
+            history_size (int, optional): Number of finished runs kept for display.
+                Defaults to 200.
+        """
+        self.path = path
+        self.class_limits = dict(class_limits or {})
+        self.default_limit = default_limit
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self.tick = tick
+        self._jobs: Dict[str, Job] = {}
+        self._queue: List[tuple] = []
+        self._sequence = itertools.count()
+        self._running: Dict[str, int] = {}
+        self._tasks: set = set()
+        self._history: deque = deque(maxlen=history_size)
+        self._shelf: Optional[shelve.Shelf] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def shelf(self) -> Optional[shelve.Shelf]:
+        if self._shelf is None and self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._shelf = shelve.open(self.path)
+        return self._shelf
+
+    def _save(self, job: Job) -> None:
+        if self.shelf is not None and job.persistable:
+            self.shelf[job.name] = job.state_dict()
+
+    def _add(self, job: Job, first_run: float, reschedule: bool = False) -> Job:
+        existing = self._jobs.get(job.name)
+        if existing is not None and existing.state in ("queued", "running"):
+            # A second job object would be started next to the first, the
+            # redefinition applies to the next run instead.
+            existing.redefine(job)
+            self._save(existing)
+            return existing
+        if existing is not None:
+            # Keep the counters and the pending run of a job that is redefined.
+            job.restore(existing.state_dict())
+        elif self.shelf is not None and job.name in self.shelf:
+            job.restore(self.shelf[job.name])
+        if reschedule or job.next_run is None or job.state == "done":
+            job.next_run = first_run
+            job.state = "idle"
+        self._jobs[job.name] = job
+        self._save(job)
+        self._wake()
+        return job
+
+    def add_periodic(
+        self,
+        name: str,
+        target: Union[str, Callable],
+        interval: float,
+        delay: Optional[float] = None,
+        **options,
+    ) -> Job:
+        """
+        Run `target` every `interval` seconds.
+
+        Adding a job with the name of an existing one updates its definition, a
+        queued or running job keeps its run and the new definition applies to the
+        following ones. A job that ran before a restart keeps its saved next run
+        time.
+
+        Args:
+            name (str): Unique name of the job.
+            target (str or Callable): The function, or its "module:attribute" path.
+            interval (float): Seconds between the end of a run and the next one.
+            delay (float, optional): Seconds before the first run. Defaults to
+                `interval`.
+            **options: job_class, priority, executor, args and kwargs, see `Job`.
+
+        Returns:
+            Job: The job.
+        """
+        first_run = time.time() + (interval if delay is None else delay)
+        return self._add(Job(name, target, interval=interval, **options), first_run)
+
+    def add_once(
+        self, name: str, target: Union[str, Callable], delay: float = 0.0, **options
+    ) -> Job:
+        """
+        Run `target` once, after `delay` seconds.
+
+        A job with the same name that is queued or running is not run again, it
+        only takes the new definition. One that is waiting runs after `delay`
+        instead of at its previous time.
+
+        Args:
+            name (str): Unique name of the job.
+            target (str or Callable): The function, or its "module:attribute" path.
+                Only jobs given by path are restored after a restart.
+            delay (float, optional): Seconds before the run. Defaults to 0.0.
+            **options: job_class, priority, executor, args and kwargs, see `Job`.
+
+        Returns:
+            Job: The job.
+        """
+        job = Job(name, target, **options)
+        return self._add(job, time.time() + delay, reschedule=True)
+
+    def remove(self, name: str) -> None:
+        """Forget a job. A run in progress is not interrupted."""
+        job = self._jobs.pop(name, None)
+        if job is not None and self.shelf is not None:
+            self.shelf.pop(name, None)
+
+    def run_now(self, name: str) -> None:
+        """Queue a job immediately, unless it is already queued or running."""
+        job = self._jobs[name]
+        if job.state not in ("queued", "running"):
+            job.next_run = time.time()
+            job.state = "idle"
+            self._wake()
+
+    def pause(self, name: str) -> None:
+        """Stop scheduling a job until it is resumed."""
+        self._jobs[name].paused = True
+        self._save(self._jobs[name])
+
+    def resume(self, name: str) -> None:
+        """Schedule a paused job again."""
+        self._jobs[name].paused = False
+        self._save(self._jobs[name])
+        self._wake()
+
+    def jobs(self) -> List[dict]:
+        """Return every job as a dictionary, queued and running ones first."""
+        order = {"running": 0, "queued": 1}
+        return sorted(
+            (job.snapshot() for job in self._jobs.values()),
+            key=lambda job: (order.get(job["state"], 2), job["next_run"] or 0),
+        )
+
+    def history(self) -> List[dict]:
+        """Return the most recent finished runs, newest first."""
+        return list(reversed(self._history))
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _enqueue_due(self) -> None:
+        now = time.time()
+        for job in self._jobs.values():
+            if (
+                job.state in ("idle", "failed")
+                and not job.paused
+                and job.next_run is not None
+                and job.next_run <= now
+            ):
+                job.state = "queued"
+                job.queued_at = now
+                heapq.heappush(self._queue, (job.priority, next(self._sequence), job))
+
+    def _dispatch(self) -> None:
+        blocked = []
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            job = entry[2]
+            if self._jobs.get(job.name) is not job or job.state != "queued":
+                continue
+            limit = self.class_limits.get(job.job_class, self.default_limit)
+            if self._running.get(job.job_class, 0) >= limit:
+                blocked.append(entry)
+                continue
+            self._running[job.job_class] = self._running.get(job.job_class, 0) + 1
+            task = asyncio.ensure_future(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+
+    def _executor(self, job: Job):
+        if job.executor == "process":
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(self.max_processes)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                self.max_threads, thread_name_prefix="yose-job"
+            )
+        return self._threads
+
+    async def _call(self, job: Job):
+        function = resolve(job.target)
+        if inspect.iscoroutinefunction(function):
+            return await function(*job.args, **job.kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor(job), functools.partial(function, *job.args, **job.kwargs)
+        )
+
+    async def _execute(self, job: Job) -> None:
+        # The job may be redefined into another class while it runs.
+        job_class = job.job_class
+        job.state = "running"
+        job.started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            with JOB_RUN.time(job=job.name):
+                await self._call(job)
+        except asyncio.CancelledError:
+            error = "cancelled"
+            raise
+        except Exception as e:
+            error = repr(e)
+            logger.exception(f"Job {job.name} failed: {e!r}")
+        finally:
+            job.last_duration = time.perf_counter() - start
+            job.last_run = job.started_at
+            job.last_error = error
+            job.runs += 1
+            if error is not None:
+                job.failures += 1
+            if job.periodic:
+                job.state = "failed" if error else "idle"
+                job.next_run = time.time() + job.interval
+            else:
+                job.state = "failed" if error else "done"
+                job.next_run = None
+            self._history.append(
+                {
+                    "name": job.name,
+                    "started": job.started_at,
+                    "queued": job.started_at - (job.queued_at or job.started_at),
+                    "duration": job.last_duration,
+                    "error": error,
+                }
+            )
+            self._running[job_class] -= 1
+            if self._jobs.get(job.name) is job:
+                self._save(job)
+            self._wake()
+
+    def _restore_pending(self) -> None:
+        if self.shelf is None:
+            return
+        for name, state in self.shelf.items():
+            definition = state.get("definition")
+            if name in self._jobs or definition is None:
+                continue
+            if state.get("next_run") is None:
+                # Finished one-shot job, nothing left to do.
+                continue
+            job = Job(name, **definition)
+            job.restore(state)
+            self._jobs[name] = job
+
+    async def run(self) -> None:
+        """Queue and start due jobs until cancelled."""
+        while True:
+            self._enqueue_due()
+            self._dispatch()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.tick)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        """Start scheduling on the running event loop."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._restore_pending()
+            self._task = asyncio.ensure_future(self.run())
+            logger.debug(f"Process scheduler started with {len(self._jobs)} jobs")
+
+    async def stop(self) -> None:
+        """Stop scheduling, cancel runs on the event loop and save the job state."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for job in self._jobs.values():
+            if job.state in ("queued", "running"):
+                # Run it again first thing after the restart.
+                job.state = "idle"
+                job.next_run = time.time()
+            self._save(job)
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                if sys.version_info >= (3, 9):
+                    pool.shutdown(wait=False, cancel_futures=True)
+                else:
+                    pool.shutdown(wait=False)
+        self._threads = self._processes = None
+        if self._shelf is not None:
+            self._shelf.close()
+            self._shelf = None
+        logger.debug("Process scheduler stopped")
+
+    def stats(self) -> dict:
+        """
+        Return the number of jobs in each state.
+
+        Returns:
+            dict: Counts keyed by state (idle, queued, running, done, failed, paused).
+        """
+        counts = dict.fromkeys(("idle", "queued", "running", "done", "failed"), 0)
+        counts["paused"] = 0
+        for job in self._jobs.values():
+            counts["paused" if job.paused else job.state] += 1
+        return counts
+
+
+process_scheduler = ProcessScheduler(class_limits={"maintenance": 1, "network": 2})
+metrics.gauge(
+    "yose_scheduled_jobs", "Scheduled jobs by state.", process_scheduler.stats
+)
@@ -0,0 +1,332 @@
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from yose.config.db.Model import IndexItems
+from yose.index_manager import index_manager
+from yose.lexicon import field_words
+from yose.metrics import metrics
+
+SPELLING_FIELDS = ["title", "content", "keywords"]
+
+SPELLING_BUILD = metrics.histogram(
+    "yose_spelling_build_seconds", "Time spent building the spelling dictionary."
+)
+
+# Words of a query, but not field names, wildcards or fuzzy terms.
+_QUERY_WORD = re.compile(r"(?<![\w~*?])([^\W\d_]{2,})(?![\w:~*?])", re.UNICODE)
+_OPERATORS = {"AND", "OR", "NOT", "ANDNOT", "ANDMAYBE", "TO"}
+_HASH_BITS = 40
+_ID_BITS = 24
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    # Every string obtained by removing up to `distance` characters from `word`.
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {
+            candidate[:i] + candidate[i + 1 :]
+            for candidate in frontier
+            if len(candidate) > 1
+            for i in range(len(candidate))
+        }
+        found |= frontier
+    return found
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """
+    Return the optimal string alignment distance of two words, at most `limit + 1`.
+
+    Insertions, deletions, substitutions and transpositions of adjacent characters
+    count as one edit each.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    # Typos are local, only what lies between the common prefix and suffix
+    # needs the table.
+    start = 0
+    while start < min(len(first), len(second)) and first[start] == second[start]:
+        start += 1
+    end = 0
+    while (
+        end < min(len(first), len(second)) - start
+        and first[-1 - end] == second[-1 - end]
+    ):
+        end += 1
+    first, second = first[start : len(first) - end], second[start : len(second) - end]
+    if not first or not second:
+        return min(max(len(first), len(second)), limit + 1)
+
+    previous2: List[int] = []
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if (
+                i > 1
+                and j > 1
+                and first[i - 1] == second[j - 2]
+                and first[i - 2] == second[j - 1]
+            ):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SymmetricDeleteDictionary:
+    """
+    Spelling dictionary using symmetric delete candidate generation.
+
+    Words and misspellings within `max_distance` edits share at least one string
+    obtained by deleting up to `max_distance` characters from each, so the
+    deletes of every dictionary word are indexed once and a lookup only
+    generates the deletes of the misspelled word. No edit is ever tried against
+    the whole vocabulary. Only the first `prefix_length` characters are used for
+    the deletes, which bounds their number per word.
+
+    The deletes are kept as one sorted array of (delete hash, word number)
+    integers, 8 bytes each, about 30 per word.
+    """
+
+    def __init__(
+        self, frequencies: Dict[str, int], max_distance: int = 2, prefix_length: int = 7
+    ) -> None:
+        """
+        Args:
+            frequencies (dict): Document frequency of each word.
+            max_distance (int, optional): Maximum edits of a correction. Defaults to 2.
+            prefix_length (int, optional): Characters of each word the deletes are
+                made from. Defaults to 7.
+        """
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words = list(frequencies)
+        self.frequencies = frequencies
+        if len(self.words) >= 1 << _ID_BITS:
+            raise ValueError(f"At most {1 << _ID_BITS} words are supported")
+
+        entries = []
+        for number, word in enumerate(self.words):
+            for delete in _deletes(word[:prefix_length], max_distance):
+                entries.append(self._hash(delete) << _ID_BITS | number)
+        entries.sort()
+        self.entries = array("Q", entries)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        # The dictionary only lives in memory, the per-process hash() is fine.
+        return hash(value) & ((1 << _HASH_BITS) - 1)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.frequencies
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def candidates(self, word: str) -> Set[str]:
+        """Return the dictionary words sharing a delete with `word`."""
+        found = set()
+        for delete in _deletes(word[: self.prefix_length], self.max_distance):
+            key = self._hash(delete) << _ID_BITS
+            position = bisect_left(self.entries, key)
+            while (
+                position < len(self.entries)
+                and self.entries[position] >> _ID_BITS == key >> _ID_BITS
+            ):
+                found.add(self.words[self.entries[position] & ((1 << _ID_BITS) - 1)])
+                position += 1
+        return found
+
+    def correct(self, word: str) -> Optional[str]:
+        """
+        Return the most frequent word among the closest ones to `word`.
+
+        Args:
+            word (str): A lowercase word.
+
+        Returns:
+            str or None: The correction, or None if `word` is known or nothing is
+            within `max_distance` edits.
+        """
+        if word in self.frequencies:
+            return None
+        best, best_key = None, None
+        for candidate in self.candidates(word):
+            distance = edit_distance(word, candidate, self.max_distance)
+            if distance > self.max_distance:
+                continue
+            key = (distance, -self.frequencies[candidate], candidate)
+            if best_key is None or key < best_key:
+                best, best_key = candidate, key
+        return best
+
+
+class SpellingCorrector:
+    """
+    Suggests corrected queries from the words of the index.
+
+    The dictionary is built from the `title`, `content` and `keywords` fields,
+    see `field_words`, and only rebuilt by `refresh` when the index generation
+    changed. The words of each segment are counted once and kept, segments never
+    change, so a refresh only reads the segments written since the last one and
+    adds up the counts. The deletes are only indexed again when the set of words
+    changed. Words in fewer than `min_frequency` documents are left out, so the
+    dictionary is not full of the typos it should correct.
+
+    Usage:
+        >>> spelling_corrector.refresh()
+        >>> spelling_corrector.suggest("red cta")
+        'red cat'
+    """
+
+    def __init__(
+        self,
+        indexname: str = "documents",
+        schema=IndexItems,
+        fields: Iterable[str] = SPELLING_FIELDS,
+        max_words: int = 100000,
+        min_frequency: int = 3,
+        max_distance: int = 2,
+    ) -> None:
+        """
+        Args:
+            indexname (str, optional): The index to read. Defaults to "documents".
+            schema (IndexItems, optional): The schema of the index. Defaults to
+                IndexItems.
+            fields (Iterable[str], optional): Fields the words come from. Defaults to
+                SPELLING_FIELDS.
+            max_words (int, optional): The most frequent words kept. Defaults to 100000.
+            min_frequency (int, optional): Words in fewer documents are left out.
+                Defaults to 3.
+            max_distance (int, optional): Maximum edits per corrected word.
+                Defaults to 2.
+        """
+        self.indexname = indexname
+        self.schema = schema
+        self.fields = list(fields)
+        self.max_words = max_words
+        self.min_frequency = min_frequency
+        self.max_distance = max_distance
+        self.dictionary: Optional[SymmetricDeleteDictionary] = None
+        self.generation: Optional[int] = None
+        self._segments: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self.suggestions = 0
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the dictionary if the index changed since it was built.
+
+        Returns:
+            bool: True if the dictionary was rebuilt.
+        """
+        with self._lock:
+            with index_manager.searcher(self.indexname, self.schema) as searcher:
+                generation = searcher.reader().generation()
+                if generation == self.generation:
+                    return False
+                start = time.perf_counter()
+                with SPELLING_BUILD.time():
+                    words = self._count(searcher)
+                    frequencies = {
+                        word: frequency
+                        for word, frequency in words.most_common(self.max_words)
+                        if frequency >= self.min_frequency and not word.isdigit()
+                    }
+                    dictionary = self.dictionary
+                    if (
+                        dictionary is not None
+                        and frequencies.keys() == dictionary.frequencies.keys()
+                    ):
+                        # Same words, the deletes index still holds.
+                        dictionary.frequencies = frequencies
+                    else:
+                        self.dictionary = SymmetricDeleteDictionary(
+                            frequencies, self.max_distance
+                        )
+            self.generation = generation
+            logger.debug(
+                f"Built a spelling dictionary of {len(frequencies)} words"
+                f" in {time.perf_counter() - start:.2f}s"
+            )
+            return True
+
+    def _count(self, searcher) -> Counter:
+        # Adds up the word counts of every segment, counting new segments only.
+        counts: Dict[str, Counter] = {}
+        for leaf, _ in searcher.leaf_searchers():
+            segment = leaf.reader().segment()
+            if segment is None:
+                # An empty index.
+                continue
+            key = segment.segment_id()
+            words = self._segments.get(key)
+            if words is None:
+                words = field_words(leaf, self.fields)
+            counts[key] = words
+        # Merged away segments are not coming back.
+        self._segments = counts
+        total = Counter()
+        for words in counts.values():
+            total.update(words)
+        return total
+
+    def suggest(self, query: str) -> Optional[str]:
+        """
+        Return the query with its unknown words corrected.
+
+        Field names, wildcards, fuzzy terms and operators are left as they are.
+
+        Args:
+            query (str): The query string.
+
+        Returns:
+            str or None: The corrected query, or None if there is nothing to correct
+            or no dictionary was built yet.
+        """
+        dictionary = self.dictionary
+        if dictionary is None:
+            return None
+
+        def correct(match: re.Match) -> str:
+            word = match.group(1)
+            if word in _OPERATORS:
+                return word
+            correction = dictionary.correct(word.lower())
+            return correction if correction is not None else word
+
+        suggestion = _QUERY_WORD.sub(correct, query)
+        if suggestion == query:
+            return None
+        self.suggestions += 1
+        return suggestion
+
+    def stats(self) -> dict:
+        """
+        Return the dictionary size.
+
+        Returns:
+            dict: words in the dictionary and suggestions made.
+        """
+        return {
+            "words": len(self.dictionary) if self.dictionary is not None else 0,
+            "suggestions": self.suggestions,
+        }
+
+
+spelling_corrector = SpellingCorrector()
+metrics.gauge("yose_spelling", "Spelling dictionary size.", spelling_corrector.stats)
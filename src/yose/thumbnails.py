@@ -0,0 +1,466 @@
+import asyncio
+import hashlib
+import hmac
+import io
+import ipaddress
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode, urljoin, urlsplit
+
+import httpx
+from loguru import logger
+from PIL import Image, ImageOps
+
+from yose.metrics import metrics
+
+THUMBNAIL = metrics.histogram(
+    "yose_thumbnail_seconds", "Time spent fetching and resizing thumbnails."
+)
+
+# Bounding boxes of the tiles the pages show, thumbnails keep their aspect ratio.
+SIZES = {
+    "small": (150, 100),
+    "tile": (300, 200),
+    "large": (600, 400),
+}
+
+
+class ThumbnailError(Exception):
+    """Raised when a thumbnail could not be made for an image URL."""
+
+
+def thumbnail_url(url: str, size: str = "tile") -> str:
+    """
+    Return the address of the local thumbnail of an image.
+
+    The address is signed, the `/thumbnail` endpoint only serves images the app
+    itself linked to, see `ThumbnailCache.verify`.
+
+    Args:
+        url (str): The original image URL.
+        size (str, optional): One of SIZES. Defaults to "tile".
+
+    Returns:
+        str: A path served by the `/thumbnail` endpoint.
+    """
+    signature = thumbnail_cache.sign(url, size)
+    return "/thumbnail?" + urlencode({"url": url, "size": size, "sig": signature})
+
+
+def make_thumbnail(data: bytes, size: Tuple[int, int], quality: int = 80) -> bytes:
+    """
+    Resize an image to fit in a box and encode it as a progressive JPEG.
+
+    Args:
+        data (bytes): The original image, in any format Pillow reads.
+        size (tuple): The (width, height) box.
+        quality (int, optional): JPEG quality. Defaults to 80.
+
+    Returns:
+        bytes: The encoded thumbnail.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets JPEG decode straight at a fraction of the full resolution.
+        image.draft("RGB", size)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail(size, Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+        return output.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Fetches remote images once and keeps small thumbnails of them on disk.
+
+    Thumbnails are content-addressed: files are named after the hash of their
+    bytes, so the same picture found at many URLs is stored once, and the hash
+    doubles as a strong ETag. A SQLite table maps (url, size) to the hash and
+    records when each file was last used. Once the files take more than
+    `max_bytes`, the least recently used ones are deleted.
+
+    Concurrent requests for the same thumbnail share a single download, and URLs
+    that failed are not retried for `failure_ttl` seconds.
+
+    Only public addresses are fetched: the host of the URL and of every redirect
+    is resolved first and loopback, private, link-local and other reserved
+    addresses are refused, so the server cannot be used to reach its own network.
+    The request then goes to the address that was checked, not to a second lookup.
+
+    Usage:
+        >>> digest, data = await thumbnail_cache.get(url, "tile")
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join("db", "thumbnails"),
+        max_bytes: int = 512 * 1024 * 1024,
+        max_source_bytes: int = 20 * 1024 * 1024,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        quality: int = 80,
+        failure_ttl: float = 600.0,
+        commit_every: int = 100,
+        max_redirects: int = 5,
+        allow_private: bool = False,
+    ) -> None:
+        """
+        Args:
+            path (str, optional): Directory of the thumbnails and their index.
+                Defaults to "db/thumbnails".
+            max_bytes (int, optional): Disk space the thumbnails may take.
+                Defaults to 512 MiB.
+            max_source_bytes (int, optional): Larger original images are not
+                downloaded. Defaults to 20 MiB.
+            timeout (float, optional): Per request timeout in seconds. Defaults to 10.0.
+            max_connections (int, optional): Size of the connection pool. Defaults to 20.
+            quality (int, optional): JPEG quality of the thumbnails. Defaults to 80.
+            failure_ttl (float, optional): Seconds a failed URL is not retried.
+                Defaults to 600.0.
+            commit_every (int, optional): Changes between two commits. Defaults to 100.
+            max_redirects (int, optional): Redirects followed per image. Defaults to 5.
+            allow_private (bool, optional): Also fetch images from non-public
+                addresses, for local testing only. Defaults to False.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_source_bytes = max_source_bytes
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.quality = quality
+        self.failure_ttl = failure_ttl
+        self.commit_every = commit_every
+        self.max_redirects = max_redirects
+        self.allow_private = allow_private
+        self._key: Optional[bytes] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._failures: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._pending = 0
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                # Followed by _download, which checks every address first.
+                follow_redirects=False,
+                headers={"Accept": "image/*"},
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    @property
+    def key(self) -> bytes:
+        # Kept on disk so thumbnail addresses stay valid across restarts.
+        with self._lock:
+            if self._key is None:
+                filename = os.path.join(self.path, "secret.key")
+                os.makedirs(self.path, exist_ok=True)
+                try:
+                    with open(filename, "rb") as f:
+                        self._key = f.read()
+                except FileNotFoundError:
+                    self._key = os.urandom(32)
+                    with open(filename, "wb") as f:
+                        f.write(self._key)
+            return self._key
+
+    def sign(self, url: str, size: str) -> str:
+        """Return the signature of a thumbnail address, see `thumbnail_url`."""
+        message = f"{size}\n{url}".encode("utf-8")
+        return hmac.new(self.key, message, hashlib.sha256).hexdigest()[:32]
+
+    def verify(self, url: str, size: str, signature: str) -> bool:
+        """Return True if `signature` was made by `sign` for this url and size."""
+        return hmac.compare_digest(self.sign(url, size), signature or "")
+
+    async def _check_address(self, url: str) -> Optional[str]:
+        # Returns the checked address, which _download connects to so that the
+        # host cannot resolve to another one in between (DNS rebinding).
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ThumbnailError(f"Not an http(s) URL: {url!r}")
+        if self.allow_private:
+            return None
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, port, type=socket.SOCK_STREAM
+        )
+        if not infos:
+            raise ThumbnailError(f"{url} does not resolve")
+        for *_, sockaddr in infos:
+            address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+            if not address.is_global:
+                raise ThumbnailError(f"{url} resolves to a non-public address")
+        return str(ipaddress.ip_address(infos[0][4][0]))
+
+    def _open(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._db = sqlite3.connect(
+                os.path.join(self.path, "index.sqlite"), check_same_thread=False
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                "url TEXT NOT NULL, size TEXT NOT NULL, digest TEXT NOT NULL,"
+                " PRIMARY KEY (url, size)) WITHOUT ROWID"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "digest TEXT PRIMARY KEY, bytes INTEGER NOT NULL, used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS files_used ON files (used)")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS sources_digest ON sources (digest)"
+            )
+            self.total_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM files"
+            ).fetchone()[0]
+        return self._db
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], digest + ".jpg")
+
+    def _changed(self) -> None:
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._db.commit()
+            self._pending = 0
+
+    def _lookup(self, url: str, size: str) -> Optional[Tuple[str, bytes]]:
+        with self._lock:
+            db = self._open()
+            row = db.execute(
+                "SELECT files.digest, files.bytes FROM sources JOIN files"
+                " ON files.digest = sources.digest"
+                " WHERE sources.url = ? AND sources.size = ?",
+                (url, size),
+            ).fetchone()
+            if row is None:
+                return None
+            digest, length = row
+            db.execute(
+                "UPDATE files SET used = ? WHERE digest = ?", (time.time(), digest)
+            )
+            self._changed()
+        try:
+            with open(self._file(digest), "rb") as f:
+                return digest, f.read()
+        except FileNotFoundError:
+            with self._lock:
+                # Deleted behind our back, make it again.
+                removed = db.execute(
+                    "DELETE FROM files WHERE digest = ?", (digest,)
+                ).rowcount
+                db.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+                self.total_bytes -= length * removed
+                self._changed()
+            return None
+
+    def _store(self, url: str, size: str, data: bytes) -> str:
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            db = self._open()
+            filename = self._file(digest)
+            if not os.path.exists(filename):
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                temporary = filename + ".tmp"
+                with open(temporary, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, filename)
+            added = db.execute(
+                "INSERT OR IGNORE INTO files VALUES (?, ?, ?)",
+                (digest, len(data), time.time()),
+            ).rowcount
+            if added:
+                self.total_bytes += len(data)
+            db.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (url, size, digest)
+            )
+            self._changed()
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            return digest
+
+    def _evict(self) -> None:
+        # Down to 90% so eviction does not run again on the very next store.
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT digest, bytes FROM files ORDER BY used")
+        victims = []
+        for digest, size in rows:
+            if self.total_bytes <= target:
+                break
+            victims.append(digest)
+            self.total_bytes -= size
+        for digest in victims:
+            self._db.execute("DELETE FROM files WHERE digest = ?", (digest,))
+            self._db.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+            try:
+                os.remove(self._file(digest))
+            except FileNotFoundError:
+                pass
+        self._db.commit()
+        self._pending = 0
+        self.evictions += len(victims)
+        logger.debug(f"Evicted {len(victims)} thumbnails")
+
+    async def _download(self, url: str) -> bytes:
+        for _ in range(self.max_redirects + 1):
+            address = await self._check_address(url)
+            request = self.client.build_request("GET", url)
+            if address is not None:
+                # Connect to the checked address, but keep the name for the
+                # Host header, TLS server name and certificate check.
+                request.url = request.url.copy_with(host=address)
+                request.extensions["sni_hostname"] = urlsplit(url).hostname
+            response = await self.client.send(request, stream=True)
+            try:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers["location"])
+                    continue
+                return await self._read(url, response)
+            finally:
+                await response.aclose()
+        raise ThumbnailError(f"Too many redirects for {url}")
+
+    async def _read(self, url: str, response: httpx.Response) -> bytes:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "image/")
+        if not content_type.startswith("image/"):
+            raise ThumbnailError(f"{url} is not an image ({content_type})")
+        length = response.headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_source_bytes:
+            raise ThumbnailError(f"{url} is larger than {self.max_source_bytes}")
+        data = bytearray()
+        async for chunk in response.aiter_bytes():
+            data += chunk
+            if len(data) > self.max_source_bytes:
+                raise ThumbnailError(f"{url} is larger than {self.max_source_bytes}")
+        return bytes(data)
+
+    async def _create(self, url: str, size: str) -> Tuple[str, bytes]:
+        loop = asyncio.get_running_loop()
+        with THUMBNAIL.time(stage="fetch"):
+            original = await self._download(url)
+        with THUMBNAIL.time(stage="resize"):
+            data = await loop.run_in_executor(
+                None, make_thumbnail, original, SIZES[size], self.quality
+            )
+        digest = await loop.run_in_executor(None, self._store, url, size, data)
+        return digest, data
+
+    async def get(self, url: str, size: str = "tile") -> Tuple[str, bytes]:
+        """
+        Return the thumbnail of an image, making it on the first request.
+
+        Args:
+            url (str): The original image URL, http or https.
+            size (str, optional): One of SIZES. Defaults to "tile".
+
+        Returns:
+            tuple: The content hash and the JPEG bytes of the thumbnail.
+
+        Raises:
+            ThumbnailError: If the URL or size is not valid, or the image could not
+                be downloaded or decoded.
+        """
+        if size not in SIZES:
+            raise ThumbnailError(f"Unknown thumbnail size {size!r}")
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise ThumbnailError(f"Not an http(s) URL: {url!r}")
+
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, self._lookup, url, size)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        failed_at = self._failures.get(url)
+        if failed_at is not None and time.monotonic() - failed_at < self.failure_ttl:
+            raise ThumbnailError(f"{url} failed recently")
+
+        key = (url, size)
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(self._create(url, size))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            return await asyncio.shield(future)
+        except ThumbnailError:
+            self._fail(url)
+            raise
+        except (
+            httpx.HTTPError,
+            OSError,
+            ValueError,
+            Image.DecompressionBombError,
+        ) as e:
+            self._fail(url)
+            raise ThumbnailError(f"Could not make a thumbnail of {url}: {e!r}") from e
+
+    def _fail(self, url: str) -> None:
+        self.errors += 1
+        self._failures[url] = time.monotonic()
+        if len(self._failures) > 10000:
+            now = time.monotonic()
+            self._failures = {
+                failed: at
+                for failed, at in self._failures.items()
+                if now - at < self.failure_ttl
+            }
+
+    async def close(self) -> None:
+        """Close the pooled connections and the index."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: bytes on disk, hits, misses, errors and evictions.
+        """
+        return {
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "evictions": self.evictions,
+        }
+
+
+thumbnail_cache = ThumbnailCache()
+metrics.gauge("yose_thumbnails", "Thumbnail cache counters.", thumbnail_cache.stats)
@@ -1,12 +1,30 @@
 import ctypes
 import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable, Optional
 
 from whoosh import index
-from whoosh.fields import Schema
-from whoosh.qparser import FuzzyTermPlugin, MultifieldParser, QueryParser
+from whoosh.fields import BOOLEAN, DATETIME, NUMERIC, Schema
+from whoosh.qparser import FuzzyTermPlugin, MultifieldParser
+from whoosh.query import Every
+from whoosh.searching import ResultsPage
 
 import yose
 from yose.config.db.Model import IndexItems, Options
+from yose.facets import Filters, as_where, facet_counter
+from yose.filters import DEFAULT_WHERE, Where, filter_cache, normalize
+from yose.index_manager import index_manager
+from yose.merge import merge_scheduler
+from yose.metrics import COMMIT, SEARCH
+from yose.options import OptionsStore, options_store
+from yose.ranking import ranking_engine
+from yose.spelling import spelling_corrector
+
+# Seconds a write waits for another writer to release the lock, background merges
+# are waited for until they end, see MergeScheduler.writer.
+WRITE_LOCK_TIMEOUT = 30.0
 
 if not os.path.exists("db"):
     os.mkdir("db")
@@ -14,7 +32,8 @@ if not os.path.exists("db"):
 module_name = yose
 
 APP_ID = f"yose.Sygil-Dev.version.{module_name.__version__}"
-ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(APP_ID)
+if os.name == "nt":
+    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(APP_ID)
 
 
 def set_icon(icon_path: str = "src/yose/assets/icon.ico") -> None:
@@ -146,11 +165,73 @@ def make_document_index(indexname="documents", schema=IndexItems) -> index.Index
     Returns:
         index.Index: An instance of the index.Index class.
     """
-    if check_if_index_exists("db", indexname=indexname):
-        ix = index.open_dir("db", indexname=indexname, schema=schema)
-    else:
-        ix = create_index(schema, indexname)
-    return ix
+    return index_manager.get_index(indexname, schema)
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if not isinstance(value, datetime):
+        value = str(value).strip()
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                # RFC 822 dates, as used by YaCy for pubDate.
+                value = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+
+    # Whoosh drops the timezone when indexing, so store everything as naive UTC.
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def coerce_document(values: dict, schema: Schema) -> dict:
+    """
+    Convert a dictionary of raw values to the field types of a schema.
+
+    Keys that are not fields of the schema and empty values are dropped, numbers and
+    dates given as strings are parsed, and values for text fields are converted to
+    strings. Values that cannot be converted are dropped as well, so the result can
+    always be passed to `writer.add_document`.
+
+    Args:
+        values (dict): The raw values, e.g. a YaCy result item or stored fields.
+        schema (Schema): The schema to convert to.
+
+    Returns:
+        dict: The converted document.
+    """
+    document = {}
+    for name, value in values.items():
+        if name not in schema or value is None or value == "":
+            continue
+        field = schema[name]
+
+        # DATETIME is a subclass of NUMERIC so it has to be checked first.
+        if isinstance(field, DATETIME):
+            value = _parse_datetime(value)
+        elif isinstance(field, NUMERIC):
+            try:
+                value = field.numtype(value)
+            except (TypeError, ValueError):
+                try:
+                    value = field.numtype(float(value))
+                except (TypeError, ValueError):
+                    value = None
+        elif isinstance(field, BOOLEAN):
+            if isinstance(value, str):
+                value = value.strip().lower() in ("true", "1", "yes", "on")
+            else:
+                value = bool(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        else:
+            value = str(value)
+
+        if value is not None:
+            document[name] = value
+    return document
 
 
 def add_document(document: dict, indexname="documents", schema=IndexItems) -> None:
@@ -174,14 +255,16 @@ def add_document(document: dict, indexname="documents", schema=IndexItems) -> No
         }
         add_document(document, indexname="myindex", schema=MySchema)
     """
-    if check_if_index_exists("db", indexname=indexname):
-        ix = index.open_dir("db", indexname=indexname, schema=schema)
-    else:
-        ix = make_document_index()
+    ix = make_document_index(indexname=indexname, schema=schema)
 
-    writer = ix.writer()
+    writer = merge_scheduler.writer(ix, indexname, timeout=WRITE_LOCK_TIMEOUT)
     writer.add_document(**document)
-    writer.commit(merge=True, optimize=True)
+    with COMMIT.time():
+        # Merging is left to the merge scheduler so the commit cost does not grow
+        # with the index.
+        writer.commit(merge=False)
+    index_manager.invalidate(indexname)
+    merge_scheduler.notify(indexname, schema)
 
 
 # add_document(
@@ -210,52 +293,478 @@ def delete_document(guid: str, indexname="documents", schema=IndexItems) -> None
         indexname (str, optional): The name of the search index. Defaults to "items".
         schema (IndexItems, optional): The schema of the search index. Defaults to IndexItems.
     """
-    ix = index.open_dir("db", indexname=indexname, schema=schema)
-    writer = ix.writer()
+    ix = make_document_index(indexname=indexname, schema=schema)
+    writer = merge_scheduler.writer(ix, indexname, timeout=WRITE_LOCK_TIMEOUT)
     writer.delete_by_term("guid", guid)
-    writer.commit(merge=True, optimize=True)
+    with COMMIT.time():
+        writer.commit(merge=False)
+    index_manager.invalidate(indexname)
+    merge_scheduler.notify(indexname, schema)
 
 
 def update_document(document: dict, indexname="documents", schema=IndexItems) -> None:
-    ix = index.open_dir("db", indexname=indexname, schema=schema)
-    writer = ix.writer()
+    ix = make_document_index(indexname=indexname, schema=schema)
+    writer = merge_scheduler.writer(ix, indexname, timeout=WRITE_LOCK_TIMEOUT)
     writer.update_document(**document)
-    writer.commit(merge=True, optimize=True)
+    with COMMIT.time():
+        writer.commit(merge=False)
+    index_manager.invalidate(indexname)
+    merge_scheduler.notify(indexname, schema)
+
+
+def _write_in_batches(
+    items: Iterable,
+    action: Callable,
+    indexname: str,
+    schema,
+    batch_size: int,
+    commit_every_seconds: Optional[float],
+) -> int:
+    """
+    Stream items into an index through a single writer, committing in batches.
+
+    Each commit uses Whoosh's default merge policy (small segments are merged,
+    the index is never optimized) so the cost of a commit depends on the size of
+    the batch, not on the size of the index. Bigger merges are left to the merge
+    scheduler.
+
+    Args:
+        items (Iterable): The items to write. Can be a generator, it is consumed lazily.
+        action (Callable): Called as ``action(writer, item)`` for every item.
+        indexname (str): The name of the index to write to.
+        schema (Schema): The schema of the index.
+        batch_size (int): Commit after this many items.
+        commit_every_seconds (float, optional): Also commit when this many seconds
+            have passed since the last commit. None disables time based commits.
+
+    Returns:
+        int: The number of items written.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+
+    ix = make_document_index(indexname=indexname, schema=schema)
+
+    count = 0
+    pending = 0
+    writer = None
+    last_commit = time.monotonic()
+    try:
+        for item in items:
+            if writer is None:
+                writer = merge_scheduler.writer(
+                    ix, indexname, timeout=WRITE_LOCK_TIMEOUT
+                )
+            action(writer, item)
+            count += 1
+            pending += 1
+
+            if pending >= batch_size or (
+                commit_every_seconds is not None
+                and time.monotonic() - last_commit >= commit_every_seconds
+            ):
+                with COMMIT.time():
+                    writer.commit(merge=True)
+                index_manager.invalidate(indexname)
+                merge_scheduler.notify(indexname, schema)
+                writer = None
+                pending = 0
+                last_commit = time.monotonic()
+
+        if writer is not None:
+            with COMMIT.time():
+                writer.commit(merge=True)
+            index_manager.invalidate(indexname)
+            merge_scheduler.notify(indexname, schema)
+            writer = None
+    finally:
+        # Only reached with an open writer if something failed mid-batch, in which
+        # case we drop the uncommitted batch and release the lock.
+        if writer is not None:
+            writer.cancel()
+
+    return count
+
+
+def add_documents(
+    documents: Iterable[dict],
+    indexname="documents",
+    schema=IndexItems,
+    batch_size: int = 1000,
+    commit_every_seconds: Optional[float] = None,
+) -> int:
+    """
+    Add many documents to the search index using a single writer.
+
+    Unlike add_document, this does not commit the index for every
+    document, it commits every `batch_size` documents (or every
+    `commit_every_seconds` seconds) and leaves merging to the default merge policy.
+
+    Args:
+        documents (Iterable[dict]): The documents to add, can be a generator.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+        batch_size (int, optional): Number of documents per commit. Defaults to 1000.
+        commit_every_seconds (float, optional): Maximum time between commits. Defaults to None.
+
+    Returns:
+        int: The number of documents added.
+
+    Example:
+        >>> add_documents(result for result in results if result.get("guid"))
+    """
+    return _write_in_batches(
+        documents,
+        lambda writer, document: writer.add_document(**document),
+        indexname,
+        schema,
+        batch_size,
+        commit_every_seconds,
+    )
+
+
+def update_documents(
+    documents: Iterable[dict],
+    indexname="documents",
+    schema=IndexItems,
+    batch_size: int = 1000,
+    commit_every_seconds: Optional[float] = None,
+) -> int:
+    """
+    Update (or insert) many documents in the search index using a single writer.
+
+    Documents are matched on the unique fields of the schema (`guid` and `urlhash`
+    for IndexItems), same as update_document.
+
+    Args:
+        documents (Iterable[dict]): The documents to update, can be a generator.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+        batch_size (int, optional): Number of documents per commit. Defaults to 1000.
+        commit_every_seconds (float, optional): Maximum time between commits. Defaults to None.
+
+    Returns:
+        int: The number of documents updated.
+    """
+    return _write_in_batches(
+        documents,
+        lambda writer, document: writer.update_document(**document),
+        indexname,
+        schema,
+        batch_size,
+        commit_every_seconds,
+    )
+
+
+def delete_documents(
+    guids: Iterable[str],
+    indexname="documents",
+    schema=IndexItems,
+    fieldname: str = "guid",
+    batch_size: int = 1000,
+    commit_every_seconds: Optional[float] = None,
+) -> int:
+    """
+    Delete many documents from the search index using a single writer.
+
+    Args:
+        guids (Iterable[str]): The values of `fieldname` to delete, can be a generator.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+        fieldname (str, optional): The field the values are matched on. Defaults to "guid".
+        batch_size (int, optional): Number of deletions per commit. Defaults to 1000.
+        commit_every_seconds (float, optional): Maximum time between commits. Defaults to None.
+
+    Returns:
+        int: The number of delete terms processed.
+    """
+    return _write_in_batches(
+        guids,
+        lambda writer, guid: writer.delete_by_term(fieldname, guid),
+        indexname,
+        schema,
+        batch_size,
+        commit_every_seconds,
+    )
+
+
+SEARCH_FIELDS = [
+    "title",
+    "content",
+    "author",
+    "category",
+    "keywords",
+    "description",
+]
+
+# The stored fields search_page returns by default.
+PAGE_FIELDS = ("title", "url", "host")
+
+
+def parse_query(query: str, fields: list, ix: index.Index, fuzzy: bool = True):
+    """
+    Parse a user query over several fields, with fuzzy term support.
+
+    YaCy modifiers like "/date" are dropped, and a blank query or "*" matches
+    every document. Fields are boosted as set in `ranking_engine`.
+
+    Args:
+        query (str): The query string.
+        fields (list): The fields searched when the query does not name one.
+        ix (Index): The index the query will run against.
+        fuzzy (bool, optional): Expand `term~` to similar terms. Defaults to True.
+
+    Returns:
+        Query: The parsed query.
+    """
+    # YaCy modifiers such as "/date" mean nothing to the local index.
+    query = " ".join(word for word in query.split() if not word.startswith("/"))
+    if query in ("", "*"):
+        return Every()
+
+    query_parser = MultifieldParser(
+        fields, ix.schema, fieldboosts=ranking_engine.settings()["field_boosts"]
+    )
+
+    if fuzzy:
+        query_parser.add_plugin(FuzzyTermPlugin())
+
+    return query_parser.parse(query)
+
+
+def _where(where: Optional[Where], include_deleted: bool) -> Where:
+    # Conditions given for a field replace the default ones.
+    return {**({} if include_deleted else DEFAULT_WHERE), **(where or {})}
 
 
 def search_documents(
     query: str,
-    fields: list = [
-        "title",
-        "content",
-        "author",
-        "category",
-        "keywords",
-        "description",
-    ],
+    fields: list = SEARCH_FIELDS,
     indexname="documents",
     schema=IndexItems,
+    correct_spelling: bool = False,
+    where: Optional[Where] = None,
+    include_deleted: bool = False,
 ) -> list:
-    ix = index.open_dir("db", indexname=indexname, schema=schema)
-    query_parser = MultifieldParser(fields, ix.schema)
+    """
+    Search the index and return the stored fields of the best hits.
 
-    query_parser.add_plugin(FuzzyTermPlugin())
+    Args:
+        query (str): The query string.
+        fields (list, optional): The fields searched when the query does not name
+            one. Defaults to SEARCH_FIELDS.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+        correct_spelling (bool, optional): Run the corrected query when the query
+            matches nothing, see `search_page`. Defaults to False.
+        where (dict, optional): Conditions the hits must meet, flags, values and
+            numeric or date ranges, see `yose.filters`. Defaults to None.
+        include_deleted (bool, optional): Also return soft-deleted documents.
+            Defaults to False.
 
-    q = query_parser.parse(query)
+    Returns:
+        list: The stored fields of the 10 best hits.
 
-    searcher = ix.searcher()
-    results = searcher.search(q, terms=True)
+    Example:
+        >>> search_documents("cats", where={"is_verified": True, "year": (2020, None)})
+    """
+    ix = make_document_index(indexname=indexname, schema=schema)
+    q = parse_query(query, fields, ix, fuzzy=not correct_spelling)
+
+    # The searcher is shared and stays open after the query, so we hand out
+    # the stored fields instead of Hit objects bound to it.
+    with SEARCH.time(function="search_documents"), index_manager.searcher(
+        indexname, schema
+    ) as searcher:
+        allowed = filter_cache.bitset(
+            searcher, normalize(_where(where, include_deleted))
+        )
+        if allowed is not None and not allowed:
+            # Whoosh would take an empty filter for no filter at all.
+            return []
+        limit = ranking_engine.limit(10)
+        results = searcher.search(q, limit=limit, filter=allowed, terms=True)
+        if correct_spelling and results.is_empty():
+            suggestion = spelling_corrector.suggest(query)
+            if suggestion is not None:
+                q = parse_query(suggestion, fields, ix, fuzzy=False)
+                results = searcher.search(q, limit=limit, filter=allowed, terms=True)
+        results = ranking_engine.rescore(searcher, results)
+
+        return [hit.fields() for hit in results[:10]]
+
+
+def search_page(
+    query: str,
+    page: int = 1,
+    pagelen: int = 10,
+    fields: Optional[Iterable[str]] = None,
+    search_fields: list = SEARCH_FIELDS,
+    indexname="documents",
+    schema=IndexItems,
+    collapse_duplicates: bool = False,
+    correct_spelling: bool = False,
+    filters: Optional[Filters] = None,
+    where: Optional[Where] = None,
+    include_deleted: bool = False,
+) -> dict:
+    """
+    Search the index and return one page of results as plain dictionaries.
 
-    return list(results)
+    Only the documents of the requested page are loaded, and only the requested
+    stored fields are kept from each of them, so result lists that just show a few
+    fields do not carry the full `content` of every hit around.
+
+    Args:
+        query (str): The query string.
+        page (int, optional): The page number, starting at 1. Defaults to 1.
+        pagelen (int, optional): The number of results per page. Defaults to 10.
+        fields (Iterable[str], optional): The stored fields to return for each hit,
+            "*" for all of them. Defaults to None, for PAGE_FIELDS.
+        search_fields (list, optional): The fields searched when the query does not
+            name one. Defaults to SEARCH_FIELDS.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+        collapse_duplicates (bool, optional): Only return the best hit of each
+            cluster of near-duplicates, see `yose.dedup`. Defaults to False.
+        correct_spelling (bool, optional): Suggest a corrected query, see
+            `yose.spelling`, and run it instead when the query matches nothing.
+            Fuzzy `term~` expansion is turned off. Defaults to False.
+        filters (dict, optional): Drill-down filters, {fieldname: values}, only
+            documents with one of the values of each field are returned, see
+            `yose.facets`. Defaults to None.
+        where (dict, optional): Other conditions the hits must meet, flags, values
+            and numeric or date ranges, see `yose.filters`. Defaults to None.
+        include_deleted (bool, optional): Also return soft-deleted documents.
+            Defaults to False.
+
+    The best hits are rescored by `ranking_engine` when it has signal weights.
+
+    Returns:
+        dict: A dictionary with the following keys:
+            - results (list): One dict per hit with the requested fields, plus `score`.
+            - total (int): The total number of matching documents.
+            - page (int): The page returned, clamped to the last page.
+            - pagecount (int): The number of pages.
+            - pagelen (int): The number of results per page.
+            - runtime (float): Seconds spent searching and loading the page.
+            - suggestion (str): The corrected query, or None.
+            - corrected (bool): Whether the results are those of the suggestion.
+
+    Example:
+        >>> search_page("whoosh", page=2, pagelen=20, fields=["title", "url"])
+    """
+    start = time.perf_counter()
+    if fields is None:
+        fields = PAGE_FIELDS
+    ix = make_document_index(indexname=indexname, schema=schema)
+    q = parse_query(query, search_fields, ix, fuzzy=not correct_spelling)
+
+    with SEARCH.time(function="search_page"), index_manager.searcher(
+        indexname, schema
+    ) as searcher:
+        options = {}
+        if collapse_duplicates and "cluster" in searcher.schema:
+            options = {"collapse": "cluster", "collapse_limit": 1}
+        options["filter"] = filter_cache.bitset(
+            searcher, normalize(_where(where, include_deleted), as_where(filters))
+        )
+        if options["filter"] is not None and not options["filter"]:
+            # Whoosh would take an empty filter for no filter at all.
+            return {
+                "results": [],
+                "total": 0,
+                "page": 0,
+                "pagecount": 0,
+                "pagelen": pagelen,
+                "runtime": time.perf_counter() - start,
+                "suggestion": None,
+                "corrected": False,
+            }
+
+        def run(q) -> ResultsPage:
+            limit = ranking_engine.limit(page * pagelen)
+            results = searcher.search(q, limit=limit, **options)
+            return ResultsPage(ranking_engine.rescore(searcher, results), page, pagelen)
+
+        results = run(q)
+
+        suggestion, corrected = None, False
+        if correct_spelling:
+            suggestion = spelling_corrector.suggest(query)
+            if suggestion is not None and results.total == 0:
+                q = parse_query(suggestion, search_fields, ix, fuzzy=False)
+                results = run(q)
+                corrected = True
+
+        hits = []
+        for hit in results:
+            stored = searcher.stored_fields(hit.docnum)
+            if fields != "*":
+                stored = {name: stored[name] for name in fields if name in stored}
+            stored["score"] = hit.score
+            hits.append(stored)
+
+        return {
+            "results": hits,
+            "total": results.total,
+            "page": results.pagenum,
+            "pagecount": results.pagecount,
+            "pagelen": pagelen,
+            "runtime": time.perf_counter() - start,
+            "suggestion": suggestion,
+            "corrected": corrected,
+        }
+
+
+def search_facets(
+    query: str,
+    filters: Optional[Filters] = None,
+    search_fields: list = SEARCH_FIELDS,
+    indexname="documents",
+    schema=IndexItems,
+    where: Optional[Where] = None,
+    include_deleted: bool = False,
+) -> dict:
+    """
+    Count the values of the facet fields among the documents matching a query.
+
+    Args:
+        query (str): The query string, blank or "*" for every document.
+        filters (dict, optional): The drill-down filters selected so far, see
+            `search_page`. Defaults to None.
+        search_fields (list, optional): The fields searched when the query does not
+            name one. Defaults to SEARCH_FIELDS.
+        indexname (str, optional): The name of the index. Defaults to "documents".
+        schema (IndexItems, optional): The schema of the index. Defaults to IndexItems.
+        where (dict, optional): Other conditions the counted documents meet, see
+            `search_page`. Defaults to None.
+        include_deleted (bool, optional): Also count soft-deleted documents.
+            Defaults to False.
+
+    Returns:
+        dict: {fieldname: [(value, count), ...]}, most frequent values first.
+
+    Example:
+        >>> search_facets("cats", {"language": ["en"]})
+        {'host': [('example.com', 12), ...], 'language': [('en', 30), ('de', 4)]}
+    """
+    ix = make_document_index(indexname=indexname, schema=schema)
+    q = parse_query(query, search_fields, ix)
+
+    with SEARCH.time(function="search_facets"), index_manager.searcher(
+        indexname, schema
+    ) as searcher:
+        return facet_counter.counts(
+            searcher, q, filters, where=_where(where, include_deleted)
+        )
 
 
 # print(search_documents("www"))
 
 
 def get_all_documents(indexname="documents", schema=IndexItems) -> list:
-    ix = index.open_dir("db", indexname=indexname, schema=schema)
-
-    with ix.searcher() as searcher:
+    with index_manager.searcher(indexname, schema) as searcher:
         results = searcher.documents()
 
         return list(results)
@@ -277,41 +786,39 @@ def set_default_config(reset=False):
         "language": "en",
     }
     if reset:
+        index_manager.forget("options")
         create_index(Options, "options")
+        options_store.reload()
 
-    if check_if_index_exists("db", "options"):
-        ix = index.open_dir("db", indexname="options", schema=Options)
-    else:
-        ix = create_index(Options, "options")
-
-    writer = ix.writer()
-    writer.add_document(**defaults)
-
-    writer.commit(merge=True, optimize=True)
+    options_store.replace(defaults)
 
 
 def get_options(dirname="db", indexname="options", last_version=True):
     """
     Retrieve options from the specified index.
 
+    The options are served from memory by the options store, the index is only
+    read the first time.
+
     Args:
         dirname (str): The directory name where the index is located. Default is "db".
         indexname (str): The name of the index. Default is "options".
         last_version (bool): Whether to return only the last version. Default is True.
 
     Returns:
-        result (dict or list): The options as a dictionary if last_version is True, or a list of dictionaries if last_version is False.
+        result (dict or list): The options as a dictionary if last_version is True, or a list of dictionaries (oldest first) if last_version is False.
     """
-    ix = open_index(dirname, indexname, schema=Options)
-    with ix.searcher() as searcher:
-        results = searcher.documents()
-        if last_version:
-            # return last version only
-            for result in results:
-                return result
-        else:
-            # return all versions
-            return list(results)
+    if (dirname, indexname) == (options_store.dirname, options_store.indexname):
+        store = options_store
+    else:
+        store = OptionsStore(indexname=indexname, dirname=dirname)
+
+    if last_version:
+        # return last version only
+        return store.get()
+    else:
+        # return all versions
+        return store.history()
 
 
 # defaults = set_default_config()
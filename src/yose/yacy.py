@@ -0,0 +1,164 @@
+import asyncio
+import os
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+from yose.metrics import YACY_ERRORS, YACY_REQUEST
+
+YACY_URL = os.environ.get("YOSE_YACY_URL", "http://localhost:8090")
+
+NAVIGATORS = "location,hosts,authors,namespace,topics,filetype,protocol,language"
+
+
+class YaCyError(Exception):
+    """Raised when a YaCy peer could not be queried after all retries."""
+
+
+class YaCyClient:
+    """
+    Non-blocking client for the `yacysearch.json` API of a YaCy peer.
+
+    A single pooled `httpx.AsyncClient` is shared by every page so connections to the
+    peer are kept alive between queries. The number of requests in flight is capped
+    by a semaphore, and failed requests (connection errors, timeouts and 5xx answers)
+    are retried with exponential backoff.
+
+    Usage:
+        >>> items = await yacy_client.search("cats", contentdom="image", page=0)
+    """
+
+    def __init__(
+        self,
+        base_url: str = YACY_URL,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        max_concurrency: int = 10,
+        retries: int = 2,
+        backoff: float = 0.25,
+    ) -> None:
+        """
+        Args:
+            base_url (str, optional): The address of the YaCy peer. Defaults to YACY_URL.
+            timeout (float, optional): Per request timeout in seconds. Defaults to 10.0.
+            max_connections (int, optional): Size of the connection pool. Defaults to 20.
+            max_concurrency (int, optional): Maximum requests in flight. Defaults to 10.
+            retries (int, optional): Retries after the first failed attempt. Defaults to 2.
+            backoff (float, optional): Delay before the first retry, doubled on every
+                following retry. Defaults to 0.25.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def get_json(self, path: str, params: dict) -> dict:
+        """
+        GET a JSON document from the peer, retrying transient failures.
+
+        Args:
+            path (str): The path of the API endpoint, e.g. "/yacysearch.json".
+            params (dict): The query string parameters.
+
+        Returns:
+            dict: The decoded JSON answer.
+
+        Raises:
+            YaCyError: If the request still fails after all retries.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    with YACY_REQUEST.time(path=path):
+                        response = await self.client.get(path, params=params)
+                response.raise_for_status()
+                return response.json()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                YACY_ERRORS.inc(error=type(e).__name__)
+                retryable = not isinstance(e, httpx.HTTPStatusError) or (
+                    e.response.status_code >= 500
+                )
+                if not retryable or attempt >= self.retries:
+                    raise YaCyError(f"YaCy request to {path} failed: {e!r}") from e
+
+                delay = self.backoff * 2**attempt
+                attempt += 1
+                logger.warning(
+                    f"YaCy request to {path} failed ({e!r}), retry {attempt}/{self.retries} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def search(
+        self,
+        query: str,
+        contentdom: str = "image",
+        page: int = 0,
+        max_results: int = 50,
+        resource: str = "global",
+    ) -> list:
+        """
+        Run a search on the peer and return the result items.
+
+        Args:
+            query (str): The search query.
+            contentdom (str, optional): The content domain (text, image, audio, video, app).
+                Defaults to "image".
+            page (int, optional): The zero based page number. Defaults to 0.
+            max_results (int, optional): The number of results per page. Defaults to 50.
+            resource (str, optional): "global" to search the network, "local" for the
+                peer's own index. Defaults to "global".
+
+        Returns:
+            list: The `channels[0].items` list of the answer.
+        """
+        params = {
+            "query": query,
+            "Enter": "",
+            "auth": "",
+            "verify": "ifexist",
+            "contentdom": contentdom,
+            "nav": NAVIGATORS,
+            "startRecord": page * max_results,
+            "indexof": "off",
+            "meanCount": 5,
+            "resource": resource,
+            "prefermaskfilter": "",
+            "maximumRecords": max_results,
+            "timezoneOffset": 420,
+        }
+        results = await self.get_json("/yacysearch.json", params)
+        return results["channels"][0]["items"]
+
+    async def close(self) -> None:
+        """Close the pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+yacy_client = YaCyClient()
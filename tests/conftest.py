@@ -0,0 +1,13 @@
+import pytest
+
+from yose.index_manager import index_manager
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    """Run in an empty directory with a `db` folder, as the app does."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "db").mkdir()
+    index_manager.close()
+    yield tmp_path
+    index_manager.close()
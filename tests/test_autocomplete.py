@@ -0,0 +1,46 @@
+from yose.autocomplete import CompletionTable, QueryLog
+from yose.utils import add_documents
+
+TITLES = {"cat": 5, "car": 3, "carpet": 2, "cattle": 1, "dog": 4}
+
+
+def documents(titles):
+    number = 0
+    for title, count in titles.items():
+        for _ in range(count):
+            number += 1
+            yield {"guid": f"doc-{title}-{number}", "title": title}
+
+
+def test_prefixes_complete_the_most_frequent_words(index_dir):
+    add_documents(documents(TITLES))
+    queries = QueryLog(path=str(index_dir / "queries"))
+    table = CompletionTable(min_frequency=1, precomputed=2, queries=queries)
+    assert table.rebuild() == 5
+
+    assert table.complete("c") == ["cat", "car", "carpet", "cattle"]
+    # Precomputed prefixes and scanned ones agree.
+    assert table.complete("ca", k=2) == ["cat", "car"]
+    assert table.complete("CAR") == ["car", "carpet"]
+    assert table.complete("catt") == ["cattle"]
+    assert table.complete("x") == [] and table.complete("  ") == []
+    # The last word of the input is completed.
+    assert table.complete("red ca", k=2) == ["red cat", "red car"]
+
+
+def test_rebuild_picks_up_documents_and_queries(index_dir):
+    add_documents(documents(TITLES))
+    queries = QueryLog(path=str(index_dir / "queries"), save_every=1)
+    table = CompletionTable(min_frequency=2, queries=queries)
+    table.rebuild()
+    assert table.complete("cat") == ["cat"]
+
+    add_documents(documents({"catalog": 2}))
+    for _ in range(3):
+        queries.record("Cat  Videos")
+    table.rebuild()
+    # Past queries outweigh words, and complete the whole input.
+    assert table.complete("cat") == ["cat videos", "cat", "catalog"]
+
+    # The query counts were saved.
+    assert QueryLog(path=str(index_dir / "queries")).top(1) == [("cat videos", 3)]
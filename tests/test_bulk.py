@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from yose import bulk
+from yose.corpus import generate_documents, to_yacy_item
+from yose.dedup import NearDuplicateDetector
+from yose.index_manager import index_manager
+from yose.utils import make_document_index
+
+
+@pytest.fixture
+def detector(index_dir, monkeypatch):
+    detector = NearDuplicateDetector(path=str(index_dir / "minhash.bin"))
+    monkeypatch.setattr(bulk, "near_duplicates", detector)
+    return detector
+
+
+def test_importing_twice_replaces_documents(index_dir, detector):
+    items = [to_yacy_item(document) for document in generate_documents(40)]
+    dump = index_dir / "dump.jsonl"
+    dump.write_text("\n".join(json.dumps(item) for item in items + items[:3]))
+
+    first = bulk.bulk_import([str(dump)], procs=2, batchsize=10)
+    assert (first["indexed"], first["repeated"]) == (40, 3)
+    second = bulk.bulk_import([str(dump)], procs=2, batchsize=10)
+    assert second["indexed"] == 40
+
+    with index_manager.searcher("documents", make_document_index().schema) as s:
+        assert s.doc_count() == 40
+        assert all(fields.get("cluster") for fields in s.all_stored_fields())
+    assert detector.checked == 80
+    assert (index_dir / "minhash.bin").exists()
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from yose import cache
+from yose.cache import ResultCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock):
+    results = ResultCache(ttl=10)
+    results.set("cats", [1])
+    clock.now += 9
+    assert results.get("cats") == [1]
+    clock.now += 2
+    assert results.get("cats", "missing") == "missing"
+    assert results.stats()["expirations"] == 1 and "cats" not in results.keys()
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    results = ResultCache(max_entries=2)
+    results.set("a", 1)
+    results.set("b", 2)
+    results.get("a")
+    results.set("c", 3)
+    assert results.keys() == ["a", "c"]
+    assert results.stats()["evictions"] == 1
+
+
+def test_entries_survive_a_restart(clock, tmp_path):
+    path = str(tmp_path / "cache")
+    results = ResultCache(ttl=10, path=path)
+    results.set(("cats", 0), [1])
+    results.close()
+
+    clock.now += 5
+    results = ResultCache(ttl=10, path=path)
+    assert results.get(("cats", 0)) == [1]
+    clock.now += 6
+    assert results.get(("cats", 0)) is None
+    results.close()
+
+
+def test_concurrent_requests_share_one_fetch(clock):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["page"]
+
+    async def main():
+        results = ResultCache()
+        results.prefetch("cats", fetch)
+        pages = await asyncio.gather(
+            results.get_or_fetch("cats", fetch), results.get_or_fetch("cats", fetch)
+        )
+        return pages + [await results.get_or_fetch("cats", fetch)]
+
+    assert asyncio.run(main()) == [["page"]] * 3
+    assert calls == [1]
+
+
+def test_failed_fetches_are_not_cached(clock):
+    async def fail():
+        raise OSError("unreachable")
+
+    async def fetch():
+        return ["page"]
+
+    async def main():
+        results = ResultCache()
+        with pytest.raises(OSError):
+            await results.get_or_fetch("cats", fail)
+        return await results.get_or_fetch("cats", fetch)
+
+    assert asyncio.run(main()) == ["page"]
+
+
+def test_the_shelf_is_pruned(clock, tmp_path):
+    path = str(tmp_path / "cache")
+    results = ResultCache(max_entries=2, ttl=10, path=path)
+    for number in range(3):
+        results.set(number, [number])
+        clock.now += 1
+    # The least recently used entry left memory and disk.
+    assert sorted(results.shelf.keys()) == ["1", "2"]
+    results.close()
+
+    clock.now += 8
+    results = ResultCache(max_entries=2, ttl=10, path=path)
+    # Entry 1 expired while the cache was closed.
+    assert list(results.shelf.keys()) == ["2"]
+    results.close()
+
+    # A smaller cache keeps the newest entries of the file.
+    results = ResultCache(max_entries=5, ttl=100, path=path)
+    for number in range(3, 6):
+        results.set(number, [number])
+        clock.now += 1
+    results.close()
+    results = ResultCache(max_entries=2, ttl=100, path=path)
+    assert sorted(results.shelf.keys()) == ["4", "5"]
+    results.close()
@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+
+from yose.crawler import WebCrawler
+
+
+def test_robots_failures_are_retried_soon():
+    answers = [httpx.Response(503), httpx.Response(200, text="User-agent: *\n")]
+
+    async def allowed_twice():
+        crawler = WebCrawler(robots_ttl=3600, robots_retry=0)
+        crawler._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: answers.pop(0))
+        )
+        url = "https://example.org/page"
+        host = crawler._host(url)
+        try:
+            return [await crawler._allowed(url, host) for _ in range(2)]
+        finally:
+            await crawler._client.aclose()
+
+    assert asyncio.run(allowed_twice()) == [False, True]
+    assert answers == []
+
+
+def test_pages_are_parsed_into_documents():
+    page = (
+        "<html lang='en'><head><title>Cats</title></head>"
+        "<body><p>All about cats.</p><a href='/dogs#top'>Dogs</a></body></html>"
+    )
+
+    def site(request):
+        if request.url.path == "/robots.txt":
+            return httpx.Response(404)
+        return httpx.Response(
+            200, html=page, headers={"content-type": "text/html; charset=utf-8"}
+        )
+
+    async def fetch():
+        crawler = WebCrawler(politeness_delay=0)
+        crawler._client = httpx.AsyncClient(transport=httpx.MockTransport(site))
+        try:
+            return await crawler.fetch("https://example.org/cats")
+        finally:
+            await crawler._client.aclose()
+
+    document, links = asyncio.run(fetch())
+    assert document["title"] == "Cats"
+    assert "All about cats." in document["content"]
+    assert document["language"] == "en"
+    assert links == ["https://example.org/dogs#top"]
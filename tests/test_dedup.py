@@ -0,0 +1,82 @@
+import random
+
+from yose.dedup import NearDuplicateDetector
+
+random.seed(7)
+VOCABULARY = [f"word{number}" for number in range(500)]
+
+
+def text(words: int = 200) -> str:
+    return " ".join(random.choice(VOCABULARY) for _ in range(words))
+
+
+ORIGINAL = text()
+# One word changed out of 200.
+NEAR = ORIGINAL.replace(ORIGINAL.split()[100], "changed", 1)
+OTHER = text()
+
+
+def test_near_duplicates_share_a_cluster(tmp_path):
+    detector = NearDuplicateDetector(path=str(tmp_path / "minhash.bin"))
+    first, near, other = detector.process(
+        [
+            {"guid": "first", "title": "a page", "content": ORIGINAL},
+            {"guid": "near", "title": "a page", "content": NEAR},
+            {"guid": "other", "title": "a page", "content": OTHER},
+        ]
+    )
+    assert near["cluster"] == first["cluster"]
+    assert other["cluster"] != first["cluster"]
+    assert detector.stats()["duplicates"] == 1
+
+    # A re-indexed document keeps its cluster and its entry.
+    (again,) = detector.process([{"guid": "near", "title": "a page", "content": NEAR}])
+    assert again["cluster"] == first["cluster"]
+    assert detector.stats()["signatures"] == 3
+
+
+def test_drop_mode_leaves_near_duplicates_out(tmp_path):
+    detector = NearDuplicateDetector(path=str(tmp_path / "minhash.bin"), mode="drop")
+    kept = detector.process(
+        [
+            {"guid": "first", "content": ORIGINAL},
+            {"guid": "near", "content": NEAR},
+            {"guid": "other", "content": OTHER},
+        ]
+    )
+    assert [document["guid"] for document in kept] == ["first", "other"]
+    assert detector.stats()["dropped"] == 1
+    # The document kept is not dropped when indexed again.
+    assert len(detector.process([{"guid": "first", "content": ORIGINAL}])) == 1
+
+
+def test_signatures_survive_a_restart(tmp_path):
+    path = str(tmp_path / "db" / "minhash.bin")
+    detector = NearDuplicateDetector(path=path)
+    (first,) = detector.process([{"guid": "first", "content": ORIGINAL}])
+    detector.save()
+
+    reopened = NearDuplicateDetector(path=path)
+    (near,) = reopened.process([{"guid": "near", "content": NEAR}])
+    assert near["cluster"] == first["cluster"]
+    assert reopened.stats()["signatures"] == 2
+
+
+def test_documents_without_text_are_never_duplicates(tmp_path):
+    detector = NearDuplicateDetector(path=str(tmp_path / "minhash.bin"), mode="drop")
+    kept = detector.process(
+        [
+            {"guid": "empty", "image": "https://example.com/a.jpg"},
+            {"guid": "blank", "title": "", "content": "  "},
+            {"guid": "short", "title": "Home"},
+            {"guid": "again", "title": "Home"},
+        ]
+    )
+    assert [document["guid"] for document in kept] == [
+        "empty",
+        "blank",
+        "short",
+        "again",
+    ]
+    assert len({document["cluster"] for document in kept}) == 4
+    assert detector.stats()["signatures"] == 0
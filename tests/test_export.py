@@ -0,0 +1,55 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from yose.config.db.Model import IndexItems
+from yose.export import export_index, import_index
+from yose.index_manager import index_manager
+from yose.utils import add_document, add_documents
+
+
+def stored(indexname: str) -> dict:
+    with index_manager.searcher(indexname, IndexItems) as searcher:
+        return {fields["guid"]: fields for fields in searcher.all_stored_fields()}
+
+
+@pytest.fixture
+def documents(index_dir):
+    add_documents(
+        {
+            "guid": f"doc-{number}",
+            "title": f"document {number}",
+            "likes": number,
+            "is_verified": number % 2 == 0,
+            "created_at": datetime(2020, 1, 1 + number),
+        }
+        for number in range(25)
+    )
+    return stored("documents")
+
+
+def test_round_trip(documents, index_dir):
+    prefix = str(index_dir / "exports" / "documents")
+    manifest = export_index(prefix, chunk_size=10)
+    assert manifest["complete"]
+    assert [chunk["documents"] for chunk in manifest["chunks"]] == [10, 10, 5]
+
+    assert import_index(prefix, indexname="restored") == 25
+    assert stored("restored") == documents
+    # Importing again replaces the documents.
+    assert import_index(prefix, indexname="restored") == 25
+    assert stored("restored") == documents
+
+
+def test_export_resumes_only_on_an_unchanged_index(documents, index_dir):
+    prefix = str(index_dir / "documents")
+    manifest = export_index(prefix, chunk_size=10)
+    assert export_index(prefix) == manifest
+
+    manifest["complete"] = False
+    manifest["chunks"] = manifest["chunks"][:1]
+    (index_dir / "documents.manifest.json").write_text(json.dumps(manifest))
+    add_document({"guid": "late", "title": "written meanwhile"})
+    with pytest.raises(ValueError):
+        export_index(prefix, chunk_size=10)
@@ -0,0 +1,63 @@
+from collections import Counter
+
+import pytest
+
+from yose.utils import add_documents, search_facets, search_page
+
+
+def make_documents():
+    languages = ["en", "en", "en", "de", "fr"]
+    return [
+        {
+            "guid": f"doc-{number}",
+            "title": f"document {number}",
+            "host": f"host{number % 3}.example",
+            "language": languages[number % len(languages)],
+            "year": 2020 + number % 2,
+            "is_deleted": number == 0,
+        }
+        for number in range(30)
+    ]
+
+
+@pytest.fixture
+def documents(index_dir):
+    documents = make_documents()
+    add_documents(documents[:15])
+    add_documents(documents[15:])
+    return [document for document in documents if not document["is_deleted"]]
+
+
+def test_counts_match_the_documents(documents):
+    counts = search_facets("*")
+    for fieldname in ("host", "language", "year"):
+        expected = Counter(document[fieldname] for document in documents)
+        assert dict(counts[fieldname]) == dict(expected)
+
+
+def test_counts_of_a_field_ignore_its_own_selection(documents):
+    counts = search_facets("*", {"language": ["de"]})
+    # Other languages stay selectable...
+    assert dict(counts["language"]) == dict(
+        Counter(document["language"] for document in documents)
+    )
+    # ...while the other fields are counted among the selected documents.
+    selected = [document for document in documents if document["language"] == "de"]
+    assert dict(counts["host"]) == dict(Counter(d["host"] for d in selected))
+
+
+def test_drill_down_filters_results(documents):
+    page = search_page(
+        "*", pagelen=50, fields=["host", "language"], filters={"language": ["fr"]}
+    )
+    expected = [d for d in documents if d["language"] == "fr"]
+    assert page["total"] == len(expected)
+    assert {hit["language"] for hit in page["results"]} == {"fr"}
+
+
+def test_drill_down_matching_nothing_returns_nothing(documents):
+    page = search_page(
+        "*", filters={"language": ["fr"], "host": ["nonexistent.example"]}
+    )
+    assert page["total"] == 0
+    assert page["results"] == []
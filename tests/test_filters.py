@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+from yose.config.db.Model import IndexItems
+from yose.filters import filter_cache, index_state, normalize
+from yose.index_manager import index_manager
+from yose.utils import add_documents, delete_documents, search_documents, search_page
+
+
+def make_documents(count=30):
+    return [
+        {
+            "guid": f"doc-{number}",
+            "title": f"document {number}",
+            "host": "even.example" if number % 2 == 0 else "odd.example",
+            "year": 2010 + number % 10,
+            "size": number * 100,
+            "created_at": datetime(2020, 1, 1 + number % 28),
+            "is_deleted": number % 10 == 0,
+            "is_verified": number % 3 == 0,
+        }
+        for number in range(count)
+    ]
+
+
+@pytest.fixture
+def documents(index_dir):
+    documents = make_documents()
+    # Two commits, so the index has more than one segment.
+    add_documents(documents[:20])
+    add_documents(documents[20:])
+    return documents
+
+
+def totals(documents, condition):
+    return sum(1 for document in documents if condition(document))
+
+
+def test_soft_deleted_documents_are_hidden(documents):
+    visible = totals(documents, lambda d: not d["is_deleted"])
+    assert search_page("*")["total"] == visible
+    assert search_page("*", include_deleted=True)["total"] == len(documents)
+    assert search_page("*", where={"is_deleted": True})["total"] == 3
+
+
+def test_flags_ranges_and_values(documents):
+    where = {
+        "is_verified": True,
+        "year": (2012, 2016),
+        "size": (None, 2000),
+        "created_at": (datetime(2020, 1, 5), None),
+    }
+    expected = totals(
+        documents,
+        lambda d: not d["is_deleted"]
+        and d["is_verified"]
+        and 2012 <= d["year"] <= 2016
+        and d["size"] <= 2000
+        and d["created_at"] >= datetime(2020, 1, 5),
+    )
+    assert expected
+    assert search_page("*", where=where)["total"] == expected
+    assert search_page("*", where={"year": [2011, 2013]})["total"] == totals(
+        documents, lambda d: not d["is_deleted"] and d["year"] in (2011, 2013)
+    )
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"where": {"year": (3000, None)}},
+        {"filters": {"host": ["nonexistent.example"]}},
+        {"where": {"missing_field": True}},
+    ],
+)
+def test_filter_matching_nothing_returns_nothing(documents, options):
+    page = search_page("*", **options)
+    assert page["total"] == 0
+    assert page["results"] == []
+    if "where" in options:
+        assert search_documents("*", where=options["where"]) == []
+
+
+def test_bitsets_are_not_shared_between_indexes(index_dir):
+    add_documents(make_documents(10))
+    first = search_page("*", where={"year": (2015, None)})["total"]
+
+    # Another index at the same generation must not reuse the cached bitset.
+    index_manager.close()
+    index_dir.joinpath("db").rename(index_dir / "old")
+    (index_dir / "db").mkdir()
+    add_documents(make_documents(30))
+    second = search_page("*", where={"year": (2015, None)})["total"]
+
+    assert first == 5
+    assert second == totals(
+        make_documents(30), lambda d: not d["is_deleted"] and d["year"] >= 2015
+    )
+
+
+def test_index_state_changes_with_deletions(documents):
+    with index_manager.searcher("documents", IndexItems) as searcher:
+        before = index_state(searcher)
+        assert len(before) == 2
+        assert filter_cache.bitset(searcher, normalize({"year": (2015, None)}))
+    delete_documents(["doc-1"])
+    with index_manager.searcher("documents", IndexItems) as searcher:
+        assert index_state(searcher) != before
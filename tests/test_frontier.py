@@ -0,0 +1,82 @@
+import sqlite3
+
+from yose.frontier import Frontier, SeenSet, url_key
+
+
+def frontier(tmp_path) -> Frontier:
+    seen = SeenSet(path=str(tmp_path / "seen.sqlite"), capacity=1000)
+    return Frontier(path=str(tmp_path / "frontier.sqlite"), seen=seen)
+
+
+def test_url_key_ignores_fragment_and_case_of_host():
+    key = url_key("https://example.org/Page?q=1")
+    assert url_key("HTTPS://Example.ORG/Page?q=1#top") == key
+    assert url_key("https://example.org/page?q=1") != key
+
+
+def test_urls_seen_elsewhere_are_not_queued(tmp_path):
+    urls = frontier(tmp_path)
+    # What the ingestion queue does for indexed YaCy results.
+    urls.seen.add_many([url_key("https://example.org/indexed")])
+    assert not urls.push("https://example.org/indexed#section")
+    assert urls.push("https://example.org/new")
+    assert not urls.push("https://EXAMPLE.org/new")
+    assert urls.push("https://example.org/new", force=True)
+    urls.close()
+
+
+def test_hosts_take_turns(tmp_path):
+    urls = frontier(tmp_path)
+    for page in range(3):
+        urls.push(f"https://a.example/{page}")
+    urls.push("https://b.example/0")
+    urls.push("https://c.example/1", priority=1)
+    urls.push("https://c.example/0", priority=0)
+
+    popped = []
+    while True:
+        entry = urls.pop()
+        if entry is None:
+            break
+        popped.append(entry[1])
+        urls.done(entry[0])
+    assert popped == [
+        "https://a.example/0",
+        "https://b.example/0",
+        "https://c.example/0",
+        "https://a.example/1",
+        "https://c.example/1",
+        "https://a.example/2",
+    ]
+    urls.close()
+
+
+def test_leased_urls_are_handed_out_again_after_a_restart(tmp_path):
+    urls = frontier(tmp_path)
+    urls.push("https://a.example/0")
+    entry = urls.pop()
+    assert urls.pop() is None
+    urls.close()
+
+    urls = frontier(tmp_path)
+    assert urls.pop() == entry
+    urls.close()
+
+
+def test_the_frontier_is_committed_before_the_seen_set(tmp_path):
+    seen = SeenSet(path=str(tmp_path / "seen.sqlite"), capacity=1000)
+    urls = Frontier(path=str(tmp_path / "frontier.sqlite"), seen=seen)
+    assert urls.push("https://example.org/queued")
+
+    def committed(name, table):
+        # What a crash would leave on disk.
+        with sqlite3.connect(str(tmp_path / name)) as db:
+            return db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    assert committed("seen.sqlite", "seen") == 0
+    # The seen set commits, here for a URL indexed from elsewhere.
+    seen.add(url_key("https://example.org/indexed"))
+    seen.flush()
+    assert committed("seen.sqlite", "seen") == 2
+    assert committed("frontier.sqlite", "frontier") == 1
+    urls.close()
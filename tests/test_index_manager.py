@@ -0,0 +1,70 @@
+from whoosh.fields import ID, Schema
+
+from yose.index_manager import IndexManager
+
+SCHEMA = Schema(guid=ID(stored=True, unique=True))
+
+
+def add(manager: IndexManager, *guids: str) -> None:
+    writer = manager.get_index("things", SCHEMA).writer()
+    for guid in guids:
+        writer.add_document(guid=guid)
+    writer.commit()
+
+
+def test_searcher_is_shared_until_a_commit(index_dir):
+    manager = IndexManager(refresh_interval=3600)
+    assert manager.get_index("things", SCHEMA) is manager.get_index("things", SCHEMA)
+    add(manager, "a")
+
+    with manager.searcher("things", SCHEMA) as first:
+        pass
+    with manager.searcher("things", SCHEMA) as second:
+        assert second is first
+        assert second.doc_count() == 1
+
+    add(manager, "b")
+    manager.invalidate("things")
+    with manager.searcher("things", SCHEMA) as third:
+        assert third is not first
+        assert third.doc_count() == 2
+    assert first.is_closed
+    manager.close()
+
+
+def test_searchers_in_use_are_closed_when_released(index_dir):
+    manager = IndexManager(refresh_interval=3600)
+    add(manager, "a")
+    with manager.searcher("things", SCHEMA) as old:
+        add(manager, "b")
+        manager.invalidate("things")
+        with manager.searcher("things", SCHEMA) as new:
+            assert new.doc_count() == 2
+        # The query still running keeps its searcher.
+        assert not old.is_closed
+        assert old.doc_count() == 1
+    assert old.is_closed
+    manager.close()
+    assert new.is_closed
+
+
+def test_commits_of_other_writers_are_picked_up(index_dir):
+    manager = IndexManager(refresh_interval=0)
+    other = IndexManager()
+    add(manager, "a")
+    with manager.searcher("things", SCHEMA) as searcher:
+        assert searcher.doc_count() == 1
+    # Without invalidate, after refresh_interval.
+    add(other, "b")
+    with manager.searcher("things", SCHEMA) as searcher:
+        assert searcher.doc_count() == 2
+    manager.close()
+    other.close()
+
+
+def test_forget_reopens_the_index(index_dir):
+    manager = IndexManager()
+    ix = manager.get_index("things", SCHEMA)
+    manager.forget("things")
+    assert manager.get_index("things", SCHEMA) is not ix
+    manager.close()
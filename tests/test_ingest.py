@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from yose import ingest
+from yose.dedup import NearDuplicateDetector
+from yose.frontier import SeenSet, url_key
+from yose.ingest import IngestionQueue
+
+
+def item(number: int, title: str) -> dict:
+    url = f"https://example.org/{number}"
+    return {
+        "guid": f"guid{number}",
+        "urlhash": f"yacy{number}",
+        "link": url,
+        "url": url,
+        "title": title,
+        "description": "",
+    }
+
+
+@pytest.fixture
+def seen(index_dir, monkeypatch):
+    seen = SeenSet(path=str(index_dir / "seen.sqlite"), capacity=1000)
+    monkeypatch.setattr(ingest, "seen_urls", seen)
+    yield seen
+    seen.close()
+
+
+def run(queue: IngestionQueue, *batches) -> None:
+    async def main():
+        queue.start()
+        for batch in batches:
+            await queue.offer(batch)
+        await queue.stop()
+
+    asyncio.run(main())
+
+
+def test_only_written_documents_are_seen(seen, index_dir, monkeypatch):
+    detector = NearDuplicateDetector(path=str(index_dir / "minhash.bin"), mode="drop")
+    monkeypatch.setattr(ingest, "near_duplicates", detector)
+    title = "the quick brown fox jumps over the lazy dog " * 5
+    queue = IngestionQueue(flush_interval=0.01)
+
+    run(queue, [item(1, title), item(2, title), item(3, "something else entirely")])
+
+    assert queue.indexed == 2 and detector.dropped == 1
+    assert url_key("https://example.org/1") in seen
+    assert url_key("https://example.org/2") not in seen
+    assert url_key("https://example.org/3") in seen
+
+
+def test_failed_batches_can_be_offered_again(seen, monkeypatch):
+    queue = IngestionQueue(flush_interval=0.01)
+    failures = [OSError("disk full")]
+
+    def index(batch):
+        if failures:
+            raise failures.pop()
+        return batch
+
+    monkeypatch.setattr(queue, "_index", index)
+
+    async def main():
+        queue.start()
+        await queue.offer([item(1, "a page")])
+        await queue.queue.join()
+        assert queue.indexed == 0 and url_key("https://example.org/1") not in seen
+        assert await queue.offer([item(1, "a page")]) == 1
+        await queue.stop()
+
+    asyncio.run(main())
+    assert queue.indexed == 1 and url_key("https://example.org/1") in seen
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from whoosh.fields import ID, Schema
+
+from yose.index_manager import index_manager
+from yose.merge import MergeScheduler, TieredMergePolicy
+
+SCHEMA = Schema(guid=ID(stored=True, unique=True))
+
+
+class SlowPolicy(TieredMergePolicy):
+    def __call__(self, writer, segments):
+        time.sleep(0.5)
+        return super().__call__(writer, segments)
+
+
+def segments(count: int):
+    ix = index_manager.get_index("documents", SCHEMA)
+    for number in range(count):
+        writer = ix.writer()
+        writer.add_document(guid=str(number))
+        writer.commit(merge=False)
+    return ix
+
+
+def test_tiers_are_merged(index_dir):
+    ix = segments(4)
+    scheduler = MergeScheduler(TieredMergePolicy(segments_per_tier=2))
+    scheduler.notify("documents", SCHEMA)
+    assert scheduler.run_once() == 4
+    with ix.searcher() as searcher:
+        assert len(searcher.leaf_searchers()) == 1
+        assert searcher.doc_count() == 4
+
+
+def test_writers_wait_for_a_merge_to_end(index_dir):
+    ix = segments(2)
+    scheduler = MergeScheduler(SlowPolicy(segments_per_tier=2))
+    scheduler.notify("documents", SCHEMA)
+    merge = threading.Thread(target=scheduler.run_once)
+    merge.start()
+    time.sleep(0.1)
+
+    # Longer than the lock timeout, but the merge is waited for.
+    writer = scheduler.writer(ix, "documents", timeout=0.1)
+    assert scheduler.merges == 1
+    writer.add_document(guid="late")
+    writer.commit(merge=False)
+    merge.join()
+    with ix.searcher() as searcher:
+        assert searcher.doc_count() == 3
+
+
+def test_merges_give_way_to_waiting_writers(index_dir):
+    segments(2)
+    scheduler = MergeScheduler(TieredMergePolicy(segments_per_tier=2))
+    scheduler.notify("documents", SCHEMA)
+    scheduler._waiting[(index_manager.dirname, "documents")] = 1
+    assert scheduler.run_once() == 0
+    assert scheduler.lock_conflicts == 1 and scheduler.stats()["pending"] == 1
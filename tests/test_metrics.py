@@ -0,0 +1,64 @@
+import asyncio
+
+from yose.metrics import Registry, timed
+
+
+def test_counters_and_gauges_render():
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors.")
+    errors.inc(error="Timeout")
+    errors.inc(2, error='say "no"')
+    assert registry.counter("errors_total", "Errors.") is errors
+    registry.gauge("queue", "Queue length.", lambda: 3)
+    registry.gauge("cache", "Cache.", lambda: {"hits": 5, "name": "not a number"})
+
+    assert registry.render().splitlines() == [
+        "# HELP errors_total Errors.",
+        "# TYPE errors_total counter",
+        'errors_total{error="Timeout"} 1',
+        'errors_total{error="say \\"no\\""} 2',
+        "# HELP cache Cache.",
+        "# TYPE cache gauge",
+        'cache{key="hits"} 5',
+        "# HELP queue Queue length.",
+        "# TYPE queue gauge",
+        "queue 3",
+    ]
+
+
+def test_histograms_render_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value, page="/")
+
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{page="/",le="0.1"} 1',
+        'latency_seconds_bucket{page="/",le="1.0"} 3',
+        'latency_seconds_bucket{page="/",le="+Inf"} 4',
+        'latency_seconds_sum{page="/"} 6.05',
+        'latency_seconds_count{page="/"} 4',
+    ]
+    assert latency.quantile(0.5, (("page", "/"),)) == 0.55
+    assert latency.quantile(0.5) is None
+
+
+def test_timed_observes_sync_and_async_calls():
+    registry = Registry()
+    pages = registry.histogram("pages_seconds", "Pages.")
+
+    @timed(pages, page="sync")
+    def render(value):
+        return value
+
+    @timed(pages, page="async")
+    async def render_async(value):
+        return value
+
+    assert render(1) == 1
+    assert asyncio.run(render_async(2)) == 2
+    assert {labels: series.count for labels, series in pages.series.items()} == {
+        (("page", "sync"),): 1,
+        (("page", "async"),): 1,
+    }
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+from whoosh import index
+from whoosh.fields import DATETIME, NUMERIC
+from whoosh.index import LockError
+
+from yose.config.db.Model import IndexItems
+from yose.index_manager import index_manager
+from yose.ingest import yacy_item_to_document
+from yose.migrate import migrate_index
+from yose.utils import add_documents, search_page
+
+
+@pytest.fixture
+def documents(index_dir):
+    add_documents(
+        {
+            "guid": f"doc-{number}",
+            "title": f"image {number}",
+            "host": "example.org",
+            "height": "480",
+            "pubDate": "Thu, 09 Feb 2023 01:49:34 +0000",
+            "year": 2020 + number % 3,
+        }
+        for number in range(20)
+    )
+
+
+def stored(dirname="db"):
+    with index.open_dir(dirname, indexname="documents").searcher() as searcher:
+        return sorted(searcher.all_stored_fields(), key=lambda fields: fields["guid"])
+
+
+def test_migrate_to_the_lean_profile_and_back(documents):
+    report = migrate_index("lean")
+    assert report["documents"] == 20
+    assert report["size_before"] > 0 and report["size_after"] > 0
+
+    schema = index.open_dir("db", indexname="documents").schema
+    assert isinstance(schema["height"], NUMERIC)
+    assert isinstance(schema["pubDate"], DATETIME)
+    first = stored()[0]
+    assert first["height"] == 480
+    assert first["pubDate"] == datetime(2023, 2, 9, 1, 49, 34)
+
+    # The shared searcher opens the index with its saved schema, even when
+    # asked with the default one, and new documents are converted to it.
+    assert search_page("*", where={"year": (2021, 2021)})["total"] == 7
+    ix = index_manager.get_index("documents", IndexItems)
+    document = yacy_item_to_document({"guid": "new", "height": "200"}, ix.schema)
+    assert document["height"] == 200
+    add_documents([document])
+    with index_manager.searcher("documents", IndexItems) as searcher:
+        assert searcher.doc_count() == 21
+
+    migrate_index("default")
+    assert len(stored()) == 21
+    assert stored()[0]["height"] == "480"
+
+
+def test_a_locked_index_is_not_migrated(documents):
+    lock = index.open_dir("db", indexname="documents").lock("WRITELOCK")
+    assert lock.acquire(False)
+    try:
+        with pytest.raises(LockError):
+            migrate_index("lean")
+    finally:
+        lock.release()
+    assert isinstance(stored()[0]["height"], str)
@@ -0,0 +1,45 @@
+import pytest
+
+from yose.options import OptionsStore
+
+
+def test_rollback_is_a_new_version(index_dir):
+    store = OptionsStore()
+    changes = []
+    unsubscribe = store.subscribe(changes.append)
+
+    store.replace({"app_title": "Yose", "theme_mode": "dark"})
+    store.set(theme_mode="light")
+    assert store.version == 2
+    assert store["theme_mode"] == "light"
+
+    rolled_back = store.rollback(1)
+    assert rolled_back["version"] == 3
+    assert rolled_back["theme_mode"] == "dark"
+    assert rolled_back["app_title"] == "Yose"
+    assert [options["version"] for options in changes] == [1, 2, 3]
+
+    # The rollback can itself be undone.
+    assert store.rollback(2)["theme_mode"] == "light"
+    unsubscribe()
+    store.set(app_title="Other")
+    assert len(changes) == 4
+
+    with pytest.raises(KeyError):
+        store.rollback(42)
+
+
+def test_versions_survive_a_reload(index_dir):
+    store = OptionsStore()
+    store.replace({"app_title": "Yose", "theme_mode": "dark"})
+    store.set(theme_mode="light")
+    store.rollback(1)
+
+    reopened = OptionsStore()
+    assert [options["theme_mode"] for options in reopened.history()] == [
+        "dark",
+        "light",
+        "dark",
+    ]
+    assert reopened.version == 3
+    assert reopened.get()["theme_mode"] == "dark"
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+from whoosh.query import Every
+
+from yose.config.db.Model import IndexItems
+from yose.index_manager import index_manager
+from yose.ranking import RankingEngine
+from yose.utils import add_documents
+
+
+@pytest.fixture
+def documents(index_dir):
+    now = datetime.now()
+    documents = [
+        {
+            "guid": f"doc-{number}",
+            "likes": [3, 50, 0, 7, 1, 20][number],
+            "updated_at": now - timedelta(days=[900, 10, 1, 400, 5000, 60][number]),
+        }
+        for number in range(6)
+    ]
+    # Two segments, the signals of both are read.
+    add_documents(documents[:3])
+    add_documents(documents[3:])
+    return documents
+
+
+def ranked(engine: RankingEngine, limit: int = 10):
+    with index_manager.searcher("documents", IndexItems) as searcher:
+        results = searcher.search(Every(), limit=engine.limit(limit))
+        results = engine.rescore(searcher, results)
+        return [searcher.stored_fields(docnum)["guid"] for _, docnum in results.top_n]
+
+
+def test_without_weights_nothing_is_rescored(documents, index_dir):
+    engine = RankingEngine(path=str(index_dir / "ranking.json"))
+    assert not engine.enabled
+    assert ranked(engine) == [f"doc-{number}" for number in range(6)]
+    assert engine.stats()["rescored"] == 0
+
+
+def test_signals_reorder_the_best_hits(documents, index_dir):
+    engine = RankingEngine(path=str(index_dir / "ranking.json"))
+    engine.configure(weights={"likes": 1.0})
+    assert ranked(engine) == ["doc-1", "doc-5", "doc-3", "doc-0", "doc-4", "doc-2"]
+
+    engine.configure(weights={"likes": 0.0, "updated_at": 1.0})
+    assert ranked(engine) == ["doc-2", "doc-1", "doc-5", "doc-3", "doc-0", "doc-4"]
+
+    # Hits after the first top_n keep their order.
+    engine.configure(top_n=2)
+    assert ranked(engine, limit=6) == [
+        "doc-1",
+        "doc-0",
+        "doc-2",
+        "doc-3",
+        "doc-4",
+        "doc-5",
+    ]
+
+
+def test_settings_are_validated_and_saved(index_dir):
+    path = str(index_dir / "ranking.json")
+    engine = RankingEngine(path=path)
+    with pytest.raises(ValueError):
+        engine.configure(weights={"unknown": 1.0})
+    with pytest.raises(ValueError):
+        engine.configure(top_n=0)
+    engine.configure(weights={"views": 0.5}, field_boosts={"title": 3.0}, top_n=20)
+
+    settings = RankingEngine(path=path).settings()
+    assert settings["weights"]["views"] == 0.5
+    assert settings["field_boosts"]["title"] == 3.0
+    assert settings["top_n"] == 20
@@ -0,0 +1,68 @@
+import asyncio
+
+from yose.scheduler import ProcessScheduler
+
+
+def test_re_adding_a_running_job_does_not_run_it_twice():
+    running = []
+    peak = []
+
+    async def job():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.2)
+        running.pop()
+
+    async def main():
+        scheduler = ProcessScheduler(path=None, tick=0.01)
+        scheduler.start()
+        scheduler.add_once("job", job)
+        await asyncio.sleep(0.05)
+        again = scheduler.add_once("job", job, job_class="other")
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        return again, scheduler
+
+    job_, scheduler = asyncio.run(main())
+    assert peak == [1]
+    assert job_.runs == 1 and job_.state == "done"
+    assert job_.job_class == "other"
+    assert scheduler._running == {"default": 0}
+
+
+def test_periodic_jobs_keep_their_counters_when_redefined():
+    calls = []
+
+    async def main():
+        scheduler = ProcessScheduler(path=None, tick=0.01)
+        scheduler.start()
+        scheduler.add_periodic("job", lambda: calls.append(1), interval=60, delay=0)
+        await asyncio.sleep(0.1)
+        job = scheduler.add_periodic("job", lambda: calls.append(2), interval=30)
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        return job
+
+    job = asyncio.run(main())
+    assert calls == [1]
+    assert job.runs == 1 and job.interval == 30
+
+
+def test_adding_a_waiting_job_again_reschedules_it():
+    calls = []
+
+    async def main():
+        scheduler = ProcessScheduler(path=None, tick=0.01)
+        scheduler.start()
+        scheduler.add_once("job", lambda: calls.append(1), delay=60)
+        job = scheduler.add_once("job", lambda: calls.append(2), delay=0)
+        await asyncio.sleep(0.1)
+        later = scheduler.add_once("job", lambda: calls.append(3), delay=60)
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        return job, later
+
+    job, later = asyncio.run(main())
+    assert calls == [2]
+    assert job.runs == 1
+    assert later.state == "idle" and later.runs == 1
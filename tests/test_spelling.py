@@ -0,0 +1,50 @@
+import pytest
+
+from yose import spelling
+from yose.config.db.Model import LeanIndexItems
+from yose.spelling import SpellingCorrector
+from yose.utils import add_document, add_documents
+
+TITLES = ["search engine", "search results", "image search", "search index"]
+
+
+@pytest.fixture
+def counted(index_dir, monkeypatch):
+    calls = []
+    original = spelling.field_words
+
+    def field_words(searcher, fieldnames):
+        calls.append(searcher.reader().segment().segment_id())
+        return original(searcher, fieldnames)
+
+    monkeypatch.setattr(spelling, "field_words", field_words)
+    return calls
+
+
+def test_only_new_segments_are_read(counted):
+    add_documents(
+        {"guid": f"doc-{number}", "title": title} for number, title in enumerate(TITLES)
+    )
+    corrector = SpellingCorrector(min_frequency=2)
+    assert corrector.refresh()
+    assert corrector.suggest("serch") == "search"
+    assert corrector.suggest("imagee") is None
+    assert len(counted) == 1
+
+    assert not corrector.refresh()
+    add_document({"guid": "doc-new", "title": "image gallery"})
+    assert corrector.refresh()
+    assert len(counted) == 2 and counted[0] != counted[1]
+    assert corrector.suggest("imagee") == "image"
+
+
+def test_suggestions_are_words_not_stems(index_dir):
+    # The lean profile keeps no title column, only its stemmed terms.
+    add_documents(
+        ({"guid": f"doc-{number}", "title": "computer science"} for number in range(3)),
+        indexname="lean",
+        schema=LeanIndexItems,
+    )
+    corrector = SpellingCorrector(indexname="lean", schema=LeanIndexItems)
+    assert corrector.refresh()
+    assert corrector.suggest("computr scence") == "computer science"
@@ -0,0 +1,111 @@
+import asyncio
+import io
+import socket
+
+import httpx
+import pytest
+from PIL import Image
+
+from yose.thumbnails import ThumbnailCache, ThumbnailError
+
+PUBLIC = "http://93.184.216.34/image.png"
+
+
+def png() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (640, 480), "red").save(output, "PNG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ThumbnailCache(path=str(tmp_path / "thumbnails"))
+    yield cache
+    asyncio.run(cache.close())
+
+
+def serve(cache, handler):
+    requested = []
+
+    def record(request):
+        requested.append(str(request.url))
+        return handler(request)
+
+    cache._client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+    return requested
+
+
+def test_signatures(cache):
+    signature = cache.sign(PUBLIC, "tile")
+    assert cache.verify(PUBLIC, "tile", signature)
+    assert not cache.verify(PUBLIC, "large", signature)
+    assert not cache.verify("http://93.184.216.34/other.png", "tile", signature)
+    assert not cache.verify(PUBLIC, "tile", "")
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://127.0.0.1/image.png",
+        "http://[::1]/image.png",
+        "http://10.1.2.3/image.png",
+        "http://192.168.0.1/image.png",
+        "http://169.254.169.254/latest/meta-data",
+        "file:///etc/passwd",
+    ],
+)
+def test_non_public_addresses_are_refused(cache, url):
+    requested = serve(cache, lambda request: httpx.Response(200, content=png()))
+    with pytest.raises(ThumbnailError):
+        asyncio.run(cache.get(url))
+    assert requested == []
+
+
+def test_redirects_to_private_addresses_are_refused(cache):
+    def handler(request):
+        return httpx.Response(302, headers={"location": "http://127.0.0.1/admin"})
+
+    requested = serve(cache, handler)
+    with pytest.raises(ThumbnailError):
+        asyncio.run(cache.get(PUBLIC))
+    assert requested == [PUBLIC]
+
+
+def test_public_image_is_resized_and_cached(cache):
+    requested = serve(
+        cache,
+        lambda request: httpx.Response(
+            200, content=png(), headers={"content-type": "image/png"}
+        ),
+    )
+
+    async def twice():
+        return await cache.get(PUBLIC), await cache.get(PUBLIC)
+
+    (digest, data), (again, _) = asyncio.run(twice())
+    assert digest == again
+    assert Image.open(io.BytesIO(data)).size == (267, 200)
+    assert requested == [PUBLIC]
+
+
+def test_connects_to_the_checked_address(cache, monkeypatch):
+    answers = iter(["93.184.216.34", "127.0.0.1"])
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        # A rebinding host: public on the first lookup, loopback afterwards.
+        address = next(answers)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return httpx.Response(200, content=png(), headers={"content-type": "image/png"})
+
+    cache._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    asyncio.run(cache.get("https://images.example.com/image.png"))
+    (request,) = sent
+    assert request.url.host == "93.184.216.34"
+    assert request.headers["host"] == "images.example.com"
+    assert request.extensions["sni_hostname"] == "images.example.com"
@@ -0,0 +1,85 @@
+import pytest
+
+from yose.config.db.Model import IndexItems
+from yose.index_manager import index_manager
+from yose.utils import (
+    add_documents,
+    delete_documents,
+    search_page,
+    update_documents,
+)
+
+
+def doc_count(indexname: str = "documents") -> int:
+    with index_manager.searcher(indexname, IndexItems) as searcher:
+        return searcher.doc_count()
+
+
+def documents(count: int, title: str = "document", seen=None):
+    for number in range(count):
+        if seen is not None:
+            # The documents committed when this one is read.
+            seen.append(doc_count())
+        yield {"guid": f"doc-{number}", "title": f"{title} {number}"}
+
+
+def test_commits_every_batch(index_dir):
+    seen = []
+    assert add_documents(documents(25, seen=seen), batch_size=10) == 25
+    assert seen[9:12] == [0, 10, 10]
+    assert seen[-1] == 20
+    assert doc_count() == 25
+
+
+def test_failure_keeps_committed_batches(index_dir):
+    def failing():
+        yield from documents(15)
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError):
+        add_documents(failing(), batch_size=10)
+    assert doc_count() == 10
+    # The uncommitted batch was cancelled and the lock released.
+    assert add_documents(documents(1), batch_size=10) == 1
+
+
+def test_update_and_delete(index_dir):
+    add_documents(documents(25), batch_size=10)
+    assert update_documents(documents(25, title="updated"), batch_size=10) == 25
+    with index_manager.searcher("documents", IndexItems) as searcher:
+        titles = [fields["title"] for fields in searcher.all_stored_fields()]
+    assert len(titles) == 25
+    assert all(title.startswith("updated") for title in titles)
+
+    assert delete_documents((f"doc-{n}" for n in range(0, 25, 2)), batch_size=5) == 13
+    assert doc_count() == 12
+
+
+def test_batch_size_must_be_positive(index_dir):
+    with pytest.raises(ValueError):
+        add_documents(documents(1), batch_size=0)
+
+
+def test_search_page_pages(index_dir):
+    add_documents(documents(25), batch_size=10)
+    pages = [search_page("*", page=number, pagelen=10) for number in (1, 2, 3)]
+    assert [page["page"] for page in pages] == [1, 2, 3]
+    assert {page["pagecount"] for page in pages} == {3}
+    assert {page["total"] for page in pages} == {25}
+    assert [len(page["results"]) for page in pages] == [10, 10, 5]
+    titles = [hit["title"] for page in pages for hit in page["results"]]
+    assert len(set(titles)) == 25
+    # Past the end, the last page is returned.
+    assert search_page("*", page=9, pagelen=10)["page"] == 3
+
+
+def test_search_page_returns_the_requested_fields(index_dir):
+    add_documents(
+        [{"guid": "doc", "title": "cat", "host": "example.org", "content": "long"}]
+    )
+    (hit,) = search_page("*")["results"]
+    assert set(hit) == {"title", "host", "score"}
+    (hit,) = search_page("*", fields=["guid"])["results"]
+    assert set(hit) == {"guid", "score"}
+    (hit,) = search_page("*", fields="*")["results"]
+    assert hit["content"] == "long" and hit["guid"] == "doc"
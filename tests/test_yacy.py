@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+
+from yose.yacy import YaCyClient, YaCyError
+
+ANSWER = {"channels": [{"items": [{"title": "cat", "link": "https://example.org"}]}]}
+
+
+def run(client: YaCyClient, handler, coroutine):
+    async def main():
+        # The pooled client of the peer, answering from `handler`.
+        client._client = httpx.AsyncClient(
+            base_url=client.base_url, transport=httpx.MockTransport(handler)
+        )
+        try:
+            return await coroutine()
+        finally:
+            await client.close()
+
+    return asyncio.run(main())
+
+
+def test_server_errors_are_retried():
+    client = YaCyClient(retries=2, backoff=0)
+    statuses = [503, 500, 200]
+
+    def handler(request):
+        status = statuses.pop(0)
+        return httpx.Response(status, json=ANSWER if status == 200 else {})
+
+    items = run(client, handler, lambda: client.search("cats", page=2))
+    assert items == ANSWER["channels"][0]["items"]
+    assert statuses == []
+
+
+def test_errors_are_raised_after_the_retries():
+    client = YaCyClient(retries=2, backoff=0)
+    calls = []
+
+    def unreachable(request):
+        calls.append(request)
+        raise httpx.ConnectError("refused", request=request)
+
+    with pytest.raises(YaCyError):
+        run(client, unreachable, lambda: client.search("cats"))
+    assert len(calls) == 3
+
+
+def test_client_errors_are_not_retried():
+    client = YaCyClient(retries=2, backoff=0)
+    calls = []
+
+    def forbidden(request):
+        calls.append(request)
+        return httpx.Response(403)
+
+    with pytest.raises(YaCyError):
+        run(client, forbidden, lambda: client.search("cats"))
+    assert len(calls) == 1
+
+
+def test_requests_in_flight_are_capped_on_one_client():
+    client = YaCyClient(max_concurrency=2)
+    active, peak, clients = [0], [0], set()
+
+    async def slow(request):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        return httpx.Response(200, json=ANSWER)
+
+    async def searches():
+        async def search(page):
+            clients.add(id(client.client))
+            return await client.search("cats", page=page)
+
+        return await asyncio.gather(*(search(page) for page in range(6)))
+
+    assert len(run(client, slow, searches)) == 6
+    assert peak[0] == 2
+    assert len(clients) == 1